@@ -1,21 +1,81 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, send_file, Response,
+                   stream_with_context, g, has_request_context, jsonify, before_render_template, template_rendered)
+from flask.json.provider import DefaultJSONProvider
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
 from flask_mail import Mail, Message
+from werkzeug.datastructures import CallbackDict
+from werkzeug.middleware.proxy_fix import ProxyFix
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-import qrcode
+import io
 from io import BytesIO
-import base64
-from PIL import Image
 import os
 import json
 import uuid
+import atexit
+import secrets
+import hashlib
+import math
 from datetime import datetime, timedelta
 from functools import wraps
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
 import sqlite3
+import zipfile
+import zlib
+import csv
+import gzip
+import shutil
+import heapq
+import itertools
+import multiprocessing
+import re
+import threading
+import time
+import logging
+import contextvars
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from storage import (ConnectionPool, PooledConnection, Repository, STORAGE_BACKENDS, YOUTH_ID_ORDER,
+                     USER_COLUMNS, INSERT_USER_SQL, archived_years, database_uri, user_row)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Change this to a secure random key in production
+# Stable across workers and restarts: SECRET_KEY, else a key kept in the instance folder (see create_app)
+app.secret_key = os.environ.get('SECRET_KEY')
+
+try:
+    import orjson  # Optional: faster JSON encoding/decoding for the scan APIs
+except ImportError:
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Compact JSON for jsonify() and request.get_json(), using orjson when it is installed"""
+    
+    compact = True
+    sort_keys = False
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)  # orjson.JSONDecodeError is a json.JSONDecodeError
+    
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
+app.json = FastJSONProvider(app)
+
+# Sessions: signed cookies ('cookie') or rows in the database ('sqlite')
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 3600))
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=float(os.environ.get('SESSION_LIFETIME_HOURS', 12)))
 
 # Email configuration
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -25,29 +85,679 @@ app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'ciscoonlinecourse
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'jpje mnxd tfzq qryv')  # Your email password or app password
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', app.config['MAIL_USERNAME'])
 
-mail = Mail(app)
+mail = Mail()  # Bound to the app in create_app()
 
-# Admin credentials (in production, store in database)
-ADMIN_USERNAME = "admin"
-ADMIN_PASSWORD_HASH = generate_password_hash("admin123")  # Default password: admin123
+# Admin accounts live in the admin_accounts table; this one is created on first run
+DEFAULT_ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
+DEFAULT_ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')  # Default password: admin123
+ACCOUNT_ROLES = ('admin', 'scanner')  # Scanner operators authenticate with API tokens only
+TOKEN_SCOPES = ('scan',)
+
+# Login throttling: failed attempts allowed per account / client IP within the window (seconds)
+LOGIN_WINDOW_SECONDS = int(os.environ.get('LOGIN_WINDOW_SECONDS', 900))
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.environ.get('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 20))
+# Number of reverse proxies in front of the app, so the client IP comes from X-Forwarded-For
+PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
 
 # Directory for storing generated QR codes and user data
-QR_STORAGE_DIR = "static/qr_codes"
-DATABASE = "yep_id.db"
-os.makedirs(QR_STORAGE_DIR, exist_ok=True)
+QR_STORAGE_DIR = os.environ.get('QR_STORAGE_DIR', "static/qr_codes")
+# Let the front proxy send QR files: '' (Flask sends them), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+QR_OFFLOAD = os.environ.get('QR_OFFLOAD', '').lower()
+QR_OFFLOAD_PREFIX = os.environ.get('QR_OFFLOAD_PREFIX', '/protected/qr_codes/')  # nginx internal location for QR_STORAGE_DIR
+QR_CACHE_SECONDS = int(os.environ.get('QR_CACHE_SECONDS', 365 * 24 * 3600))  # For versioned QR URLs
+DATABASE = os.environ.get('DATABASE_PATH', "yep_id.db")
+# 'sqlite' (the DATABASE file) or 'memory' (an in-memory database named after it, for tests)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}")
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # Idle connections kept per process
+DB_POOL_LIMIT = int(os.environ.get('DB_POOL_LIMIT', 64))  # Databases kept pooled; the least recently used are closed
+
+# Multiple barangays: with TENANT_MODE 'path' (/<slug>/...) or 'subdomain' (<slug>.TENANT_BASE_DOMAIN)
+# each barangay is served from TENANTS_DIR/<slug>/ (its own database, QR codes and backups).
+# Requests that name no tenant use DATABASE and QR_STORAGE_DIR as before.
+TENANT_MODE = os.environ.get('TENANT_MODE', '').lower()
+if TENANT_MODE not in ('', 'path', 'subdomain'):
+    raise ValueError("TENANT_MODE must be '', 'path' or 'subdomain'")
+TENANTS_DIR = os.environ.get('TENANTS_DIR', 'tenants')
+TENANT_BASE_DOMAIN = os.environ.get('TENANT_BASE_DOMAIN', '').lower()
+TENANT_QR_OFFLOAD_PREFIX = os.environ.get('TENANT_QR_OFFLOAD_PREFIX', '/protected/tenants/')  # nginx internal location for TENANTS_DIR
+TENANT_REPORT_WORKERS = int(os.environ.get('TENANT_REPORT_WORKERS', 4))
+TENANT_SLUG_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+# Outside a request (CLI commands, background jobs, reports) the tenant comes from here; TENANT=<slug> for the CLI
+_current_tenant = contextvars.ContextVar('tenant', default=os.environ.get('TENANT') or None)
+
+def current_tenant():
+    """Slug of the barangay being served, or None for the main database"""
+    if has_request_context():
+        return request.environ.get('yepid.tenant')
+    return _current_tenant.get()
+
+@contextmanager
+def tenant_context(slug):
+    """Work on a tenant's data outside a request"""
+    token = _current_tenant.set(slug)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+def tenant_dir(slug):
+    return os.path.join(TENANTS_DIR, slug)
+
+def database_path():
+    """Database file of the current tenant"""
+    tenant = current_tenant()
+    return os.path.join(tenant_dir(tenant), 'yep_id.db') if tenant else DATABASE
+
+def qr_storage_dir():
+    """QR code directory of the current tenant"""
+    tenant = current_tenant()
+    return os.path.join(tenant_dir(tenant), 'qr_codes') if tenant else QR_STORAGE_DIR
+
+def tenant_exists(slug):
+    return bool(TENANT_SLUG_PATTERN.match(slug)) and os.path.isfile(os.path.join(tenant_dir(slug), 'yep_id.db'))
+
+def list_tenants():
+    """Slugs of every tenant in TENANTS_DIR"""
+    try:
+        return sorted(slug for slug in os.listdir(TENANTS_DIR) if tenant_exists(slug))
+    except FileNotFoundError:
+        return []
+
+# Bulk exports with at least this many events render their workbooks in parallel
+EXPORT_PARALLEL_THRESHOLD = int(os.environ.get('EXPORT_PARALLEL_THRESHOLD', 20))
+
+# Bulk roster imports insert this many rows per transaction
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+
+# Background jobs (QR rendering, welcome emails)
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='yepid-bg')
+_background_lock = threading.Lock()
+_background_pending = 0
+_background_pending_tenants = Counter()  # Tenant slug (None for the main database) -> queued or running jobs
+_background_job_seconds = 0.5  # Moving average of job run time, used to estimate Retry-After
+
+def submit_background_job(func, *args, **kwargs):
+    """Queue func to run on the background worker pool inside an app context (and the caller's tenant)"""
+    global _background_pending
+    tenant = current_tenant()
+    with _background_lock:
+        _background_pending += 1
+        _background_pending_tenants[tenant] += 1
+    metric_set('yepid_background_queue_depth', _background_pending)
+    
+    def run():
+        global _background_pending, _background_job_seconds
+        start = time.perf_counter()
+        try:
+            with app.app_context(), tenant_context(tenant):
+                func(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in background job {func.__name__}: {e}")
+        finally:
+            with _background_lock:
+                _background_pending -= 1
+                _background_pending_tenants[tenant] -= 1
+                if not _background_pending_tenants[tenant]:
+                    del _background_pending_tenants[tenant]
+                _background_job_seconds = 0.9 * _background_job_seconds + 0.1 * (time.perf_counter() - start)
+            metric_set('yepid_background_queue_depth', _background_pending)
+    
+    return background_executor.submit(run)
+
+def pending_background_jobs():
+    """Number of queued or running background jobs"""
+    return _background_pending
+
+def background_job_seconds():
+    """Recent average run time of a background job"""
+    return _background_job_seconds
+
+# How long shutdown waits for queued emails/QR codes before giving up (seconds)
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 30))
+
+def drain_background_jobs(timeout=None):
+    """Let queued background jobs finish, then stop the pool; returns how many were left unfinished"""
+    deadline = time.monotonic() + (SHUTDOWN_DRAIN_TIMEOUT if timeout is None else timeout)
+    while pending_background_jobs() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    
+    remaining = pending_background_jobs()
+    if remaining:
+        print(f"Warning: shutting down with {remaining} background job(s) unfinished")
+    background_executor.shutdown(wait=False, cancel_futures=True)
+    metric_set('yepid_background_queue_depth', 0)  # Don't leave this worker's backlog in /metrics
+    flush_metrics()
+    return remaining
+
+# CPU-heavy work (decoding uploaded QR photos, rendering large exports) runs on one process
+# pool per worker, created on first use and shared by every request. Its processes start from
+# a forkserver (spawn where there is none), never forked from this multi-threaded worker.
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', min(4, os.cpu_count() or 2)))
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def process_pool():
+    """The shared ProcessPoolExecutor (replaced if a crashed process broke it)"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None or getattr(_process_pool, '_broken', False):
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS, mp_context=context)
+        return _process_pool
+
+def shutdown_process_pool():
+    """Stop the shared process pool, cancelling work that hasn't started"""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Request instrumentation
+# Statements slower than this (milliseconds) go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')  # Optional log file path
+# Opt-in, and even then only sent to logged-in admins: timings tell outsiders how hard a page hits the database
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'false').lower() in ['true', 'on', '1']
+
+slow_query_logger = logging.getLogger('yepid.slow_sql')
+if SLOW_QUERY_LOG:
+    _slow_query_handler = logging.FileHandler(SLOW_QUERY_LOG)
+    _slow_query_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(_slow_query_handler)
+
+_metrics_lock = threading.Lock()
+route_metrics = {}  # endpoint -> aggregated timings
+recent_slow_queries = deque(maxlen=100)
+
+def _parameter_shape(parameters):
+    """Describe bound parameters by type only, so logs never contain user data"""
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+    types = [type(v).__name__ for v in parameters]
+    if len(types) > 8 and len(set(types)) == 1:
+        return f'({len(types)} x {types[0]})'
+    return '(' + ', '.join(types) + ')'
+
+def _record_sql(elapsed, statements=1):
+    """Add statement time to the current request's totals"""
+    if has_request_context() and 'request_metrics' in g:
+        g.request_metrics['sql_count'] += statements
+        g.request_metrics['sql_time'] += elapsed
+
+def _log_slow_query(sql, shape, elapsed):
+    entry = {
+        'sql': ' '.join(sql.split())[:500],
+        'params': shape,
+        'ms': round(elapsed * 1000, 2),
+        'endpoint': request.endpoint if has_request_context() else None,
+        'at': datetime.now().isoformat()
+    }
+    with _metrics_lock:
+        recent_slow_queries.append(entry)
+    slow_query_logger.warning(f"slow query {entry['ms']}ms [{entry['endpoint']}] {entry['sql']} params={shape}")
+
+def _is_write_statement(sql):
+    head = sql.lstrip()[:16].upper()
+    return head.startswith(('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'BEGIN IMMEDIATE', 'BEGIN EXCLUSIVE'))
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports statement and fetch times to the request metrics"""
+    _sql = None
+    _shape = None
+    _elapsed = 0.0
+    _logged_slow = False
+    
+    def _track(self, elapsed, statements):
+        self._elapsed += elapsed
+        _record_sql(elapsed, statements)
+        if not self._logged_slow and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            self._logged_slow = True
+            _log_slow_query(self._sql, self._shape, self._elapsed)
+    
+    def execute(self, sql, parameters=()):
+        self._sql, self._shape = sql, _parameter_shape(parameters)
+        self._elapsed, self._logged_slow = 0.0, False
+        # A write outside a transaction (or BEGIN IMMEDIATE) has to take the write lock first
+        takes_write_lock = not self.connection.in_transaction and _is_write_statement(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                metric_inc('yepid_db_locked_total')
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._track(elapsed, 1)
+            if takes_write_lock:
+                metric_observe('yepid_db_write_lock_seconds', elapsed)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._shape = sql, 'executemany'
+        self._elapsed, self._logged_slow = 0.0, False
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._track(time.perf_counter() - start, 1)
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._track(time.perf_counter() - start, 0)
+    
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            self._track(time.perf_counter() - start, 0)
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._track(time.perf_counter() - start, 0)
+
+class InstrumentedConnection(PooledConnection):
+    """Connection whose cursors (including conn.execute shortcuts) are instrumented"""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                metric_inc('yepid_db_locked_total')
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _record_sql(elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                _log_slow_query('COMMIT', '()', elapsed)
+
+@app.before_request
+def _start_request_metrics():
+    g.request_metrics = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'template_time': 0.0}
+    g.template_starts = []
+
+def _template_started(sender, template, context, **extra):
+    if has_request_context() and 'template_starts' in g:
+        g.template_starts.append(time.perf_counter())
+
+def _template_finished(sender, template, context, **extra):
+    if has_request_context() and g.get('template_starts'):
+        g.request_metrics['template_time'] += time.perf_counter() - g.template_starts.pop()
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_finished, app)
+
+@app.after_request
+def _finish_request_metrics(response):
+    metrics = g.get('request_metrics')
+    if metrics is None:
+        return response
+    total = time.perf_counter() - metrics['start']
+    
+    if SERVER_TIMING_HEADER and 'logged_in' in session:
+        response.headers['Server-Timing'] = (
+            f"app;dur={total * 1000:.2f}, "
+            f"db;dur={metrics['sql_time'] * 1000:.2f};desc=\"{metrics['sql_count']} queries\", "
+            f"tpl;dur={metrics['template_time'] * 1000:.2f}"
+        )
+    
+    endpoint = request.endpoint or 'unmatched'
+    with _metrics_lock:
+        stats = route_metrics.setdefault(endpoint, {
+            'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'sql_count': 0, 'sql_ms': 0.0, 'template_ms': 0.0
+        })
+        stats['requests'] += 1
+        stats['total_ms'] += total * 1000
+        stats['max_ms'] = max(stats['max_ms'], total * 1000)
+        stats['sql_count'] += metrics['sql_count']
+        stats['sql_ms'] += metrics['sql_time'] * 1000
+        stats['template_ms'] += metrics['template_time'] * 1000
+    return response
+
+# Prometheus metrics
+# Each worker process writes its values to METRICS_DIR; /metrics sums the files of all workers
+METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics_data')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+# Bearer token required by /metrics; without one, only direct requests from this host may scrape
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 5.0))
+# Write-ahead logging lets readers keep going while a check-in is being written
+SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() in ['true', 'on', '1']
+
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_DEFINITIONS = {
+    'yepid_checkins_total': ('counter', 'Attendance check-ins recorded'),
+    'yepid_scan_rejections_total': ('counter', 'Attendance scans rejected, by reason'),
+    'yepid_email_send_seconds': ('histogram', 'Time spent sending an email'),
+    'yepid_email_failures_total': ('counter', 'Emails that failed to send'),
+    'yepid_qr_render_seconds': ('histogram', 'Time spent rendering a QR code'),
+    'yepid_db_write_lock_seconds': ('histogram', 'Time to acquire the SQLite write lock, including busy waits'),
+    'yepid_db_locked_total': ('counter', 'Statements that failed with "database is locked"'),
+    'yepid_login_throttled_total': ('counter', 'Login attempts refused by throttling before password hashing'),
+    'yepid_rate_limited_total': ('counter', 'Requests refused by rate limits (reason=rate) or backpressure (reason=backpressure)'),
+    'yepid_background_queue_depth': ('gauge', 'Queued or running background jobs (emails, QR codes)'),
+    'yepid_backup_seconds': ('histogram', 'Time taken by a database backup'),
+    'yepid_read_connections_total': ('counter', 'Reporting connections, by target (primary or snapshot)'),
+}
+
+_metric_values = {}  # (name, labels) -> counter value or histogram dict
+_metric_state = {'dirty': False, 'last_flush': 0.0, 'flusher': None}
+_metric_lock = threading.Lock()
+
+def metric_inc(name, amount=1, **labels):
+    """Increment a counter"""
+    key = (name, tuple(sorted(labels.items())))
+    with _metric_lock:
+        _metric_values[key] = _metric_values.get(key, 0) + amount
+        _metric_state['dirty'] = True
+    _maybe_flush_metrics()
+
+def metric_set(name, value, **labels):
+    """Set a gauge; /metrics adds up the values of all workers"""
+    key = (name, tuple(sorted(labels.items())))
+    with _metric_lock:
+        _metric_values[key] = value
+        _metric_state['dirty'] = True
+    _maybe_flush_metrics()
+
+def metric_observe(name, value, **labels):
+    """Record a histogram observation (in seconds)"""
+    key = (name, tuple(sorted(labels.items())))
+    with _metric_lock:
+        hist = _metric_values.get(key)
+        if hist is None:
+            hist = _metric_values[key] = {'buckets': [0] * len(HISTOGRAM_BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+                hist['buckets'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+        _metric_state['dirty'] = True
+    _maybe_flush_metrics()
+
+def clear_metrics():
+    """Forget this process's metric values: a worker forked from a preloaded master must not
+    report (and so add up once per worker) what the master counted during startup"""
+    with _metric_lock:
+        _metric_values.clear()
+        _metric_state['dirty'] = False
+
+def _metrics_file(pid=None):
+    return os.path.join(METRICS_DIR, f"metrics_{pid or os.getpid()}.json")
+
+# Counters and histograms of workers that have exited (their gauges are dropped)
+METRICS_EXITED_FILE = 'metrics_exited.json'
+
+def reset_metrics_dir():
+    """Remove every metrics file, so a new server run counts from zero (call before workers start)"""
+    try:
+        filenames = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        if filename.startswith('metrics_'):
+            try:
+                os.remove(os.path.join(METRICS_DIR, filename))
+            except FileNotFoundError:
+                pass
+
+def _add_samples(totals, samples):
+    for sample in samples:
+        key = (sample['name'], tuple(sorted(sample['labels'].items())))
+        value = sample['value']
+        if isinstance(value, dict):
+            hist = totals.setdefault(key, {'buckets': [0] * len(HISTOGRAM_BUCKETS), 'sum': 0.0, 'count': 0})
+            hist['buckets'] = [a + b for a, b in zip(hist['buckets'], value['buckets'])]
+            hist['sum'] += value['sum']
+            hist['count'] += value['count']
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def _read_samples(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []  # Missing, or being replaced
+
+def retire_metrics_file(pid):
+    """Fold an exited worker's counters and histograms into METRICS_EXITED_FILE and remove its file.
+    
+    Its gauges described a process that is gone, so they are dropped; a new worker that gets
+    the same PID starts a fresh file. Called by the server master (gunicorn's child_exit).
+    """
+    path = _metrics_file(pid)
+    if not os.path.exists(path):
+        return
+    exited_path = os.path.join(METRICS_DIR, METRICS_EXITED_FILE)
+    totals = {}
+    _add_samples(totals, _read_samples(exited_path))
+    _add_samples(totals, [sample for sample in _read_samples(path)
+                          if METRIC_DEFINITIONS.get(sample['name'], ('gauge',))[0] != 'gauge'])
+    try:
+        with open(f'{exited_path}.tmp', 'w') as f:
+            json.dump([{'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in totals.items()], f)
+        os.replace(f'{exited_path}.tmp', exited_path)
+        for leftover in (path, f'{path}.tmp'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    except OSError as e:
+        print(f"Error retiring metrics of worker {pid}: {e}")
+
+def flush_metrics():
+    """Write this process's metric values to its file in METRICS_DIR"""
+    with _metric_lock:
+        payload = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in _metric_values.items()
+        ]
+        _metric_state['dirty'] = False
+        _metric_state['last_flush'] = time.monotonic()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = _metrics_file() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, _metrics_file())
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
+
+def _metrics_flusher():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _metric_state['dirty']:
+            flush_metrics()
+
+def _maybe_flush_metrics():
+    # Start the flusher lazily so it runs in the worker process, not a pre-fork parent
+    flusher = _metric_state['flusher']
+    if flusher is None or flusher[0] != os.getpid():
+        thread = threading.Thread(target=_metrics_flusher, name='yepid-metrics', daemon=True)
+        _metric_state['flusher'] = (os.getpid(), thread)
+        thread.start()
+    if time.monotonic() - _metric_state['last_flush'] >= METRICS_FLUSH_INTERVAL:
+        flush_metrics()
+
+def _format_labels(labels, extra=None):
+    items = sorted(labels.items()) + (extra or [])
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+def render_metrics():
+    """Aggregate every worker's metrics file into the Prometheus text format"""
+    flush_metrics()
+    totals = {}
+    try:
+        filenames = [f for f in os.listdir(METRICS_DIR) if f.startswith('metrics_') and f.endswith('.json')]
+    except FileNotFoundError:
+        filenames = []
+    
+    for filename in filenames:
+        _add_samples(totals, _read_samples(os.path.join(METRICS_DIR, filename)))
+    
+    lines = []
+    for name, (metric_type, help_text) in METRIC_DEFINITIONS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (sample_name, labels), value in sorted(totals.items()):
+            if sample_name != name:
+                continue
+            labels = dict(labels)
+            if metric_type == 'histogram':
+                for bound, count in zip(HISTOGRAM_BUCKETS, value['buckets']):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
 
 # SQLite Database Functions
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
+# Reporting reads: analytics, search, leaderboard and exports use read-only connections
+# (query_only, so a report can never take the write lock check-ins wait for). With
+# REPORTING_READS=snapshot, endpoints that accept stale data read a local copy of the
+# database instead, refreshed in the background; 'off' uses ordinary connections.
+REPORTING_READS = os.environ.get('REPORTING_READS', 'primary')
+REPORTING_SNAPSHOT_PATH = os.environ.get('REPORTING_SNAPSHOT_PATH', f'{DATABASE}.reporting')  # Tenants: next to their database
+REPORTING_SNAPSHOT_MAX_AGE = float(os.environ.get('REPORTING_SNAPSHOT_MAX_AGE', 60))  # Refresh when older (seconds)
+# Seconds of staleness each endpoint accepts from the snapshot; others read the live database
+READ_STALENESS_POLICIES = {
+    'dashboard': 120,
+    'analytics': 300,
+    'demographics_report': 300,
+    'events_analytics': 300,
+    'leaderboard': 120,
+}
+# Override from the environment as JSON, e.g. READ_STALENESS='{"leaderboard": 0}'
+READ_STALENESS_POLICIES.update(json.loads(os.environ.get('READ_STALENESS', '{}')))
+_snapshot_state = {'refreshing': set()}  # Snapshot paths being refreshed
+_snapshot_lock = threading.Lock()
+
+_db_pools = OrderedDict()  # (database path, read_only) -> ConnectionPool, least recently used first
+_db_pools_lock = threading.Lock()
+
+def _open_db(path, read_only=False, backend='sqlite'):
+    conn = sqlite3.connect(database_uri(path, backend, read_only), uri=True, timeout=DB_BUSY_TIMEOUT,
+                           factory=InstrumentedConnection, check_same_thread=False)
+    if read_only:
+        conn.execute('PRAGMA query_only = ON')
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_db(path=None, read_only=False):
+    """Get database connection; close() returns it to the pool.
+    
+    read_only: opened with mode=ro and query_only. path: another database file (a snapshot
+    or backup), opened without pooling.
+    """
+    if path is not None:
+        return _open_db(path, read_only)
+    key = (database_path(), read_only)
+    with _db_pools_lock:
+        pool = _db_pools.get(key)
+        if pool is not None:
+            _db_pools.move_to_end(key)
+        else:
+            pool = _db_pools[key] = ConnectionPool(
+                lambda: _open_db(key[0], read_only, STORAGE_BACKEND), size=DB_POOL_SIZE,
+                keep_alive=STORAGE_BACKEND == 'memory' and not read_only)
+            # Closing an in-memory database's pool would drop its data, so those are never evicted
+            while len(_db_pools) > DB_POOL_LIMIT and STORAGE_BACKEND != 'memory':
+                _, evicted = _db_pools.popitem(last=False)
+                evicted.close()
+    return pool.acquire()
+
+def reporting_snapshot_path():
+    tenant = current_tenant()
+    return f'{database_path()}.reporting' if tenant else REPORTING_SNAPSHOT_PATH
+
+def reporting_snapshot_age():
+    """Seconds since the reporting snapshot was written, or None if there isn't one"""
+    try:
+        return time.time() - os.path.getmtime(reporting_snapshot_path())
+    except OSError:
+        return None
+
+def refresh_reporting_snapshot():
+    """Copy the database to its reporting snapshot with the online backup API"""
+    snapshot_path = reporting_snapshot_path()
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    try:
+        source = get_db()
+        dest = sqlite3.connect(tmp_path)
+        try:
+            _copy_database(source, dest)
+            dest.execute('PRAGMA journal_mode=DELETE')  # Readers open it read-only, with no -wal to find
+        finally:
+            dest.close()
+            source.close()
+        os.replace(tmp_path, snapshot_path)  # Open readers keep the copy they started on
+    except Exception as e:
+        print(f"Error refreshing reporting snapshot: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finally:
+        with _snapshot_lock:
+            _snapshot_state['refreshing'].discard(snapshot_path)
+
+def _schedule_snapshot_refresh():
+    snapshot_path = reporting_snapshot_path()
+    with _snapshot_lock:
+        if snapshot_path in _snapshot_state['refreshing']:
+            return
+        _snapshot_state['refreshing'].add(snapshot_path)
+    submit_background_job(refresh_reporting_snapshot)
+
+def get_read_db():
+    """Connection for reporting queries, routed by the endpoint's READ_STALENESS_POLICIES entry"""
+    if REPORTING_READS == 'off':
+        return get_db()
+    staleness = READ_STALENESS_POLICIES.get(request.endpoint, 0) if has_request_context() else 0
+    if REPORTING_READS == 'snapshot' and staleness > 0:
+        age = reporting_snapshot_age()
+        if age is None or age > REPORTING_SNAPSHOT_MAX_AGE:
+            _schedule_snapshot_refresh()
+        if age is not None and age <= staleness:
+            metric_inc('yepid_read_connections_total', target='snapshot')
+            return get_db(reporting_snapshot_path(), read_only=True)
+    metric_inc('yepid_read_connections_total', target='primary')
+    return get_db(read_only=True)
+
 def init_db():
     """Initialize database with tables"""
     conn = get_db()
     cursor = conn.cursor()
     
+    if SQLITE_WAL:
+        cursor.execute('PRAGMA journal_mode=WAL')  # Persistent; applies to every later connection
+    
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -221,10 +931,159 @@ def init_db():
     ''')
     
     # Create indexes for better performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event ON attendance(event_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_user ON attendance(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_year ON attendance(event_year)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
+    # (benchmarks/query_plans.py checks that the hot queries keep using them)
+    for old_index in ('idx_attendance_event', 'idx_attendance_user', 'idx_attendance_year',
+                      'idx_attendance_user_points', 'idx_attendance_year_user'):
+        cursor.execute(f'DROP INDEX IF EXISTS {old_index}')  # Superseded by the composite indexes below
+    # Event attendance lists in scan order
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event_date ON attendance(event_id, attendance_date)')
+    # Covering indexes for the all-time and per-year leaderboards (event_id for the live_attendance filter)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_user_points_event ON attendance(user_id, points_earned, event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_year_user_event ON attendance(event_year, user_id, points_earned, event_id)')
+    # Most recent attendance first (search, trends)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(attendance_date)')
+    # One check-in per user per event
+    try:
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_event_user ON attendance(event_id, user_id)')
+    except sqlite3.IntegrityError:
+        print("Warning: some users have duplicate attendance for the same event; "
+              "remove them to enforce one check-in per event.")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event_user_nonunique ON attendance(event_id, user_id)')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_date ON events(event_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_year_date ON events(event_year, event_date, event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_year_created ON events(event_year, created_date)')  # Events list order
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registration_date ON users(registration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_id ON users(id)')
+    # Registered persons are listed in Youth ID order; must match storage.USERS_IN_ID_ORDER
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_users_youth_order ON users({YOUTH_ID_ORDER}, registration_date)')
+    # Highest Youth ID number (storage.next_youth_number)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_youth_number ON users(CAST(SUBSTR(id, 6) AS INTEGER)) WHERE id LIKE 'Youth%'")
+    
+    # Case-insensitive unique emails so duplicate checks are an index probe.
+    # (The UNIQUE constraint on email already indexes the raw column.)
+    cursor.execute('DROP INDEX IF EXISTS idx_users_email')
+    try:
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_lower ON users(LOWER(email))')
+    except sqlite3.IntegrityError:
+        print("Warning: some registered emails differ only by letter case; "
+              "merge them to enforce case-insensitive uniqueness.")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email_lower_nonunique ON users(LOWER(email))')
+    
+    # Soft delete: a deleted user or event is flagged at once and purged in the background
+    # (purge_deleted_records). Read paths use the live_* views, which hide flagged rows and
+    # the attendance that belongs to them.
+    for table in ('users', 'events'):
+        try:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN deleted_at TEXT')
+        except sqlite3.OperationalError:
+            pass
+    # Only flagged rows are indexed, so the live_* filters read a near-empty index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_deleted ON users(deleted_at, user_id) WHERE deleted_at IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_deleted ON events(deleted_at, event_id) WHERE deleted_at IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_event ON notifications(event_id)')
+    cursor.execute('CREATE VIEW IF NOT EXISTS live_users AS SELECT * FROM users WHERE deleted_at IS NULL')
+    cursor.execute('CREATE VIEW IF NOT EXISTS live_events AS SELECT * FROM events WHERE deleted_at IS NULL')
+    cursor.execute(f'CREATE VIEW IF NOT EXISTS live_attendance AS SELECT * FROM attendance WHERE {LIVE_ROWS}')
+    
+    # Archived years (archive_attendance_year) and their per-user / per-event totals
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_archives (
+            event_year TEXT PRIMARY KEY,
+            started_date TEXT NOT NULL,
+            completed_date TEXT,
+            row_count INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_rollup_users (
+            event_year TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            events_attended INTEGER NOT NULL,
+            total_points INTEGER NOT NULL,
+            PRIMARY KEY (event_year, user_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_rollup_events (
+            event_id TEXT PRIMARY KEY,
+            event_year TEXT NOT NULL,
+            attendance_count INTEGER NOT NULL,
+            total_points INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_users_user ON attendance_rollup_users(user_id, total_points, events_attended)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_events_year ON attendance_rollup_events(event_year)')
+    # Every year's attendance; recreated with one arm per archive by rebuild_attendance_views
+    cursor.execute(f'CREATE VIEW IF NOT EXISTS attendance_history AS SELECT {ATTENDANCE_FIELDS} FROM live_attendance')
+    
+    # Admin and scanner-operator accounts
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_accounts (
+            username TEXT PRIMARY KEY COLLATE NOCASE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'admin',
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_date TEXT NOT NULL,
+            last_login TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            token_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL COLLATE NOCASE,
+            token_hash TEXT NOT NULL UNIQUE,
+            label TEXT,
+            scopes TEXT NOT NULL,
+            created_date TEXT NOT NULL,
+            last_used REAL,
+            revoked INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (username) REFERENCES admin_accounts(username)
+        )
+    ''')
+    # Failed logins per 'ip:<addr>' / 'user:<name>' key, shared by all workers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            throttle_key TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            window_start REAL NOT NULL
+        )
+    ''')
+    cursor.execute('SELECT COUNT(*) FROM admin_accounts')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT OR IGNORE INTO admin_accounts (username, password_hash, role, created_date)
+            VALUES (?, ?, 'admin', ?)
+        ''', (DEFAULT_ADMIN_USERNAME, generate_password_hash(DEFAULT_ADMIN_PASSWORD), datetime.now().isoformat()))
+    
+    # Shared token buckets (RATE_LIMIT_BACKEND=sqlite)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
+    # Server-side sessions (SESSION_BACKEND=sqlite)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)')
+    
+    # Which QR files exist on disk (path is relative to QR_STORAGE_DIR)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS qr_files (
+            user_id TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            created_date TEXT NOT NULL
+        )
+    ''')
     
     conn.commit()
     conn.close()
@@ -245,41 +1104,10 @@ def migrate_json_to_db():
         try:
             with open("users_data.json", 'r') as f:
                 users = json.load(f)
-                for user in users:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO users 
-                        (user_id, id, name, street, zone, sex, birthdate, email, phone, 
-                         civil_status, youth_age_group, youth_classification, specific_needs_type,
-                         educational_background, educational_background_other, work_status, work_status_other,
-                         sk_voter_registered, sk_voted_last_election, national_voter_registered, attended_kk_assembly,
-                         kk_assembly_times, kk_assembly_no_reason, registration_date)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        user.get('user_id'),
-                        user.get('id', ''),
-                        user.get('name', ''),
-                        user.get('street', ''),
-                        user.get('zone', ''),
-                        user.get('sex', ''),
-                        user.get('birthdate', ''),
-                        user.get('email', ''),
-                        user.get('phone', ''),
-                        user.get('civil_status', ''),
-                        user.get('youth_age_group', ''),
-                        user.get('youth_classification', ''),
-                        user.get('specific_needs_type', ''),
-                        user.get('educational_background', ''),
-                        user.get('educational_background_other', ''),
-                        user.get('work_status', ''),
-                        user.get('work_status_other', ''),
-                        user.get('sk_voter_registered', ''),
-                        user.get('sk_voted_last_election', ''),
-                        user.get('national_voter_registered', ''),
-                        user.get('attended_kk_assembly', ''),
-                        user.get('kk_assembly_times', ''),
-                        user.get('kk_assembly_no_reason', ''),
-                        user.get('registration_date', datetime.now().isoformat())
-                    ))
+                cursor.executemany(
+                    INSERT_USER_SQL.replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1),
+                    (user_row(user) for user in users)
+                )
         except Exception as e:
             print(f"Error migrating users: {e}")
     
@@ -330,102 +1158,404 @@ def migrate_json_to_db():
     conn.commit()
     conn.close()
 
-# Initialize database on startup
-init_db()
-migrate_json_to_db()
+# Rate limiting: token buckets per endpoint. capacity = burst size, per_minute = refill rate,
+# key = who shares a bucket ('ip', 'client' = API token/admin user/IP, or 'global')
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # 'memory' (per worker) or 'sqlite' (shared)
+RATE_LIMIT_POLICIES = {
+    'consent': {'capacity': 30, 'per_minute': 30, 'key': 'ip', 'methods': ('POST',)},
+    'register': {'capacity': 20, 'per_minute': 20, 'key': 'ip', 'methods': ('POST',), 'backpressure': True},
+    'login': {'capacity': 10, 'per_minute': 10, 'key': 'ip', 'methods': ('POST',)},
+    'bulk_import': {'capacity': 3, 'per_minute': 2, 'key': 'client', 'methods': ('POST',), 'backpressure': True},
+    'process_attendance_scan': {'capacity': 60, 'per_minute': 600, 'key': 'client', 'methods': ('POST',)},
+    'process_scan': {'capacity': 60, 'per_minute': 600, 'key': 'client', 'methods': ('POST',)},
+    'upload_attendance_images': {'capacity': 5, 'per_minute': 5, 'key': 'client', 'methods': ('POST',)},
+}
+# Override from the environment as JSON, e.g. RATE_LIMITS='{"register": {"capacity": 50, "per_minute": 60}}'
+for _endpoint, _overrides in json.loads(os.environ.get('RATE_LIMITS', '{}')).items():
+    RATE_LIMIT_POLICIES.setdefault(_endpoint, {'key': 'ip', 'methods': ('POST',)}).update(_overrides)
+
+# Backpressure: refuse new work that queues emails/QR codes while this many jobs are pending
+BACKPRESSURE_QUEUE_LIMIT = int(os.environ.get('BACKPRESSURE_QUEUE_LIMIT', 200))
+
+class TokenBucketLimiter:
+    """In-process token buckets; each worker keeps its own"""
+    
+    def __init__(self, max_buckets=10000):
+        self._buckets = {}  # key -> (tokens, updated_at, time the bucket is full again)
+        self._lock = threading.Lock()
+        self._max_buckets = max_buckets
+    
+    def acquire(self, key, capacity, per_second):
+        """Take one token; returns seconds to wait, or 0 if allowed"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated_at) * per_second)
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            tokens = tokens - 1 if tokens >= 1 else tokens
+            # Each bucket keeps its own policy's refill time, so pruning never resets a stricter limit early
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / per_second)
+            if len(self._buckets) > self._max_buckets:
+                self._prune(now)
+        return wait
+    
+    def _prune(self, now):
+        # Buckets that are full again carry no state worth keeping
+        for key in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        # Still too many (a flood of new keys): drop the ones closest to full, down to 90%
+        excess = len(self._buckets) - self._max_buckets * 9 // 10
+        if excess > 0:
+            for key in heapq.nsmallest(excess, self._buckets, key=lambda k: self._buckets[k][2]):
+                del self._buckets[key]
+
+class SqliteTokenBucketLimiter:
+    """Token buckets in the database, shared by every worker (one small write per limited request)"""
+    
+    _last_prune = {}  # Database path -> last prune time
+    
+    def acquire(self, key, capacity, per_second):
+        now = time.time()
+        conn = get_db()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE bucket_key = ?', (key,)).fetchone()
+            tokens = min(capacity, row['tokens'] + (now - row['updated_at']) * per_second) if row else capacity
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens - 1 if tokens >= 1 else tokens, now))
+            if now - self._last_prune.get(database_path(), 0) > 600:
+                self._last_prune[database_path()] = now
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - 3600,))
+            conn.commit()
+        finally:
+            conn.close()
+        return wait
+
+rate_limiter = SqliteTokenBucketLimiter() if RATE_LIMIT_BACKEND == 'sqlite' else TokenBucketLimiter()
+
+def _client_key(policy):
+    if policy['key'] == 'global':
+        return 'global'
+    if policy['key'] == 'client':
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            return f"token:{_hash_token(auth[len('Bearer '):].strip())[:16]}"
+        if session.get('username'):
+            return f"user:{session['username']}"
+    return f"ip:{request.remote_addr}"
+
+def _rate_limit_key(policy):
+    # Every tenant has its own buckets, 'global' included
+    tenant = current_tenant()
+    return f"{tenant}/{_client_key(policy)}" if tenant else _client_key(policy)
+
+def backpressure_retry_after():
+    """Seconds to wait for the background backlog to drain below the limit, or 0 if it is below"""
+    # With tenants each barangay is shed on its own backlog, so one import can't block everyone's emails
+    pending = _background_pending_tenants[current_tenant()] if TENANT_MODE else pending_background_jobs()
+    if pending < BACKPRESSURE_QUEUE_LIMIT:
+        return 0
+    # Time for the workers to work through the excess at the recent job speed
+    excess = pending - BACKPRESSURE_QUEUE_LIMIT + 1
+    return min(300, max(1, math.ceil(excess * background_job_seconds() / BACKGROUND_WORKERS)))
+
+def _limited_response(status, retry_after, message):
+    headers = {'Retry-After': str(math.ceil(retry_after))}
+    if request.path.startswith('/api/'):
+        return jsonify(success=False, error=message), status, headers
+    return render_template('rate_limited.html', message=message, retry_after=math.ceil(retry_after)), status, headers
+
+@app.before_request
+def _enforce_rate_limits():
+    """Apply the endpoint's token bucket, then shed queue-producing work when the backlog is too deep"""
+    policy = RATE_LIMIT_POLICIES.get(request.endpoint)
+    if not RATE_LIMIT_ENABLED or not policy or request.method not in policy['methods']:
+        return None
+    
+    wait = rate_limiter.acquire(f"{request.endpoint}:{_rate_limit_key(policy)}",
+                                policy['capacity'], policy['per_minute'] / 60)
+    if wait:
+        metric_inc('yepid_rate_limited_total', endpoint=request.endpoint, reason='rate')
+        return _limited_response(429, wait, 'Too many requests. Please wait a moment and try again.')
+    
+    if policy.get('backpressure'):
+        wait = backpressure_retry_after()
+        if wait:
+            metric_inc('yepid_rate_limited_total', endpoint=request.endpoint, reason='backpressure')
+            return _limited_response(503, wait, 'We are processing a lot of registrations right now. Please try again shortly.')
+    return None
+
+def load_secret_key():
+    """SECRET_KEY from the environment, else a random key created once in the instance folder"""
+    if os.environ.get('SECRET_KEY'):
+        return os.environ['SECRET_KEY']
+    
+    path = os.environ.get('SECRET_KEY_FILE', os.path.join(app.instance_path, 'secret_key'))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write a private temp file, then link it into place; if another worker won, use theirs
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    
+    with open(path) as f:
+        return f.read().strip()
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in the sessions table; the cookie only carries its ID"""
+    
+    def __init__(self, initial=None, session_id=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.expires_at = expires_at
+        self.modified = False
+        self.replaced_id = None
+    
+    def regenerate(self):
+        """Keep the data under a new session ID; the old row is deleted when the session is saved"""
+        if self.session_id:
+            self.replaced_id, self.session_id = self.session_id, None
+        self.modified = True
+
+class SqliteSessionInterface(SessionInterface):
+    """Store sessions in SQLite so every worker sees the same session and the cookie stays small"""
+    
+    serializer = TaggedJSONSerializer()  # Same format as Flask's cookie sessions (keeps tuples, Markup)
+    _last_sweep = {}  # Database path -> last sweep time
+    
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id:
+            conn = get_db()
+            row = conn.execute('SELECT data, expires_at FROM sessions WHERE session_id = ? AND expires_at > ?',
+                               (session_id, time.time())).fetchone()
+            conn.close()
+            if row:
+                return ServerSideSession(self.serializer.loads(row['data']), session_id, row['expires_at'])
+        return ServerSideSession()
+    
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        
+        if session.accessed:
+            response.vary.add('Cookie')
+        
+        stale_ids = [sid for sid in (session.replaced_id, None if session else session.session_id) if sid]
+        if stale_ids and session.modified:
+            conn = get_db()
+            with conn:
+                conn.executemany('DELETE FROM sessions WHERE session_id = ?', [(sid,) for sid in stale_ids])
+            conn.close()
+        
+        if not session:
+            if session.modified and stale_ids:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        
+        # Write only on changes, or to slide the expiry once half the lifetime is used up
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if not session.modified and session.expires_at and session.expires_at - now > lifetime / 2:
+            return
+        
+        if not session.session_id:
+            session.session_id = secrets.token_urlsafe(32)
+        conn = get_db()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)',
+                         (session.session_id, self.serializer.dumps(dict(session)), now + lifetime))
+        conn.close()
+        
+        response.set_cookie(name, session.session_id,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        
+        if now - self._last_sweep.get(database_path(), 0) > SESSION_SWEEP_INTERVAL:
+            self._last_sweep[database_path()] = now
+            sweep_expired_sessions()
 
-def load_users():
-    """Load users from database"""
+def sweep_expired_sessions():
+    """Delete expired server-side sessions; returns how many were removed"""
     conn = get_db()
-    cursor = conn.cursor()
-    # Order by ID numbers in ascending order (Youth001, Youth002, etc.)
-    cursor.execute('''
-        SELECT * FROM users 
-        ORDER BY 
-            CASE 
-                WHEN id LIKE 'Youth%' THEN CAST(SUBSTR(id, 6) AS INTEGER)
-                ELSE 999999
-            END ASC,
-            registration_date ASC
-    ''')
-    rows = cursor.fetchall()
-    users = [dict(row) for row in rows]
+    with conn:
+        removed = conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
     conn.close()
-    return users
+    return removed
+
+_startup_lock = threading.Lock()
+_startup_done = False
+
+def create_app(config=None):
+    """Configure the app and run the one-time startup tasks (secret key, QR directory, schema, JSON migration).
+    
+    Importing this module has no side effects; servers, scripts and tests call create_app()
+    once per process. Heavy modules (openpyxl, qrcode/PIL) load on first use.
+    """
+    global _startup_done
+    with _startup_lock:
+        if config:
+            app.config.update(config)
+        if not _startup_done:
+            if not app.secret_key:
+                app.secret_key = load_secret_key()
+            if SESSION_BACKEND == 'sqlite':
+                app.session_interface = SqliteSessionInterface()
+            if PROXY_FIX_HOPS:
+                app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
+            mail.init_app(app)
+            os.makedirs(qr_storage_dir(), exist_ok=True)
+            init_db()
+            migrate_json_to_db()
+            migrate_qr_storage()
+            atexit.register(drain_background_jobs)
+            atexit.register(shutdown_process_pool)
+            _startup_done = True
+    return app
+
+_prepared_tenants = set()
+_tenants_lock = threading.Lock()
+
+def prepare_tenant(slug):
+    """Create or upgrade a tenant's schema and QR directory, once per process"""
+    if slug in _prepared_tenants:
+        return
+    with _tenants_lock:
+        if slug in _prepared_tenants:
+            return
+        with tenant_context(slug):
+            os.makedirs(qr_storage_dir(), exist_ok=True)
+            init_db()
+            migrate_qr_storage()
+        _prepared_tenants.add(slug)
+
+def create_tenant(slug):
+    """Set up a new barangay in TENANTS_DIR/<slug>/ (with the default admin account)"""
+    if not TENANT_SLUG_PATTERN.match(slug):
+        raise ValueError('Use lowercase letters, digits and hyphens for the tenant name')
+    # In path mode /<slug>/ must not hide a page of the main site
+    if any(rule.rule.split('/')[1] == slug for rule in app.url_map.iter_rules()):
+        raise ValueError(f'{slug} is already used by a page of the site')
+    if tenant_exists(slug):
+        raise ValueError(f'Tenant {slug} already exists')
+    os.makedirs(tenant_dir(slug), exist_ok=True)
+    prepare_tenant(slug)
+
+def resolve_tenant(environ):
+    """Tenant slug a request is addressed to, or None for the main site.
+    
+    Path mode moves the /<slug> prefix into SCRIPT_NAME, so routes and url_for() work unchanged.
+    """
+    if TENANT_MODE == 'subdomain':
+        host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+        suffix = f'.{TENANT_BASE_DOMAIN}'
+        return host[:-len(suffix)] if TENANT_BASE_DOMAIN and host.endswith(suffix) else None
+    slug, _, rest = environ.get('PATH_INFO', '').lstrip('/').partition('/')
+    if not tenant_exists(slug):
+        return None  # A page of the main site
+    environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '').rstrip('/')}/{slug}"
+    environ['PATH_INFO'] = f'/{rest}'
+    return slug
+
+def tenant_report():
+    """Headline stats of every tenant, gathered in parallel: [(slug, stats or None, error or None)]"""
+    def report(slug):
+        try:
+            prepare_tenant(slug)
+            with app.app_context(), tenant_context(slug):
+                return slug, get_analytics_stats(), None
+        except Exception as e:
+            print(f"Error reporting on tenant {slug}: {e}")
+            return slug, None, str(e)
+    
+    slugs = list_tenants()
+    if not slugs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(TENANT_REPORT_WORKERS, len(slugs)), thread_name_prefix='yepid-report') as pool:
+        return list(pool.map(report, slugs))
+
+_dispatch = app.wsgi_app
+
+def _startup_then_dispatch(environ, start_response):
+    """Run startup on the first request when the server imported `app` without calling create_app(),
+    then route the request to its tenant"""
+    if not _startup_done:
+        create_app()
+    if TENANT_MODE:
+        tenant = resolve_tenant(environ)
+        if tenant is not None:
+            if not tenant_exists(tenant):
+                return Response('Unknown barangay\n', status=404, mimetype='text/plain')(environ, start_response)
+            prepare_tenant(tenant)
+            environ['yepid.tenant'] = tenant
+    return _dispatch(environ, start_response)
+
+# Wraps the WSGI app (not before_request) so the session is opened with the secret key in place
+app.wsgi_app = _startup_then_dispatch
+
+# Users, events, attendance and notifications (storage.py); the lambda picks up a patched get_db
+repository = Repository(lambda read_only=False: get_db(read_only=read_only))
+# The same queries for reports, read through get_read_db (read-only, or the reporting snapshot)
+reports = Repository(lambda read_only=False: get_read_db())
+
+def load_users():
+    """Load users from database, in Youth ID order (Youth001, Youth002, etc.)"""
+    return repository.list_users()
 
 def save_user(user_data):
     """Save user to database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO users (user_id, id, name, street, zone, sex, birthdate, email, phone, 
-                          civil_status, youth_age_group, youth_classification, specific_needs_type,
-                          educational_background, educational_background_other, work_status, work_status_other,
-                          sk_voter_registered, sk_voted_last_election, national_voter_registered, attended_kk_assembly,
-                          kk_assembly_times, kk_assembly_no_reason, registration_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        user_data.get('user_id'),
-        user_data.get('id', ''),
-        user_data.get('name', ''),
-        user_data.get('street', ''),
-        user_data.get('zone', ''),
-        user_data.get('sex', ''),
-        user_data.get('birthdate', ''),
-        user_data.get('email', ''),
-        user_data.get('phone', ''),
-        user_data.get('civil_status', ''),
-        user_data.get('youth_age_group', ''),
-        user_data.get('youth_classification', ''),
-        user_data.get('specific_needs_type', ''),
-        user_data.get('educational_background', ''),
-        user_data.get('educational_background_other', ''),
-        user_data.get('work_status', ''),
-        user_data.get('work_status_other', ''),
-        user_data.get('sk_voter_registered', ''),
-        user_data.get('sk_voted_last_election', ''),
-        user_data.get('national_voter_registered', ''),
-        user_data.get('attended_kk_assembly', ''),
-        user_data.get('kk_assembly_times', ''),
-        user_data.get('kk_assembly_no_reason', ''),
-        user_data.get('registration_date', datetime.now().isoformat())
-    ))
-    conn.commit()
-    conn.close()
+    repository.add_users([user_data])
+
+def register_user(user_data):
+    """Insert a new user with the next sequential Youth ID in a single write transaction.
+    
+    Raises sqlite3.IntegrityError if the email is already registered (case-insensitive).
+    """
+    repository.register_user(user_data)
 
 def load_events():
     """Load events from database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM events ORDER BY event_year DESC, created_date DESC')
-    rows = cursor.fetchall()
-    events = [dict(row) for row in rows]
-    conn.close()
-    return events
+    return repository.list_events()
 
 def save_event(event_data):
     """Save event to database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO events 
-        (event_id, event_name, event_year, event_description, event_date, event_time, event_points, event_category, event_capacity, reminder_sent, created_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        event_data.get('event_id'),
-        event_data.get('event_name', ''),
-        event_data.get('event_year', ''),
-        event_data.get('event_description', ''),
-        event_data.get('event_date', ''),
-        event_data.get('event_time', ''),
-        event_data.get('event_points', 0),
-        event_data.get('event_category', ''),
-        event_data.get('event_capacity'),
-        event_data.get('reminder_sent', 0),
-        event_data.get('created_date', datetime.now().isoformat())
-    ))
-    conn.commit()
-    conn.close()
+    repository.add_event(event_data)
+    invalidate_todays_events()
+
+# Events list page size; today's events (for scanners) are cached per process for TODAY_EVENTS_CACHE_SECONDS
+EVENTS_PER_PAGE = int(os.environ.get('EVENTS_PER_PAGE', 50))
+TODAY_EVENTS_CACHE_SECONDS = float(os.environ.get('TODAY_EVENTS_CACHE_SECONDS', 60))
+_todays_events_cache = {}  # Database path -> (date, expires_at, events)
+
+def todays_events():
+    """Events scheduled for today, from the cache when it is fresh"""
+    key = database_path()
+    today = datetime.now().date().isoformat()
+    cached = _todays_events_cache.get(key)
+    if cached and cached[0] == today and cached[1] > time.monotonic():
+        return cached[2]
+    events = repository.list_events_on(today)
+    _todays_events_cache[key] = (today, time.monotonic() + TODAY_EVENTS_CACHE_SECONDS, events)
+    return events
+
+def invalidate_todays_events():
+    """Drop this process's cached list (other workers catch up within TODAY_EVENTS_CACHE_SECONDS)"""
+    _todays_events_cache.pop(database_path(), None)
 
 def update_events(events):
     """Update events in database (for deletion)"""
@@ -433,168 +1563,56 @@ def update_events(events):
     # Individual updates are handled by delete_event route
     pass
 
-def load_attendance():
-    """Load attendance records from database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM attendance ORDER BY attendance_date DESC')
-    rows = cursor.fetchall()
-    attendance = [dict(row) for row in rows]
-    conn.close()
-    return attendance
+def load_attendance(include_archived=False):
+    """Load attendance records from database (current years, or every year with include_archived)"""
+    return repository.list_attendance(include_archived)
 
 def save_attendance(attendance_data):
     """Save attendance record to database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO attendance 
-        (attendance_id, event_id, user_id, event_year, points_earned, attendance_date, scan_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        attendance_data.get('attendance_id'),
-        attendance_data.get('event_id'),
-        attendance_data.get('user_id'),
-        attendance_data.get('event_year', ''),
-        attendance_data.get('points_earned', 0),
-        attendance_data.get('attendance_date', datetime.now().isoformat()),
-        attendance_data.get('scan_time', datetime.now().isoformat())
-    ))
-    conn.commit()
-    conn.close()
+    repository.add_attendance([attendance_data])
 
 # Analytics and Reporting Functions
 def get_analytics_stats():
     """Get overall analytics statistics"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total registrations
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total_users = cursor.fetchone()[0]
-    
-    # Total events
-    cursor.execute('SELECT COUNT(*) FROM events')
-    total_events = cursor.fetchone()[0]
-    
-    # Active events (upcoming)
     today = datetime.now().date().isoformat()
-    cursor.execute('SELECT COUNT(*) FROM events WHERE event_date >= ?', (today,))
-    active_events = cursor.fetchone()[0]
-    
-    # Total attendance records
-    cursor.execute('SELECT COUNT(*) FROM attendance')
-    total_attendance = cursor.fetchone()[0]
-    
-    # Total points distributed
-    cursor.execute('SELECT SUM(points_earned) FROM attendance')
-    result = cursor.fetchone()[0]
-    total_points = result if result else 0
-    
-    # Average attendance per event
-    cursor.execute('''
-        SELECT AVG(attendance_count) FROM (
-            SELECT COUNT(*) as attendance_count 
-            FROM attendance 
-            GROUP BY event_id
-        )
-    ''')
-    result = cursor.fetchone()[0]
-    avg_attendance = round(result, 1) if result else 0
-    
-    # Recent registrations (last 7 days)
     seven_days_ago = (datetime.now() - timedelta(days=7)).isoformat()
-    cursor.execute('SELECT COUNT(*) FROM users WHERE registration_date >= ?', (seven_days_ago,))
-    recent_registrations = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return {
-        'total_users': total_users,
-        'total_events': total_events,
-        'active_events': active_events,
-        'total_attendance': total_attendance,
-        'total_points': total_points,
-        'avg_attendance': avg_attendance,
-        'recent_registrations': recent_registrations
-    }
+    return reports.summary_stats(today, seven_days_ago)
 
 def get_demographic_stats():
     """Get demographic breakdown statistics"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Age group breakdown
-    cursor.execute('SELECT youth_age_group, COUNT(*) as count FROM users WHERE youth_age_group IS NOT NULL AND youth_age_group != "" GROUP BY youth_age_group')
-    age_groups = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    # Zone breakdown
-    cursor.execute('SELECT zone, COUNT(*) as count FROM users WHERE zone IS NOT NULL AND zone != "" GROUP BY zone')
-    zones = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    # Classification breakdown
-    cursor.execute('SELECT youth_classification, COUNT(*) as count FROM users WHERE youth_classification IS NOT NULL AND youth_classification != "" GROUP BY youth_classification')
-    classifications = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    # Sex breakdown
-    cursor.execute('SELECT sex, COUNT(*) as count FROM users WHERE sex IS NOT NULL AND sex != "" GROUP BY sex')
-    sex_breakdown = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    conn.close()
-    
     return {
-        'age_groups': age_groups,
-        'zones': zones,
-        'classifications': classifications,
-        'sex_breakdown': sex_breakdown
+        'age_groups': reports.count_users_by('youth_age_group'),
+        'zones': reports.count_users_by('zone'),
+        'classifications': reports.count_users_by('youth_classification'),
+        'sex_breakdown': reports.count_users_by('sex')
     }
 
 def get_event_analytics():
     """Get event analytics and trends"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Events with attendance counts
-    cursor.execute('''
-        SELECT e.event_id, e.event_name, e.event_date, e.event_points,
-               COUNT(a.attendance_id) as attendance_count,
-               e.event_capacity
-        FROM events e
-        LEFT JOIN attendance a ON e.event_id = a.event_id
-        GROUP BY e.event_id
-        ORDER BY e.event_date DESC
-    ''')
-    
-    events_data = []
-    for row in cursor.fetchall():
-        events_data.append({
-            'event_id': row[0],
-            'event_name': row[1],
-            'event_date': row[2],
-            'event_points': row[3],
-            'attendance_count': row[4],
-            'event_capacity': row[5],
-            'attendance_rate': round((row[4] / row[5] * 100), 1) if row[5] and row[5] > 0 else 0
-        })
-    
-    # Monthly attendance trends
-    cursor.execute('''
-        SELECT strftime('%Y-%m', attendance_date) as month, COUNT(*) as count
-        FROM attendance
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 12
-    ''')
-    monthly_trends = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    conn.close()
+    events_data = reports.list_event_attendance_counts()
+    for event in events_data:
+        capacity = event['event_capacity']
+        event['attendance_rate'] = round((event['attendance_count'] / capacity * 100), 1) if capacity and capacity > 0 else 0
     
+    # Monthly attendance trends over the last 12 months
+    first_month = (datetime.now().replace(day=1) - timedelta(days=335)).strftime('%Y-%m')
     return {
         'events_data': events_data,
-        'monthly_trends': monthly_trends
+        'monthly_trends': reports.monthly_attendance(first_month)
     }
 
 # Email Notification Functions
+def send_mail_message(msg):
+    """Send a Flask-Mail message, recording latency and failures"""
+    start = time.perf_counter()
+    try:
+        mail.send(msg)
+    except Exception:
+        metric_inc('yepid_email_failures_total')
+        raise
+    finally:
+        metric_observe('yepid_email_send_seconds', time.perf_counter() - start)
+
 def send_email_notification(recipient_email, subject, message_body, html_body=None):
     """Send email notification"""
     try:
@@ -604,7 +1622,7 @@ def send_email_notification(recipient_email, subject, message_body, html_body=No
             body=message_body,
             html=html_body
         )
-        mail.send(msg)
+        send_mail_message(msg)
         return True
     except Exception as e:
         print(f"Error sending email: {e}")
@@ -707,72 +1725,602 @@ SAN AGUSTIN YEP ID System
     """
     return send_email_notification(user_email, subject, message_body, html_body)
 
-def generate_user_qr_code(user_data, save_to_disk=True):
-    """Generate QR code for user with their registration data"""
-    # Create a unique identifier for the user
-    qr_data = json.dumps({
-        'user_id': user_data['user_id'],
-        'name': user_data['name'],
-        'email': user_data['email'],
-        'registration_date': user_data['registration_date']
-    })
+# QR rendering presets; box_size is pixels per module (SVG scales, so it only sets the default size)
+QR_PRESETS = {
+    'screen': {'box_size': 6, 'border': 4},
+    'email': {'box_size': 8, 'border': 4},
+    'print': {'box_size': 20, 'border': 4},
+}
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def render_qr(data, preset='screen', fmt='png', error_correction=None):
+    """Render data as a QR code and return the PNG or SVG bytes.
     
-    # Generate QR code with better error correction for easier scanning
+    Raises ValueError if data doesn't fit in the largest QR code.
+    """
+    import qrcode
+    from qrcode.exceptions import DataOverflowError
+    
+    options = QR_PRESETS[preset]
     qr = qrcode.QRCode(
-        version=None,  # Auto-detect version
-        error_correction=qrcode.constants.ERROR_CORRECT_M,  # Medium error correction
-        box_size=10,
-        border=4,
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L if error_correction is None else error_correction,
+        border=options['border'],
     )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO
+    qr.add_data(data)
+    try:
+        qr.make(fit=True)  # Some lengths fail with ValueError('Invalid version ...') instead
+    except DataOverflowError as e:
+        raise ValueError(f'Data too long for a QR code: {e}') from e
+    matrix = qr.get_matrix()  # Includes the border
+    size = len(matrix)
+    
+    if fmt == 'svg':
+        # One path of horizontal runs instead of a rect per module
+        runs = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < size:
+                if row[x]:
+                    start = x
+                    while x < size and row[x]:
+                        x += 1
+                    runs.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+                else:
+                    x += 1
+        pixels = size * options['box_size']
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+            f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+        ).encode()
+    
+    from PIL import Image
+    # Draw one pixel per module as a 1-bit image, then scale up without resampling
+    img = Image.frombytes('L', (size, size), bytes(0 if module else 255 for row in matrix for module in row))
+    img = img.convert('1').resize((size * options['box_size'],) * 2, Image.NEAREST)
     img_buffer = BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    
-    # Save to disk if requested
-    if save_to_disk:
-        qr_filename = f"{user_data['user_id']}.png"
-        qr_filepath = os.path.join(QR_STORAGE_DIR, qr_filename)
-        img.save(qr_filepath, format='PNG')
+    img.save(img_buffer, format='PNG', optimize=True)
+    return img_buffer.getvalue()
+
+def qr_relpath(user_id):
+    """Where a user's QR code lives under QR_STORAGE_DIR: a hash-prefix shard keeps directories small"""
+    return f"{hashlib.sha1(user_id.encode()).hexdigest()[:2]}/{user_id}.png"
+
+def qr_filepath(user_id):
+    return os.path.join(qr_storage_dir(), qr_relpath(user_id))
+
+def store_qr_file(user_id, qr_png):
+    """Write a user's QR code into its shard and record it in the qr_files index"""
+    filepath = qr_filepath(user_id)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    # Write then rename so a concurrent reader never sees half a file
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(qr_png)
+    os.replace(tmp_path, filepath)
     
-    return img_buffer
+    conn = get_db()
+    conn.execute('INSERT OR REPLACE INTO qr_files (user_id, path, created_date) VALUES (?, ?, ?)',
+                 (user_id, qr_relpath(user_id), datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
 
-def login_required(f):
-    """Decorator to require login for routes"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'logged_in' not in session:
-            flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+def stored_qr_file(user_id):
+    """A user's qr_files row (path, created_date), or None"""
+    conn = get_db()
+    row = conn.execute('SELECT path, created_date FROM qr_files WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    return row
 
-@app.route('/')
-def index():
-    """Home page - redirects to consent"""
-    if 'logged_in' in session:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('consent'))
+def qr_file_versions():
+    """{user_id: version} for every stored QR code (one read of the index, not a stat per user)"""
+    conn = get_db()
+    versions = {row[0]: qr_version(row[1]) for row in conn.execute('SELECT user_id, created_date FROM qr_files')}
+    conn.close()
+    return versions
+
+def migrate_qr_storage():
+    """Move QR codes from the old flat layout (<user_id>.png) into shards and index them"""
+    moved = []
+    with os.scandir(qr_storage_dir()) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith('.png'):
+                continue
+            user_id = entry.name[:-len('.png')]
+            filepath = qr_filepath(user_id)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            try:
+                os.replace(entry.path, filepath)
+            except FileNotFoundError:
+                continue  # Another worker moved it first
+            moved.append((user_id, qr_relpath(user_id), datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()))
+    
+    if moved:
+        conn = get_db()
+        conn.executemany('INSERT OR REPLACE INTO qr_files (user_id, path, created_date) VALUES (?, ?, ?)', moved)
+        conn.commit()
+        conn.close()
+    return len(moved)
 
-@app.route('/consent', methods=['GET', 'POST'])
-def consent():
-    """Informed consent page"""
-    if 'logged_in' in session:
-        return redirect(url_for('dashboard'))
+def gc_qr_files(min_age_seconds=3600, dry_run=False):
+    """Delete QR files that belong to no user; returns the relative paths removed.
     
-    if request.method == 'POST':
-        consent_value = request.form.get('consent', '').strip()
-        
-        if consent_value == 'agree':
-            # Set consent in session
-            session['consent_given'] = True
-            flash('Thank you for your consent. You may now proceed with registration.', 'success')
+    Files on disk are loaded into a temporary table and matched against users in one query,
+    and qr_files rows without a user or without a file are dropped. Files newer than
+    min_age_seconds are left alone, so a registration still being written is never collected.
+    """
+    # Rows written after the scan started point at files the scan may have missed
+    scan_started = datetime.now().isoformat()
+    on_disk = []
+    with os.scandir(qr_storage_dir()) as shards:
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(('.png', '.tmp')):
+                        on_disk.append((entry.name.split('.', 1)[0], f"{shard.name}/{entry.name}"))
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS temp.qr_on_disk')  # Pooled connections keep temp tables
+    cursor.execute('CREATE TEMP TABLE qr_on_disk (user_id TEXT, path TEXT PRIMARY KEY)')
+    cursor.executemany('INSERT INTO qr_on_disk (user_id, path) VALUES (?, ?)', on_disk)
+    cursor.execute('''
+        SELECT d.path FROM qr_on_disk d
+        LEFT JOIN users u ON u.user_id = d.user_id
+        WHERE u.user_id IS NULL OR d.path LIKE '%.tmp'
+    ''')
+    cutoff = time.time() - min_age_seconds
+    orphans = []
+    for (path,) in cursor.fetchall():
+        try:
+            if os.path.getmtime(os.path.join(qr_storage_dir(), path)) < cutoff:
+                orphans.append(path)
+        except FileNotFoundError:
+            pass
+    
+    if not dry_run:
+        for path in orphans:
+            try:
+                os.remove(os.path.join(qr_storage_dir(), path))
+            except FileNotFoundError:
+                pass
+        cursor.execute('''
+            DELETE FROM qr_files
+            WHERE user_id NOT IN (SELECT user_id FROM users)
+               OR (path NOT IN (SELECT path FROM qr_on_disk) AND created_date < ?)
+        ''', (scan_started,))
+        conn.commit()
+    conn.close()
+    return orphans
+
+def qr_version(created_date):
+    """Short token that changes whenever a user's QR file is rewritten (used in ?v= URLs)"""
+    return hashlib.sha1(created_date.encode()).hexdigest()[:10]
+
+def qr_file_response(relpath, version, requested_version=None):
+    """Serve a stored QR file, or hand it to the front proxy when QR_OFFLOAD is set.
+    
+    A URL carrying the current version never changes content, so it may be cached for
+    QR_CACHE_SECONDS without revalidation; other requests revalidate against the ETag.
+    The cache is private because the codes are only shown to logged-in admins.
+    Returns None when the file is missing, so the caller can write it again.
+    """
+    path = os.path.join(qr_storage_dir(), relpath)
+    if QR_OFFLOAD and not os.path.isfile(path):
+        return None  # The proxy would answer 404 for a missing file
+    if QR_OFFLOAD == 'x-accel-redirect':
+        response = Response(mimetype='image/png')
+        tenant = current_tenant()
+        prefix = f"{TENANT_QR_OFFLOAD_PREFIX.rstrip('/')}/{tenant}/qr_codes" if tenant else QR_OFFLOAD_PREFIX.rstrip('/')
+        response.headers['X-Accel-Redirect'] = prefix + '/' + relpath
+    elif QR_OFFLOAD == 'x-sendfile':
+        response = Response(mimetype='image/png')
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        try:
+            response = send_file(path, mimetype='image/png', etag=False)
+        except FileNotFoundError:
+            return None
+    
+    response.set_etag(version)
+    if requested_version == version:
+        response.headers['Cache-Control'] = f'private, max-age={QR_CACHE_SECONDS}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def user_qr_payload(user_data):
+    """The text encoded in a registered user's QR code"""
+    return json.dumps({
+        'user_id': user_data['user_id'],
+        'name': user_data['name'],
+        'email': user_data['email'],
+        'registration_date': user_data['registration_date']
+    })
+
+def generate_user_qr_code(user_data, save_to_disk=True):
+    """Generate QR code for user with their registration data"""
+    import qrcode
+    
+    start = time.perf_counter()
+    # The stored copy is emailed and shown in the roster, so it uses the email preset.
+    # Medium error correction for easier scanning.
+    qr_png = render_qr(user_qr_payload(user_data), 'email', 'png', qrcode.constants.ERROR_CORRECT_M)
+    
+    # Save to disk if requested
+    if save_to_disk:
+        store_qr_file(user_data['user_id'], qr_png)
+    
+    metric_observe('yepid_qr_render_seconds', time.perf_counter() - start)
+    return BytesIO(qr_png)
+
+def send_registration_email(user_data, qr_png):
+    """Send the welcome email with the user's QR code attached"""
+    name = user_data['name']
+    email = user_data['email']
+    phone = user_data.get('phone')
+    msg = Message(
+        subject='Your Registration QR Code - SAN AGUSTIN YEP ID',
+        recipients=[email],
+        html=f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h2 style="color: #4a90e2;">Welcome, {name}!</h2>
+                <p>Thank you for registering with SAN AGUSTIN YEP ID system.</p>
+                <p>Your registration has been successful. Please find your unique QR code attached to this email.</p>
+                <p><strong>Registration Details:</strong></p>
+                <ul>
+                    <li><strong>Name:</strong> {name}</li>
+                    <li><strong>Email:</strong> {email}</li>
+                    <li><strong>Phone:</strong> {phone if phone else 'Not provided'}</li>
+                    <li><strong>Registration Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
+                </ul>
+                <p>Please keep this QR code safe. You can use it for identification and verification purposes.</p>
+                <p>If you have any questions, please contact our support team.</p>
+                <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+                <p style="color: #666; font-size: 12px;">This is an automated message. Please do not reply to this email.</p>
+            </div>
+        </body>
+        </html>
+        """
+    )
+    msg.attach('qrcode.png', 'image/png', qr_png, 'inline', headers=[['Content-ID', '<qrcode>']])
+    send_mail_message(msg)
+
+def deliver_welcome_package(user_data):
+    """Render the user's QR code and email it (used as a background job)"""
+    qr_buffer = generate_user_qr_code(user_data)
+    send_registration_email(user_data, qr_buffer.read())
+
+def _reject_scan(reason, message):
+    metric_inc('yepid_scan_rejections_total', reason=reason)
+    return reason, message
+
+def record_attendance(event, qr_text):
+    """Check a user into an event from the text of their QR code.
+    
+    Returns (outcome, message). outcome is 'checked_in' or the rejection reason counted in
+    yepid_scan_rejections_total: no_data, bad_json, missing_user_id, year_archived, unknown_user,
+    duplicate, error.
+    """
+    if not qr_text:
+        return _reject_scan('no_data', 'No QR code data provided')
+    try:
+        qr_user_data = app.json.loads(qr_text)
+    except (TypeError, ValueError):  # Not text (e.g. a number), or not JSON
+        return _reject_scan('bad_json', 'Invalid QR code format. Could not parse user data.')
+    user_id = qr_user_data.get('user_id') if isinstance(qr_user_data, dict) else None
+    if not user_id:
+        return _reject_scan('missing_user_id', 'Invalid QR code format. User ID not found.')
+    
+    try:
+        outcome, user = repository.check_in(event, user_id)
+    except Exception as e:
+        return _reject_scan('error', f'Error processing attendance: {str(e)}')
+    if outcome == 'year_archived':
+        return _reject_scan('year_archived', f'Attendance for {event.get("event_year")} has been archived.')
+    if outcome == 'unknown_user':
+        return _reject_scan('unknown_user', 'User not found in the system.')
+    if outcome == 'duplicate':
+        return _reject_scan('duplicate', f'{user.get("name", "Unknown")} has already been marked as attended for this event.')
+    
+    metric_inc('yepid_checkins_total')
+    
+    # Send attendance confirmation email in the background
+    submit_background_job(
+        send_attendance_confirmation,
+        user.get('email', ''),
+        user.get('name', 'Unknown'),
+        event.get('event_name', 'Event'),
+        event.get('event_points', 0)
+    )
+    return 'checked_in', f'Attendance recorded for {user.get("name", "Unknown")}!'
+
+# Server-side decoding of uploaded QR photos (e.g. a ZIP of paper sign-in photos)
+QR_DECODE_MAX_SIDE = int(os.environ.get('QR_DECODE_MAX_SIDE', 1280))  # Larger photos are downscaled first
+QR_DECODE_PARALLEL_THRESHOLD = int(os.environ.get('QR_DECODE_PARALLEL_THRESHOLD', 4))
+QR_DECODE_MAX_IMAGES = int(os.environ.get('QR_DECODE_MAX_IMAGES', 500))
+QR_DECODE_MAX_IMAGE_BYTES = int(os.environ.get('QR_DECODE_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp', '.tif', '.tiff')
+
+def decode_qr_image(image_bytes):
+    """Decode every QR code in an image; returns (texts, error). Runs in a worker process."""
+    import cv2
+    import numpy as np
+    
+    try:
+        # Decoding only needs luminance, and grayscale decodes at a third of the size
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return [], 'Not a readable image'
+        
+        detector = cv2.QRCodeDetector()
+        scale = QR_DECODE_MAX_SIDE / max(image.shape)
+        # Try a downscaled copy of large photos first; fall back to full resolution for small codes
+        candidates = [cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)] if scale < 1 else []
+        candidates.append(image)
+        for candidate in candidates:
+            found, texts, _, _ = detector.detectAndDecodeMulti(candidate)
+            texts = [text for text in texts if text] if found else []
+            if texts:
+                return texts, None
+        return [], 'No QR code found'
+    except cv2.error as e:
+        return [], f'Could not decode image: {e}'
+
+def iter_uploaded_images(files):
+    """Yield (name, image bytes, error) for uploaded images, expanding ZIP archives"""
+    count = 0
+    for upload in files:
+        name = upload.filename or 'upload'
+        if name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                yield name, None, 'Not a valid ZIP file'
+                continue
+            entries = [
+                info for info in archive.infolist()
+                if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')
+                and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            for info in entries:
+                count += 1
+                if count > QR_DECODE_MAX_IMAGES:
+                    yield info.filename, None, f'Skipped: more than {QR_DECODE_MAX_IMAGES} images in one upload'
+                elif info.file_size > QR_DECODE_MAX_IMAGE_BYTES:
+                    yield info.filename, None, 'Image is too large'
+                else:
+                    try:
+                        data = archive.read(info)
+                    except (zipfile.BadZipFile, RuntimeError, zlib.error):
+                        # Corrupt (bad CRC, truncated) or encrypted entry: report it, keep the rest
+                        yield info.filename, None, 'Unreadable archive entry'
+                        continue
+                    yield info.filename, data, None
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            count += 1
+            if count > QR_DECODE_MAX_IMAGES:
+                yield name, None, f'Skipped: more than {QR_DECODE_MAX_IMAGES} images in one upload'
+                continue
+            data = upload.read(QR_DECODE_MAX_IMAGE_BYTES + 1)
+            if len(data) > QR_DECODE_MAX_IMAGE_BYTES:
+                yield name, None, 'Image is too large'
+            else:
+                yield name, data, None
+        else:
+            yield name, None, 'Not an image or ZIP file'
+
+def decode_uploaded_images(images):
+    """Yield (name, texts, error) in upload order; larger batches decode across a process pool"""
+    images = iter(images)
+    head = list(itertools.islice(images, QR_DECODE_PARALLEL_THRESHOLD))
+    if len(head) < QR_DECODE_PARALLEL_THRESHOLD:
+        for name, data, error in head:
+            yield (name, *decode_qr_image(data)) if data is not None else (name, [], error)
+        return
+    
+    # Keep a bounded number of images in flight so a large ZIP isn't all in memory at once
+    pool = process_pool()
+    in_flight = deque()
+    try:
+        for name, data, error in itertools.chain(head, images):
+            in_flight.append((name, pool.submit(decode_qr_image, data) if data is not None else None, error))
+            if len(in_flight) >= PROCESS_POOL_WORKERS * 2:
+                name, future, error = in_flight.popleft()
+                yield (name, *future.result()) if future else (name, [], error)
+        while in_flight:
+            name, future, error = in_flight.popleft()
+            yield (name, *future.result()) if future else (name, [], error)
+    finally:
+        for _, future, _ in in_flight:
+            if future:
+                future.cancel()  # The request is gone; don't leave its images queued on the shared pool
+
+def get_account(username):
+    """Admin/scanner account by username (case-insensitive), or None"""
+    conn = get_db()
+    row = conn.execute('SELECT * FROM admin_accounts WHERE username = ?', (username,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def create_account(username, password=None, role='admin'):
+    """Add an account; scanner accounts may have no password (API tokens only)"""
+    password_hash = generate_password_hash(password) if password else '!'  # '!' never verifies
+    conn = get_db()
+    with conn:
+        conn.execute('''
+            INSERT INTO admin_accounts (username, password_hash, role, created_date)
+            VALUES (?, ?, ?, ?)
+        ''', (username, password_hash, role, datetime.now().isoformat()))
+    conn.close()
+
+def update_account(username, **fields):
+    """Set password_hash, is_active or last_login on an account; returns False if it doesn't exist"""
+    assignments = ', '.join(f'{column} = ?' for column in fields)
+    conn = get_db()
+    with conn:
+        updated = conn.execute(f'UPDATE admin_accounts SET {assignments} WHERE username = ?',
+                               (*fields.values(), username)).rowcount
+    conn.close()
+    return updated > 0
+
+def _hash_token(token):
+    # Tokens are long random strings, so a fast hash is enough (no KDF on every scan)
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_api_token(username, label='', scopes=TOKEN_SCOPES):
+    """Issue a long-lived API token; returns (token_id, token). Only the hash is stored."""
+    token_id = uuid.uuid4().hex[:12]
+    token = f"yep_{secrets.token_urlsafe(32)}"
+    conn = get_db()
+    with conn:
+        conn.execute('''
+            INSERT INTO api_tokens (token_id, username, token_hash, label, scopes, created_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (token_id, username, _hash_token(token), label, ','.join(scopes), datetime.now().isoformat()))
+    conn.close()
+    return token_id, token
+
+def revoke_api_token(token_id):
+    """Revoke a token by ID; returns False if it doesn't exist"""
+    conn = get_db()
+    with conn:
+        revoked = conn.execute('UPDATE api_tokens SET revoked = 1 WHERE token_id = ?', (token_id,)).rowcount
+    conn.close()
+    return revoked > 0
+
+def authenticate_api_token(token, scope):
+    """Account that owns an active token with the given scope, or None"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT t.token_id, t.scopes, t.last_used, a.username, a.role
+        FROM api_tokens t
+        JOIN admin_accounts a ON a.username = t.username
+        WHERE t.token_hash = ? AND t.revoked = 0 AND a.is_active = 1
+    ''', (_hash_token(token),)).fetchone()
+    
+    if row and scope in row['scopes'].split(','):
+        # Record use at most once a minute to keep writes off the scan path
+        now = time.time()
+        if not row['last_used'] or now - row['last_used'] > 60:
+            with conn:
+                conn.execute('UPDATE api_tokens SET last_used = ? WHERE token_id = ?', (now, row['token_id']))
+        conn.close()
+        return dict(row)
+    conn.close()
+    return None
+
+def login_retry_after(throttle_keys):
+    """Seconds until a throttled client/account may try again, or 0"""
+    now = time.time()
+    conn = get_db()
+    rows = conn.execute(f'''
+        SELECT throttle_key, failures, window_start FROM login_attempts
+        WHERE throttle_key IN ({', '.join('?' * len(throttle_keys))}) AND window_start > ?
+    ''', (*throttle_keys, now - LOGIN_WINDOW_SECONDS)).fetchall()
+    conn.close()
+    
+    retry_after = 0
+    for row in rows:
+        limit = LOGIN_MAX_FAILURES_PER_ACCOUNT if row['throttle_key'].startswith('user:') else LOGIN_MAX_FAILURES_PER_IP
+        if row['failures'] >= limit:
+            retry_after = max(retry_after, row['window_start'] + LOGIN_WINDOW_SECONDS - now)
+    return retry_after
+
+def record_login_failure(throttle_keys):
+    """Count a failed login against each key, starting a new window once the old one has passed"""
+    now = time.time()
+    window_start = now - LOGIN_WINDOW_SECONDS
+    conn = get_db()
+    with conn:
+        conn.executemany('''
+            INSERT INTO login_attempts (throttle_key, failures, window_start) VALUES (?, 1, ?)
+            ON CONFLICT(throttle_key) DO UPDATE SET
+                failures = CASE WHEN window_start <= ? THEN 1 ELSE failures + 1 END,
+                window_start = CASE WHEN window_start <= ? THEN excluded.window_start ELSE window_start END
+        ''', [(key, now, window_start, window_start) for key in throttle_keys])
+        # Keep the table small
+        conn.execute('DELETE FROM login_attempts WHERE window_start <= ?', (window_start,))
+    conn.close()
+
+def clear_login_failures(throttle_key):
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM login_attempts WHERE throttle_key = ?', (throttle_key,))
+    conn.close()
+
+_dummy_password_hash = None
+
+def dummy_password_hash():
+    """Hash checked for unknown usernames so a login costs the same whether or not the account exists"""
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = generate_password_hash(secrets.token_hex(16))
+    return _dummy_password_hash
+
+def regenerate_session():
+    """New session ID on login, logout or a change of role, so an ID planted beforehand is useless.
+    Cookie sessions carry no ID to plant; their contents are replaced as usual."""
+    if isinstance(session._get_current_object(), ServerSideSession):
+        session.regenerate()
+
+def login_required(f):
+    """Decorator to require login for routes"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'logged_in' not in session:
+            flash('Please log in to access this page.', 'warning')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.before_request
+def _bind_session_to_tenant():
+    """A login only counts on the barangay it was made on (path-mode tenants share one cookie)"""
+    if TENANT_MODE and 'logged_in' in session and session.get('tenant') != current_tenant():
+        session.clear()
+
+def scan_access_required(f):
+    """Decorator for scan APIs: an admin session, or `Authorization: Bearer <token>` with the scan scope"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            account = authenticate_api_token(auth[len('Bearer '):].strip(), 'scan')
+            if not account:
+                return jsonify(success=False, error='Invalid or revoked API token'), 401
+            g.api_account = account['username']
+            return f(*args, **kwargs)
+        return login_required(f)(*args, **kwargs)
+    return decorated_function
+
+@app.route('/')
+def index():
+    """Home page - redirects to consent"""
+    if 'logged_in' in session:
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('consent'))
+
+@app.route('/consent', methods=['GET', 'POST'])
+def consent():
+    """Informed consent page"""
+    if 'logged_in' in session:
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        consent_value = request.form.get('consent', '').strip()
+        
+        if consent_value == 'agree':
+            # Set consent in session
+            session['consent_given'] = True
+            flash('Thank you for your consent. You may now proceed with registration.', 'success')
             return redirect(url_for('register'))
         elif consent_value == 'disagree':
             flash('You have chosen not to participate. Registration cannot proceed without your consent.', 'error')
@@ -817,28 +2365,10 @@ def register():
             flash('Please fill in all required fields (Full Name and Email).', 'error')
             return render_template('register.html')
         
-        # Check if email already exists
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT email FROM users WHERE LOWER(email) = LOWER(?)', (email,))
-        if cursor.fetchone():
-            conn.close()
-            flash('This email is already registered.', 'error')
-            return render_template('register.html')
-        
-        # Generate sequential ID based on registration order (first-come-first-serve)
-        # Count total registered users to get the next sequential number
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
-        next_num = total_users + 1
-        generated_id = f"Youth{next_num:03d}"
-        conn.close()
-        
         # Create user data
         user_id = str(uuid.uuid4())
         user_data = {
             'user_id': user_id,
-            'id': generated_id,
             'name': name,
             'street': street,
             'zone': zone,
@@ -863,57 +2393,20 @@ def register():
             'registration_date': datetime.now().isoformat()
         }
         
-        # Generate QR code
+        # Save user data; the unique email index rejects duplicates atomically
         try:
-            qr_buffer = generate_user_qr_code(user_data)
-            qr_buffer.seek(0)
-            
-            # Save user data
-            save_user(user_data)
-            
-            # Send email with QR code
-            try:
-                msg = Message(
-                    subject='Your Registration QR Code - SAN AGUSTIN YEP ID',
-                    recipients=[email],
-                    html=f"""
-                    <html>
-                    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                            <h2 style="color: #4a90e2;">Welcome, {name}!</h2>
-                            <p>Thank you for registering with SAN AGUSTIN YEP ID system.</p>
-                            <p>Your registration has been successful. Please find your unique QR code attached to this email.</p>
-                            <p><strong>Registration Details:</strong></p>
-                            <ul>
-                                <li><strong>Name:</strong> {name}</li>
-                                <li><strong>Email:</strong> {email}</li>
-                                <li><strong>Phone:</strong> {phone if phone else 'Not provided'}</li>
-                                <li><strong>Registration Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
-                            </ul>
-                            <p>Please keep this QR code safe. You can use it for identification and verification purposes.</p>
-                            <p>If you have any questions, please contact our support team.</p>
-                            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
-                            <p style="color: #666; font-size: 12px;">This is an automated message. Please do not reply to this email.</p>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                )
-                msg.attach('qrcode.png', 'image/png', qr_buffer.read(), 'inline', headers=[['Content-ID', '<qrcode>']])
-                
-                mail.send(msg)
-                flash('Registration successful! Your QR code has been sent to your email.', 'success')
-            except Exception as e:
-                # If email fails, still save the user but show warning
-                flash(f'Registration successful, but email could not be sent: {str(e)}. Please contact support.', 'warning')
-            
-            # Clear consent session so user must consent again for next registration
-            session.pop('consent_given', None)
-            return redirect(url_for('registration_success', email=email))
-            
-        except Exception as e:
-            flash(f'Error generating QR code: {str(e)}', 'error')
+            register_user(user_data)
+        except sqlite3.IntegrityError:
+            flash('This email is already registered.', 'error')
             return render_template('register.html')
+        
+        # Render the QR code and email it in the background so the request returns right away
+        submit_background_job(deliver_welcome_package, user_data)
+        flash('Registration successful! Your QR code will arrive in your email shortly.', 'success')
+        
+        # Clear consent session so user must consent again for next registration
+        session.pop('consent_given', None)
+        return redirect(url_for('registration_success', email=email))
     
     return render_template('register.html')
 
@@ -927,15 +2420,38 @@ def registration_success():
 def login():
     """Admin login page"""
     if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
+        username = (request.form.get('username') or '').strip()
+        password = request.form.get('password') or ''
+        throttle_keys = [f"ip:{request.remote_addr}", f"user:{username.lower()}"]
+        
+        # Refuse throttled clients before spending time on password hashing
+        retry_after = login_retry_after(throttle_keys)
+        if retry_after:
+            metric_inc('yepid_login_throttled_total')
+            flash(f'Too many failed login attempts. Try again in {math.ceil(retry_after / 60)} minute(s).', 'error')
+            return render_template('login.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
         
-        if username == ADMIN_USERNAME and check_password_hash(ADMIN_PASSWORD_HASH, password):
+        account = get_account(username)
+        if account and account['is_active']:
+            valid = check_password_hash(account['password_hash'], password)
+        else:
+            check_password_hash(dummy_password_hash(), password)
+            valid = False
+        
+        if valid and account['role'] != 'admin':
+            flash('Scanner accounts sign in with an API token, not the admin login.', 'error')
+        elif valid:
+            clear_login_failures(throttle_keys[1])
+            update_account(account['username'], last_login=datetime.now().isoformat())
+            regenerate_session()
             session['logged_in'] = True
-            session['username'] = username
+            session['username'] = account['username']
+            session['role'] = account['role']
+            session['tenant'] = current_tenant()
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
+            record_login_failure(throttle_keys)
             flash('Invalid username or password.', 'error')
     
     return render_template('login.html')
@@ -944,6 +2460,7 @@ def login():
 def logout():
     """Logout route"""
     session.clear()
+    regenerate_session()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
@@ -952,178 +2469,236 @@ def logout():
 def dashboard():
     """Main dashboard after login"""
     stats = get_analytics_stats()
-    return render_template('dashboard.html', stats=stats)
+    return render_template('dashboard.html', stats=stats, show_tenants=bool(TENANT_MODE) and not current_tenant())
 
 @app.route('/registered_persons')
 @login_required
 def registered_persons():
     """View all registered persons - Admin only"""
+    # Older registrations may lack a Youth ID or still have an STU one
+    repository.assign_youth_ids()
     users = load_users()
+    # Codes not written yet (e.g. a bulk import's background jobs still running) are rendered
+    # by view_user_qr when their thumbnail is requested, not here in the page's request
+    qr_versions = qr_file_versions()
     
-    # Check which users have QR codes saved and generate missing ones
-    # Also ensure all users have the id field for backward compatibility
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # First, assign IDs to users without IDs based on registration order
-    cursor.execute('''
-        SELECT user_id, registration_date 
-        FROM users 
-        WHERE id IS NULL OR id = "" OR id = "STU%" 
-        ORDER BY registration_date ASC
-    ''')
-    users_without_id = cursor.fetchall()
-    
-    # Get the highest existing Youth ID number
-    cursor.execute('SELECT id FROM users WHERE id LIKE "Youth%" ORDER BY CAST(SUBSTR(id, 6) AS INTEGER) DESC LIMIT 1')
-    last_id_row = cursor.fetchone()
-    if last_id_row and last_id_row[0]:
-        last_id = last_id_row[0]
-        if last_id.startswith('Youth') and last_id.replace('Youth', '').isdigit():
-            next_id_num = int(last_id.replace('Youth', '')) + 1
-        else:
-            next_id_num = 1
-    else:
-        next_id_num = 1
-    
-    # Assign IDs sequentially to users without IDs, maintaining registration order
-    for user_row in users_without_id:
-        user_id_to_update = user_row[0]
-        new_id = f"Youth{next_id_num:03d}"
-        cursor.execute('UPDATE users SET id = ? WHERE user_id = ?', (new_id, user_id_to_update))
-        next_id_num += 1
-    
-    # Reload users to get updated IDs, ordered by ID numbers
-    cursor.execute('''
-        SELECT * FROM users 
-        ORDER BY 
-            CASE 
-                WHEN id LIKE 'Youth%' THEN CAST(SUBSTR(id, 6) AS INTEGER)
-                ELSE 999999
-            END ASC,
-            registration_date ASC
-    ''')
-    rows = cursor.fetchall()
-    users = [dict(row) for row in rows]
-    
-    for user in users:
-        # Migrate old STU IDs to Youth format
-        if user.get('id', '').startswith('STU'):
-            old_num = user['id'].replace('STU', '')
-            if old_num.isdigit():
-                new_id = f"Youth{old_num}"
-                cursor.execute('UPDATE users SET id = ? WHERE user_id = ?', (new_id, user['user_id']))
-                user['id'] = new_id
-        
-        qr_filename = f"{user['user_id']}.png"
-        qr_filepath = os.path.join(QR_STORAGE_DIR, qr_filename)
-        if not os.path.exists(qr_filepath):
-            # Generate QR code for users who don't have one
-            try:
-                generate_user_qr_code(user, save_to_disk=True)
-            except Exception as e:
-                print(f"Error generating QR code for user {user['user_id']}: {str(e)}")
-    
-    conn.commit()
-    conn.close()
-    
-    # Reload users to get updated data
-    users = load_users()
-    
-    return render_template('registered_persons.html', users=users)
+    return render_template('registered_persons.html', users=users, qr_versions=qr_versions)
 
 @app.route('/generate_user_qr/<user_id>')
 @login_required
 def generate_user_qr(user_id):
     """Generate and download QR code for a specific registered person"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    user = repository.get_user(user_id)
+    if not user:
         flash('User not found.', 'error')
         return redirect(url_for('registered_persons'))
     
-    user = dict(row)
+    preset = request.args.get('preset', 'email')
+    fmt = request.args.get('format', 'png')
+    if preset not in QR_PRESETS or fmt not in QR_FORMATS:
+        flash('Unknown QR code size or format.', 'error')
+        return redirect(url_for('registered_persons'))
     
-    # Generate and save QR code
-    qr_buffer = generate_user_qr_code(user, save_to_disk=True)
-    qr_buffer.seek(0)
+    if (preset, fmt) == ('email', 'png'):
+        # Generate and save QR code
+        qr_buffer = generate_user_qr_code(user, save_to_disk=True)
+    else:
+        import qrcode
+        qr_buffer = BytesIO(render_qr(user_qr_payload(user), preset, fmt, qrcode.constants.ERROR_CORRECT_M))
     
-    return send_file(qr_buffer, mimetype='image/png', as_attachment=True, 
-                    download_name=f"qr_{user['name'].replace(' ', '_')}_{user_id[:8]}.png")
+    return send_file(qr_buffer, mimetype=QR_FORMATS[fmt], as_attachment=True, 
+                    download_name=f"qr_{user['name'].replace(' ', '_')}_{user_id[:8]}.{fmt}")
 
 @app.route('/view_user_qr/<user_id>')
 @login_required
 def view_user_qr(user_id):
     """View QR code for a specific registered person"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    # A deleted user's code is gone at once, even though its file stays until the purge
+    user = repository.get_user(user_id)
+    if not user:
         flash('User not found.', 'error')
         return redirect(url_for('registered_persons'))
     
-    user = dict(row)
-    
-    qr_filename = f"{user_id}.png"
-    qr_filepath = os.path.join(QR_STORAGE_DIR, qr_filename)
-    
-    # Generate QR code if it doesn't exist
-    if not os.path.exists(qr_filepath):
+    stored = stored_qr_file(user_id)
+    response = None
+    if stored:
+        response = qr_file_response(stored['path'], qr_version(stored['created_date']), request.args.get('v'))
+    if response is None:
+        # No code yet, or its index row outlived the file (restore without the QR copy,
+        # manual cleanup): write it again, which also refreshes the row and its version
         generate_user_qr_code(user, save_to_disk=True)
+        stored = stored_qr_file(user_id)
+        if stored:
+            response = qr_file_response(stored['path'], qr_version(stored['created_date']), request.args.get('v'))
     
-    if os.path.exists(qr_filepath):
-        return send_file(qr_filepath, mimetype='image/png')
-    else:
+    if response is None:
         flash('QR code could not be generated.', 'error')
         return redirect(url_for('registered_persons'))
+    return response
 
 @app.route('/users/<user_id>/delete', methods=['POST'])
 @login_required
 def delete_user(user_id):
     """Delete a registered user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if user exists
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    user_row = cursor.fetchone()
-    if not user_row:
-        conn.close()
+    user = repository.get_user(user_id)
+    if not user:
         flash('User not found.', 'error')
         return redirect(url_for('registered_persons'))
     
-    user = dict(user_row)
-    
-    # Delete attendance records for this user
-    cursor.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
-    
-    # Delete notifications for this user
-    cursor.execute('DELETE FROM notifications WHERE user_id = ?', (user_id,))
+    # Hidden at once; attendance, notifications and the QR file are removed in the background
+    if repository.delete_user(user_id):
+        submit_background_job(purge_deleted_records)
     
-    # Delete user
-    cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
-    
-    conn.commit()
-    conn.close()
+    flash(f'User "{user.get("name", "Unknown")}" deleted successfully!', 'success')
+    return redirect(url_for('registered_persons'))
+
+# Bulk roster import
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Roster columns that can be imported (everything except generated fields)
+IMPORT_FIELDS = USER_COLUMNS[2:-1]
+IMPORT_HEADER_ALIASES = {
+    'full_name': 'name',
+    'email_address': 'email',
+    'phone_number': 'phone',
+    'contact_number': 'phone',
+    'mobile': 'phone',
+    'purok': 'zone',
+    'gender': 'sex',
+    'date_of_birth': 'birthdate',
+    'birthday': 'birthdate',
+}
+
+def _normalize_import_header(header):
+    """Map a spreadsheet header to a users column name"""
+    key = str(header or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return IMPORT_HEADER_ALIASES.get(key, key)
+
+def _import_cell(value):
+    """Convert a CSV/XLSX cell into the text stored in the database"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def iter_roster_rows(file_storage):
+    """Stream (row_number, row dict) pairs from an uploaded CSV or XLSX roster"""
+    filename = (file_storage.filename or '').lower()
+    
+    if filename.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(file_storage.stream, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            headers = [_normalize_import_header(h) for h in next(rows, ())]
+            for row_number, values in enumerate(rows, 2):
+                if not any(v not in (None, '') for v in values):
+                    continue  # Skip blank rows
+                yield row_number, {h: _import_cell(v) for h, v in zip(headers, values) if h}
+        finally:
+            wb.close()
+    else:
+        text_stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+        reader = csv.reader(text_stream)
+        headers = [_normalize_import_header(h) for h in next(reader, [])]
+        for row_number, values in enumerate(reader, 2):
+            if not any(v.strip() for v in values):
+                continue  # Skip blank rows
+            yield row_number, {h: _import_cell(v) for h, v in zip(headers, values) if h}
+
+def _import_roster_chunk(chunk, seen_emails, next_num, report):
+    """Validate, dedupe and insert one chunk of roster rows; returns the next Youth number"""
+    valid = []
+    for row_number, row in chunk:
+        name = row.get('name', '')
+        email = row.get('email', '')
+        if not name or not email:
+            report['errors'].append((row_number, email, 'Missing required field (name or email).'))
+            continue
+        if not EMAIL_PATTERN.match(email):
+            report['errors'].append((row_number, email, 'Invalid email address.'))
+            continue
+        key = email.lower()
+        if key in seen_emails:
+            report['errors'].append((row_number, email, 'Duplicate email in uploaded file.'))
+            continue
+        seen_emails.add(key)
+        valid.append((row_number, row, key))
+    
+    if not valid:
+        return next_num
+    
+    # Set-based duplicate check against existing users
+    existing = repository.registered_emails(key for _, _, key in valid)
+    
+    users = []
+    row_numbers = {}
+    for row_number, row, key in valid:
+        if key in existing:
+            report['errors'].append((row_number, row['email'], 'This email is already registered.'))
+            continue
+        user_data = {field: row.get(field, '') for field in IMPORT_FIELDS}
+        user_data['user_id'] = str(uuid.uuid4())
+        user_data['registration_date'] = datetime.now().isoformat()
+        users.append(user_data)
+        row_numbers[user_data['user_id']] = row_number
+    
+    # A conflict (someone registered concurrently) only fails the conflicting rows
+    inserted, failed, next_num = repository.add_numbered_users(users, next_num)
+    for user_data, error in failed:
+        report['errors'].append((row_numbers[user_data['user_id']], user_data['email'], f'Could not be saved: {error}'))
+    
+    for user_data in inserted:
+        submit_background_job(deliver_welcome_package, user_data)
+    report['imported'] += len(inserted)
+    return next_num
+
+def import_roster(file_storage):
+    """Import a roster file in chunked transactions; per-row problems are collected, not raised"""
+    report = {'imported': 0, 'processed': 0, 'errors': []}
+    next_num = repository.next_youth_number()
+    seen_emails = set()
+    chunk = []
+    for row_number, row in iter_roster_rows(file_storage):
+        report['processed'] += 1
+        chunk.append((row_number, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            next_num = _import_roster_chunk(chunk, seen_emails, next_num, report)
+            chunk = []
+    if chunk:
+        _import_roster_chunk(chunk, seen_emails, next_num, report)
+    return report
+
+@app.route('/registered_persons/import', methods=['GET', 'POST'])
+@login_required
+def bulk_import():
+    """Import many registrations at once from a CSV or XLSX roster"""
+    report = None
     
-    # Delete QR code file if it exists
-    qr_filename = f"{user_id}.png"
-    qr_filepath = os.path.join(QR_STORAGE_DIR, qr_filename)
-    if os.path.exists(qr_filepath):
+    if request.method == 'POST':
+        roster = request.files.get('roster')
+        if not roster or not roster.filename:
+            flash('Please choose a CSV or XLSX file to import.', 'error')
+            return redirect(url_for('bulk_import'))
+        if not roster.filename.lower().endswith(('.csv', '.xlsx')):
+            flash('Unsupported file type. Please upload a .csv or .xlsx file.', 'error')
+            return redirect(url_for('bulk_import'))
+        
         try:
-            os.remove(qr_filepath)
+            report = import_roster(roster)
         except Exception as e:
-            print(f"Error deleting QR code file: {e}")
+            flash(f'Error reading roster: {str(e)}', 'error')
+            return redirect(url_for('bulk_import'))
+        
+        if report['errors']:
+            flash(f"Imported {report['imported']} of {report['processed']} rows. {len(report['errors'])} rows had errors.", 'warning')
+        else:
+            flash(f"Imported {report['imported']} rows. QR codes and welcome emails are being sent in the background.", 'success')
     
-    flash(f'User "{user.get("name", "Unknown")}" deleted successfully!', 'success')
-    return redirect(url_for('registered_persons'))
+    return render_template('bulk_import.html', report=report, fields=IMPORT_FIELDS)
 
 @app.route('/events', methods=['GET', 'POST'])
 @login_required
@@ -1173,244 +2748,520 @@ def events():
         flash('Event created successfully!', 'success')
         return redirect(url_for('events'))
     
-    events_list = load_events()  # Already sorted by year and date in SQL query
-    return render_template('events.html', events=events_list)
+    filters = {
+        'year': request.args.get('year', '').strip(),
+        'category': request.args.get('category', '').strip(),
+        'q': request.args.get('q', '').strip(),
+        'when': request.args.get('when', '') if request.args.get('when') in ('upcoming', 'past') else '',
+    }
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    # One extra row tells whether there is a next page without counting every event
+    events_list = repository.list_events_page(
+        year=filters['year'], category=filters['category'], name=filters['q'], when=filters['when'],
+        today=datetime.now().date().isoformat(), limit=EVENTS_PER_PAGE + 1, offset=(page - 1) * EVENTS_PER_PAGE)
+    has_next = len(events_list) > EVENTS_PER_PAGE
+    return render_template('events.html', events=events_list[:EVENTS_PER_PAGE], filters=filters,
+                           filter_args={key: value for key, value in filters.items() if value},
+                           years=repository.list_event_years(), page=page, has_next=has_next,
+                           first_index=(page - 1) * EVENTS_PER_PAGE)
 
 @app.route('/events/<event_id>')
 @login_required
 def event_detail(event_id):
     """View event details and manage attendance"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get event
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    event = repository.get_event(event_id)
+    if not event:
         flash('Event not found.', 'error')
         return redirect(url_for('events'))
-    event = dict(row)
     
     # Load attendance for this event with user details
-    cursor.execute('''
-        SELECT a.*, u.name as user_name, u.email as user_email
-        FROM attendance a
-        LEFT JOIN users u ON a.user_id = u.user_id
-        WHERE a.event_id = ?
-        ORDER BY a.attendance_date DESC
-    ''', (event_id,))
-    rows = cursor.fetchall()
-    event_attendance = [dict(row) for row in rows]
+    event_attendance = repository.list_event_attendance(event)
     
     # Ensure points_earned is set (for backward compatibility)
     for record in event_attendance:
         if 'points_earned' not in record or record.get('points_earned') is None:
             record['points_earned'] = event.get('event_points', 0)
     
-    conn.close()
     return render_template('event_detail.html', event=event, attendance=event_attendance)
 
 @app.route('/events/<event_id>/scan', methods=['GET', 'POST'])
 @login_required
 def scan_event_attendance(event_id):
     """Scan QR code for event attendance"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    event = repository.get_event(event_id)
+    if not event:
         flash('Event not found.', 'error')
         return redirect(url_for('events'))
     
-    event = dict(row)
     return render_template('scan_event_attendance.html', event=event)
 
 @app.route('/api/scan/attendance/<event_id>', methods=['POST'])
-@login_required
+@scan_access_required
 def process_attendance_scan(event_id):
     """Process scanned QR code for event attendance"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get event
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
-        return json.dumps({'success': False, 'error': 'Event not found'}), 404
-    event = dict(row)
-    
-    data = request.get_json()
-    scanned_data = data.get('qr_data', '')
-    
-    if not scanned_data:
-        conn.close()
-        return json.dumps({'success': False, 'error': 'No QR code data provided'}), 400
+    event = repository.get_event(event_id)
+    if not event:
+        metric_inc('yepid_scan_rejections_total', reason='event_not_found')
+        return jsonify(success=False, error='Event not found'), 404
+    
+    data = request.get_json(silent=True)
+    # A body that isn't a JSON object is rejected like a missing code
+    outcome, message = record_attendance(event, data.get('qr_data', '') if isinstance(data, dict) else '')
+    
+    # Only what the scanner shows
+    if outcome == 'checked_in':
+        return jsonify(success=True, message=message)
+    if outcome == 'duplicate':
+        return jsonify(success=False, already_attended=True, error=message), 400
+    return jsonify(success=False, error=message), 500 if outcome == 'error' else 400
+
+@app.route('/api/events/today')
+@scan_access_required
+def api_todays_events():
+    """Events a scanner can check people in to today"""
+    return jsonify(success=True, events=todays_events())
+
+@app.route('/events/<event_id>/scan/upload', methods=['POST'])
+@login_required
+def upload_attendance_images(event_id):
+    """Record attendance from uploaded QR photos or a ZIP of them"""
+    event = repository.get_event(event_id)
+    if not event:
+        flash('Event not found.', 'error')
+        return redirect(url_for('events'))
     
-    try:
-        # Parse QR code data (should be JSON)
-        qr_user_data = json.loads(scanned_data)
-        user_id = qr_user_data.get('user_id')
-        
-        if user_id:
-            # Check if user exists
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            user_row = cursor.fetchone()
-            
-            if user_row:
-                user = dict(user_row)
-                
-                # Check if already attended
-                cursor.execute('SELECT * FROM attendance WHERE event_id = ? AND user_id = ?', (event_id, user_id))
-                existing_attendance = cursor.fetchone()
-                
-                if not existing_attendance:
-                    # Get event points
-                    event_points = event.get('event_points', 0)
-                    
-                    # Record attendance
-                    attendance_id = str(uuid.uuid4())
-                    scan_time = datetime.now().isoformat()
-                    cursor.execute('''
-                        INSERT INTO attendance 
-                        (attendance_id, event_id, user_id, event_year, points_earned, attendance_date, scan_time)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        attendance_id,
-                        event_id,
-                        user_id,
-                        event.get('event_year', ''),
-                        event_points,
-                        datetime.now().isoformat(),
-                        scan_time
-                    ))
-                    conn.commit()
-                    conn.close()
-                    
-                    # Send attendance confirmation email
-                    try:
-                        send_attendance_confirmation(
-                            user.get('email', ''),
-                            user.get('name', 'Unknown'),
-                            event.get('event_name', 'Event'),
-                            event_points
-                        )
-                    except Exception as e:
-                        print(f"Error sending attendance confirmation email: {e}")
-                    
-                    return json.dumps({
-                        'success': True, 
-                        'message': f'Attendance recorded for {user.get("name", "Unknown")}!',
-                        'user_name': user.get('name', 'Unknown')
-                    })
-                else:
-                    conn.close()
-                    return json.dumps({
-                        'success': False, 
-                        'error': f'{user.get("name", "Unknown")} has already been marked as attended for this event.',
-                        'already_attended': True
-                    }), 400
-            else:
-                conn.close()
-                return json.dumps({'success': False, 'error': 'User not found in the system.'}), 400
-        else:
-            conn.close()
-            return json.dumps({'success': False, 'error': 'Invalid QR code format. User ID not found.'}), 400
-    except json.JSONDecodeError:
-        conn.close()
-        return json.dumps({'success': False, 'error': 'Invalid QR code format. Could not parse user data.'}), 400
-    except Exception as e:
-        conn.close()
-        return json.dumps({'success': False, 'error': f'Error processing attendance: {str(e)}'}), 500
+    files = [f for f in request.files.getlist('images') if f.filename]
+    if not files:
+        flash('Please choose one or more images or a ZIP file.', 'error')
+        return redirect(url_for('scan_event_attendance', event_id=event_id))
+    
+    report = []
+    for name, texts, error in decode_uploaded_images(iter_uploaded_images(files)):
+        if error:
+            report.append({'image': name, 'outcome': 'unreadable', 'message': error})
+        for text in texts:
+            outcome, message = record_attendance(event, text)
+            report.append({'image': name, 'outcome': outcome, 'message': message})
+    
+    summary = {
+        'images': len({entry['image'] for entry in report}),
+        'checked_in': sum(1 for entry in report if entry['outcome'] == 'checked_in'),
+        'duplicates': sum(1 for entry in report if entry['outcome'] == 'duplicate'),
+        'problems': sum(1 for entry in report if entry['outcome'] not in ('checked_in', 'duplicate')),
+    }
+    return render_template('scan_event_attendance.html', event=event, upload_report=report, upload_summary=summary)
 
 @app.route('/events/<event_id>/delete', methods=['POST'])
 @login_required
 def delete_event(event_id):
     """Delete an event"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if event exists
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    if not cursor.fetchone():
-        conn.close()
+    # Hidden at once; its attendance records are removed in the background
+    if not repository.delete_event(event_id):
         flash('Event not found.', 'error')
         return redirect(url_for('events'))
     
-    # Delete attendance records for this event
-    cursor.execute('DELETE FROM attendance WHERE event_id = ?', (event_id,))
-    
-    # Delete event
-    cursor.execute('DELETE FROM events WHERE event_id = ?', (event_id,))
-    
-    conn.commit()
-    conn.close()
-    
+    submit_background_job(purge_deleted_records)
+    invalidate_todays_events()
     flash('Event deleted successfully!', 'success')
     return redirect(url_for('events'))
 
-@app.route('/events/<event_id>/export')
-@login_required
-def export_attendance(event_id):
-    """Export attendance records to Excel file"""
-    conn = get_db()
-    cursor = conn.cursor()
+# Deleting a user or event flags it; its attendance and notifications are removed by a
+# background job in short transactions so live scanners never wait long for the write lock
+DELETION_CHUNK_SIZE = int(os.environ.get('DELETION_CHUNK_SIZE', 500))
+DELETION_CHUNK_PAUSE = float(os.environ.get('DELETION_CHUNK_PAUSE', 0.05))  # Seconds between chunks
+_purge_lock = threading.Lock()
+
+def _delete_in_chunks(conn, table, column, value):
+    """DELETE FROM table WHERE column = value, at most DELETION_CHUNK_SIZE rows per transaction;
+    returns the number of rows deleted"""
+    total = 0
+    while True:
+        with conn:
+            removed = conn.execute(
+                f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} = ? LIMIT ?)',
+                (value, DELETION_CHUNK_SIZE)
+            ).rowcount
+        total += removed
+        if removed < DELETION_CHUNK_SIZE:
+            return total
+        time.sleep(DELETION_CHUNK_PAUSE)
+
+def purge_deleted_records():
+    """Remove every soft-deleted user and event with everything that belongs to them (background job).
+    
+    Re-reads the flags until none are left, so a deletion made while a purge is running is
+    picked up by it; a purge interrupted by a restart resumes with the next deletion or
+    `flask purge-deleted`.
+    """
+    with _purge_lock:
+        conn = get_db()
+        try:
+            while True:
+                user_ids = [row[0] for row in conn.execute('SELECT user_id FROM users WHERE deleted_at IS NOT NULL')]
+                event_ids = [row[0] for row in conn.execute('SELECT event_id FROM events WHERE deleted_at IS NOT NULL')]
+                if not user_ids and not event_ids:
+                    return
+                # Archived years lose rows too; their rollups are recomputed afterwards
+                years = archived_years(conn, completed_only=False)
+                touched_years = set()
+                
+                for user_id in user_ids:
+                    _delete_in_chunks(conn, 'attendance', 'user_id', user_id)
+                    touched_years.update(y for y in years if _delete_in_chunks(conn, archive_table(y), 'user_id', user_id))
+                    _delete_in_chunks(conn, 'notifications', 'user_id', user_id)
+                    with conn:
+                        # The final delete also catches a check-in that raced the flag
+                        conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
+                        conn.execute('DELETE FROM qr_files WHERE user_id = ?', (user_id,))
+                        conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+                    try:
+                        os.remove(qr_filepath(user_id))
+                    except FileNotFoundError:
+                        pass
+                    except Exception as e:
+                        print(f"Error deleting QR code file: {e}")
+                
+                for event_id in event_ids:
+                    _delete_in_chunks(conn, 'attendance', 'event_id', event_id)
+                    touched_years.update(y for y in years if _delete_in_chunks(conn, archive_table(y), 'event_id', event_id))
+                    _delete_in_chunks(conn, 'notifications', 'event_id', event_id)
+                    with conn:
+                        conn.execute('DELETE FROM attendance WHERE event_id = ?', (event_id,))
+                        conn.execute('DELETE FROM events WHERE event_id = ?', (event_id,))
+                
+                # A year still being moved gets its rollups when the move completes
+                for year in touched_years & set(archived_years(conn)):
+                    with conn:
+                        refresh_attendance_rollups(conn, year)
+                        conn.execute(f'UPDATE attendance_archives SET row_count = (SELECT COUNT(*) FROM {archive_table(year)}) '
+                                     'WHERE event_year = ?', (year,))
+        finally:
+            conn.close()
+
+# Attendance archive: closed years move out of the hot attendance table into
+# attendance_archive_<year> tables, and attendance_rollup_users/_events keep their totals
+# so the leaderboard and analytics never re-read archived rows.
+ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 1000))  # Rows moved per transaction
+ATTENDANCE_FIELDS = 'attendance_id, event_id, user_id, event_year, points_earned, attendance_date, scan_time'
+# Hides rows that belong to soft-deleted users or events (see purge_deleted_records)
+LIVE_ROWS = ('user_id NOT IN (SELECT user_id FROM users WHERE deleted_at IS NOT NULL) '
+             'AND event_id NOT IN (SELECT event_id FROM events WHERE deleted_at IS NOT NULL)')
+
+def archive_table(year):
+    """Name of a year's archive table; years are validated because the name goes into SQL"""
+    if not re.fullmatch(r'\d{4}', str(year or '')):
+        raise ValueError(f'Not an archivable year: {year!r}')
+    return f'attendance_archive_{year}'
+
+def rebuild_attendance_views(conn):
+    """Recreate attendance_history (every year) and the archived_attendance_<year> views"""
+    arms = [f'SELECT {ATTENDANCE_FIELDS} FROM live_attendance']
+    for year in archived_years(conn, completed_only=False):
+        table = archive_table(year)
+        # Rows of a year still being moved are in one table or the other, never both
+        conn.execute(f'DROP VIEW IF EXISTS archived_attendance_{year}')
+        conn.execute(f'''
+            CREATE VIEW archived_attendance_{year} AS
+            SELECT {ATTENDANCE_FIELDS} FROM {table} WHERE {LIVE_ROWS}
+            UNION ALL
+            SELECT {ATTENDANCE_FIELDS} FROM live_attendance WHERE event_year = '{year}'
+        ''')
+        arms.append(f'SELECT {ATTENDANCE_FIELDS} FROM {table} WHERE {LIVE_ROWS}')
+    conn.execute('DROP VIEW IF EXISTS attendance_history')
+    conn.execute('CREATE VIEW attendance_history AS ' + ' UNION ALL '.join(arms))
+
+def refresh_attendance_rollups(conn, year):
+    """Recompute an archived year's per-user and per-event totals from its archive table"""
+    table = archive_table(year)
+    conn.execute('DELETE FROM attendance_rollup_users WHERE event_year = ?', (year,))
+    conn.execute('DELETE FROM attendance_rollup_events WHERE event_year = ?', (year,))
+    conn.execute(f'''
+        INSERT INTO attendance_rollup_users (event_year, user_id, events_attended, total_points)
+        SELECT ?, user_id, COUNT(*), COALESCE(SUM(points_earned), 0) FROM {table} GROUP BY user_id
+    ''', (year,))
+    conn.execute(f'''
+        INSERT INTO attendance_rollup_events (event_id, event_year, attendance_count, total_points)
+        SELECT event_id, ?, COUNT(*), COALESCE(SUM(points_earned), 0) FROM {table} GROUP BY event_id
+    ''', (year,))
+
+def archive_attendance_year(year):
+    """Move a closed year's attendance into its archive table and roll it up; returns rows moved.
+    
+    Rows move ARCHIVE_CHUNK_SIZE at a time in short transactions, so scanners are never
+    blocked for long. Check-ins for the year are refused from the moment archiving starts.
+    """
+    table = archive_table(year)
+    if int(year) >= datetime.now().year:
+        raise ValueError(f'{year} is not a closed year')
     
-    # Get event
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    row = cursor.fetchone()
-    if not row:
+    # Holds the purge lock so a purge never misses rows that are moving between tables
+    with _purge_lock:
+        return _archive_attendance_year(year, table)
+
+def _archive_attendance_year(year, table):
+    conn = get_db()
+    try:
+        with conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    attendance_id TEXT PRIMARY KEY,
+                    event_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    event_year TEXT,
+                    points_earned INTEGER DEFAULT 0,
+                    attendance_date TEXT NOT NULL,
+                    scan_time TEXT
+                )
+            ''')
+            conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_event_user ON {table}(event_id, user_id)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table}(user_id)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_date ON {table}(attendance_date)')
+            conn.execute('INSERT OR IGNORE INTO attendance_archives (event_year, started_date) VALUES (?, ?)',
+                         (year, datetime.now().isoformat()))
+            rebuild_attendance_views(conn)
+        
+        moved = 0
+        while True:
+            with conn:
+                # Both statements pick the same lowest rowids; the insert holds the write lock in between
+                conn.execute(f'''
+                    INSERT INTO {table} ({ATTENDANCE_FIELDS})
+                    SELECT {ATTENDANCE_FIELDS} FROM attendance WHERE event_year = ? ORDER BY rowid LIMIT ?
+                ''', (year, ARCHIVE_CHUNK_SIZE))
+                removed = conn.execute('''
+                    DELETE FROM attendance WHERE rowid IN (
+                        SELECT rowid FROM attendance WHERE event_year = ? ORDER BY rowid LIMIT ?
+                    )
+                ''', (year, ARCHIVE_CHUNK_SIZE)).rowcount
+            moved += removed
+            if removed < ARCHIVE_CHUNK_SIZE:
+                break
+            time.sleep(DELETION_CHUNK_PAUSE)
+        
+        with conn:
+            refresh_attendance_rollups(conn, year)
+            conn.execute(f'''
+                UPDATE attendance_archives SET completed_date = ?, row_count = (SELECT COUNT(*) FROM {table})
+                WHERE event_year = ?
+            ''', (datetime.now().isoformat(), year))
+        return moved
+    finally:
         conn.close()
-        flash('Event not found.', 'error')
-        return redirect(url_for('events'))
-    event = dict(row)
+
+# Backups: online database snapshots (SQLite backup API) plus an incremental copy of the QR files
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))  # Pages copied per read-lock hold
+BACKUP_STEP_PAUSE = float(os.environ.get('BACKUP_STEP_PAUSE', 0.01))  # Seconds between steps, so writers get in
+BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', 3))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))  # Snapshots kept; 0 keeps every one
+BACKUP_NAME_PATTERN = re.compile(r'^yep_id-\d{8}-\d{6}(-\d{6})?\.db\.gz$')  # Older snapshots have no microseconds
+BACKUP_REQUIRED_TABLES = ('users', 'events', 'attendance', 'admin_accounts')
+_backup_lock = threading.RLock()
+
+def backup_dir():
+    """Backup directory of the current tenant"""
+    tenant = current_tenant()
+    return os.path.join(tenant_dir(tenant), 'backups') if tenant else BACKUP_DIR
+
+class _BackupRestarted(Exception):
+    pass
+
+def list_backups():
+    """Snapshots in BACKUP_DIR, newest first"""
+    try:
+        names = sorted((n for n in os.listdir(backup_dir()) if BACKUP_NAME_PATTERN.match(n)), reverse=True)
+    except FileNotFoundError:
+        return []
+    backups = []
+    for name in names:
+        stat = os.stat(os.path.join(backup_dir(), name))
+        backups.append({'name': name, 'size': stat.st_size,
+                        'created': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')})
+    return backups
+
+def check_database_file(path):
+    """Raise ValueError unless path is an intact database with the app's tables"""
+    try:
+        conn = get_db(path, read_only=True)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f'Not a usable database: {e}')
+    if result != 'ok':
+        raise ValueError(f'Integrity check failed: {result}')
+    missing = [table for table in BACKUP_REQUIRED_TABLES if table not in tables]
+    if missing:
+        raise ValueError(f'Missing tables: {", ".join(missing)}')
+
+def _copy_database(source, dest):
+    """Copy source into dest with the backup API, BACKUP_PAGES_PER_STEP pages at a time"""
+    state = {'remaining': None, 'restarts': 0}
+    
+    def progress(status, remaining, total):
+        # A write to the source between steps restarts the copy from the first page
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+        time.sleep(BACKUP_STEP_PAUSE)
     
-    # Load attendance for this event with user details
-    cursor.execute('''
-        SELECT a.*, u.name, u.email, u.id, u.phone
-        FROM attendance a
-        LEFT JOIN users u ON a.user_id = u.user_id
-        WHERE a.event_id = ?
-        ORDER BY a.attendance_date ASC, a.attendance_date ASC
-    ''', (event_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    try:
+        source.backup(dest, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+    except _BackupRestarted:
+        # Too busy to finish in steps: copy in one pass. Under WAL that reads one snapshot
+        # and still doesn't block writers; in rollback mode it holds them off until done.
+        source.backup(dest)
+
+def _sync_qr_backup():
+    """Copy QR files that are new or changed since the last backup; returns how many were copied.
     
-    attendance_data = []
-    for row in rows:
-        record = dict(row)
-        # Parse attendance date
-        att_date_str = record.get('attendance_date', '')
-        if 'T' in att_date_str:
-            att_date = att_date_str.split('T')[0]
-            att_time = att_date_str.split('T')[1].split('.')[0]
-        else:
-            att_date = att_date_str
-            att_time = 'N/A'
+    Files are never removed from the copy, so an older snapshot still finds its users' codes.
+    """
+    target_dir = os.path.join(backup_dir(), 'qr_codes')
+    copied = 0
+    for dirpath, _, filenames in os.walk(qr_storage_dir()):
+        for filename in filenames:
+            if filename.endswith('.tmp'):
+                continue
+            src = os.path.join(dirpath, filename)
+            dst = os.path.join(target_dir, os.path.relpath(src, qr_storage_dir()))
+            try:
+                src_stat = os.stat(src)
+                dst_stat = os.stat(dst)
+                if (dst_stat.st_size, dst_stat.st_mtime_ns) == (src_stat.st_size, src_stat.st_mtime_ns):
+                    continue
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            try:
+                shutil.copy2(src, dst)  # Keeps the mtime for the next comparison
+                copied += 1
+            except FileNotFoundError:
+                pass  # Removed since the walk (deleted user, GC)
+    return copied
+
+def backup_database():
+    """Write a compressed, checked snapshot of the database and sync the QR copy; returns the snapshot name"""
+    with _backup_lock:
+        started = time.perf_counter()
+        os.makedirs(backup_dir(), exist_ok=True)
+        name = f"yep_id-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db.gz"
+        path = os.path.join(backup_dir(), name)
+        copy_path = os.path.join(backup_dir(), f'.{name}.db')
         
-        attendance_data.append({
-            'name': record.get('name', 'Unknown'),
-            'email': record.get('email', 'Unknown'),
-            'id': record.get('id', 'N/A'),
-            'phone': record.get('phone', 'N/A'),
-            'attendance_date': att_date,
-            'attendance_time': att_time,
-            'points_earned': record.get('points_earned', event.get('event_points', 0))
-        })
+        source = get_db()
+        dest = sqlite3.connect(copy_path)
+        try:
+            _copy_database(source, dest)
+            dest.execute('PRAGMA journal_mode=DELETE')  # Self-contained file, no -wal alongside
+        finally:
+            dest.close()
+            source.close()
+        
+        try:
+            check_database_file(copy_path)
+            with open(copy_path, 'rb') as src, gzip.open(f'{path}.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            try:
+                os.link(f'{path}.tmp', path)  # Unlike os.replace, never overwrites an existing snapshot
+            except FileExistsError:
+                raise ValueError(f'Snapshot {name} already exists')
+        finally:
+            os.remove(copy_path)
+            if os.path.exists(f'{path}.tmp'):
+                os.remove(f'{path}.tmp')
+        
+        copied = _sync_qr_backup()
+        if BACKUP_KEEP > 0:
+            for old in list_backups()[BACKUP_KEEP:]:
+                os.remove(os.path.join(backup_dir(), old['name']))
+        metric_observe('yepid_backup_seconds', time.perf_counter() - started)
+        print(f"Backup {name} written ({copied} QR files copied)")
+        return name
+
+def restore_backup(name):
+    """Replace the database with a snapshot (a name in BACKUP_DIR or a path); returns the
+    name of the snapshot of the replaced database.
+    
+    The snapshot is unpacked and checked before anything is touched, and copied in with a
+    single write transaction, so requests see either the old or the restored data.
+    QR files the restored users need are copied back from the QR backup if missing.
+    """
+    path = name if os.path.exists(name) else os.path.join(backup_dir(), name)
+    if not os.path.isfile(path):
+        raise ValueError(f'No backup at {path}')
     
-    # Sort by attendance date and time
-    attendance_data.sort(key=lambda x: (x['attendance_date'], x['attendance_time']))
+    with _backup_lock:
+        os.makedirs(backup_dir(), exist_ok=True)
+        unpacked = os.path.join(backup_dir(), '.restore.db')
+        try:
+            try:
+                with gzip.open(path, 'rb') as src, open(unpacked, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            except (OSError, EOFError) as e:
+                raise ValueError(f'Not a readable snapshot: {e}')
+            check_database_file(unpacked)
+            
+            previous = backup_database()
+            source = sqlite3.connect(unpacked)
+            dest = get_db()
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+                source.close()
+        finally:
+            if os.path.exists(unpacked):
+                os.remove(unpacked)
+        
+        init_db()  # Brings an older snapshot up to the current schema
+        invalidate_todays_events()
+        
+        qr_backup_dir = os.path.join(backup_dir(), 'qr_codes')
+        conn = get_db()
+        qr_paths = [row[0] for row in conn.execute('SELECT path FROM qr_files')]
+        conn.close()
+        for relpath in qr_paths:
+            src = os.path.join(qr_backup_dir, relpath)
+            dst = os.path.join(qr_storage_dir(), relpath)
+            if not os.path.exists(dst) and os.path.exists(src):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+        return previous
+
+def _format_attendance_record(record, event):
+    """Flatten a joined attendance row into the columns used by the Excel exports"""
+    att_date_str = record.get('attendance_date') or ''
+    if 'T' in att_date_str:
+        att_date = att_date_str.split('T')[0]
+        att_time = att_date_str.split('T')[1].split('.')[0]
+    else:
+        att_date = att_date_str
+        att_time = 'N/A'
     
-    # Create Excel workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Attendance Records"
+    points_earned = record.get('points_earned')
+    if points_earned is None:
+        points_earned = event.get('event_points', 0)
+    
+    return {
+        'user_id': record.get('user_id'),
+        'name': record.get('name') or 'Unknown',
+        'email': record.get('email') or 'Unknown',
+        'id': record.get('id') or 'N/A',
+        'phone': record.get('phone') or 'N/A',
+        'attendance_date': att_date,
+        'attendance_time': att_time,
+        'points_earned': points_earned
+    }
+
+def _style_header_row(ws, headers):
+    """Write a bold, filled header row to a worksheet"""
+    from openpyxl.styles import Font, Alignment, PatternFill
     
-    # Header row
-    headers = ['#', 'Name', 'ID', 'Email', 'Phone', 'Points Earned', 'Attendance Date', 'Attendance Time']
     header_fill = PatternFill(start_color="002e6a", end_color="002e6a", fill_type="solid")
     header_font = Font(bold=True, color="FFFFFF", size=12)
     
@@ -1420,6 +3271,20 @@ def export_attendance(event_id):
         cell.fill = header_fill
         cell.font = header_font
         cell.alignment = Alignment(horizontal='center', vertical='center')
+
+def build_attendance_workbook(event, attendance_data):
+    """Build the attendance workbook for a single event"""
+    # Sort by attendance date and time
+    attendance_data = sorted(attendance_data, key=lambda x: (x['attendance_date'], x['attendance_time']))
+    
+    # Create Excel workbook
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Attendance Records"
+    
+    # Header row
+    _style_header_row(ws, ['#', 'Name', 'ID', 'Email', 'Phone', 'Points Earned', 'Attendance Date', 'Attendance Time'])
     
     # Data rows
     for row_num, record in enumerate(attendance_data, 2):
@@ -1456,13 +3321,62 @@ def export_attendance(event_id):
     ws_info.column_dimensions['A'].width = 20
     ws_info.column_dimensions['B'].width = 40
     
-    # Save to BytesIO
+    return wb
+
+def _safe_filename_part(value):
+    """Strip characters that are not safe in a download filename"""
+    return "".join(c for c in (value or '') if c.isalnum() or c in (' ', '-', '_')).strip()
+
+def _workbook_bytes(wb):
+    """Serialize a workbook to bytes"""
     excel_buffer = BytesIO()
     wb.save(excel_buffer)
-    excel_buffer.seek(0)
+    return excel_buffer.getvalue()
+
+def _render_event_export(job):
+    """Render one event's workbook for a bulk export (runs in a worker process for large exports)"""
+    event, attendance_data = job
+    event_name_safe = _safe_filename_part(event.get('event_name', 'Event')) or 'Event'
+    filename = f"{event.get('event_date') or event.get('event_year', '')}_{event_name_safe}_{event['event_id'][:8]}.xlsx"
+    return filename, _workbook_bytes(build_attendance_workbook(event, attendance_data))
+
+class _ZipStreamBuffer:
+    """Write-only file object so zipfile output can be yielded as it is produced"""
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+@app.route('/events/<event_id>/export')
+@login_required
+def export_attendance(event_id):
+    """Export attendance records to Excel file"""
+    event = reports.get_event(event_id)
+    if not event:
+        flash('Event not found.', 'error')
+        return redirect(url_for('events'))
+    
+    # Load attendance for this event with user details
+    rows = reports.list_event_attendance(event, oldest_first=True)
+    
+    attendance_data = [_format_attendance_record(row, event) for row in rows]
+    wb = build_attendance_workbook(event, attendance_data)
+    
+    # Save to BytesIO
+    excel_buffer = BytesIO(_workbook_bytes(wb))
     
     # Generate filename
-    event_name_safe = "".join(c for c in event.get('event_name', 'Event') if c.isalnum() or c in (' ', '-', '_')).strip()
+    event_name_safe = _safe_filename_part(event.get('event_name', 'Event'))
     filename = f"Attendance_{event_name_safe}_{event.get('event_year', '')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
     
     return send_file(
@@ -1472,58 +3386,158 @@ def export_attendance(event_id):
         download_name=filename
     )
 
+@app.route('/events/export')
+@login_required
+def bulk_export_attendance():
+    """Export attendance for many events at once (by year, category and/or date range)"""
+    year = request.args.get('year', '').strip()
+    category = request.args.get('category', '').strip()
+    date_from = request.args.get('date_from', '').strip()
+    date_to = request.args.get('date_to', '').strip()
+    export_format = request.args.get('format', 'zip')
+    
+    if not (year or category or date_from or date_to):
+        flash('Please choose a year, category or date range to export.', 'error')
+        return redirect(url_for('events'))
+    
+    rows = reports.list_attendance_export(year, category, date_from, date_to)
+    if not rows:
+        flash('No events match the selected filters.', 'warning')
+        return redirect(url_for('events'))
+    
+    # Group rows per event and build the per-user summary in the same pass
+    grouped = {}
+    summary = {}
+    for record in rows:
+        event_id = record['event_id']
+        if event_id not in grouped:
+            event = {key: record[key] for key in (
+                'event_id', 'event_name', 'event_year', 'event_date', 'event_time',
+                'event_description', 'event_category', 'event_points')}
+            grouped[event_id] = (event, [])
+        event, attendance_data = grouped[event_id]
+        
+        if record['attendance_id'] is None:
+            continue  # Event without attendance
+        
+        formatted = _format_attendance_record(record, event)
+        attendance_data.append(formatted)
+        
+        totals = summary.setdefault(record['user_id'], {
+            'name': formatted['name'],
+            'id': formatted['id'],
+            'email': formatted['email'],
+            'events_attended': 0,
+            'total_points': 0
+        })
+        totals['events_attended'] += 1
+        totals['total_points'] += formatted['points_earned'] or 0
+    
+    label = '_'.join(_safe_filename_part(part) for part in (year, category, date_from, date_to) if part) or 'All'
+    stamp = datetime.now().strftime('%Y%m%d')
+    
+    if export_format == 'workbook':
+        wb = build_bulk_export_workbook(list(grouped.values()), summary)
+        return send_file(
+            BytesIO(_workbook_bytes(wb)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f"Attendance_{label}_{stamp}.xlsx"
+        )
+    
+    jobs = list(grouped.values())
+    
+    def generate():
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            if len(jobs) >= EXPORT_PARALLEL_THRESHOLD:
+                # Large export: render workbooks in parallel across events, on the shared pool
+                # (map cancels what is left if the download is abandoned)
+                rendered = process_pool().map(_render_event_export, jobs, chunksize=4)
+                for filename, data in rendered:
+                    # xlsx files are already compressed
+                    archive.writestr(filename, data, compress_type=zipfile.ZIP_STORED)
+                    yield buffer.drain()
+            else:
+                for job in jobs:
+                    filename, data = _render_event_export(job)
+                    archive.writestr(filename, data, compress_type=zipfile.ZIP_STORED)
+                    yield buffer.drain()
+            
+            summary_wb = build_bulk_export_workbook(jobs, summary)
+            archive.writestr('Summary.xlsx', _workbook_bytes(summary_wb), compress_type=zipfile.ZIP_STORED)
+        yield buffer.drain()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="Attendance_{label}_{stamp}.zip"'}
+    )
+
+def build_bulk_export_workbook(grouped_events, summary):
+    """Build a combined attendance sheet, a per-user summary and an events overview"""
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "All Attendance"
+    _style_header_row(ws, ['#', 'Event', 'Event Date', 'Name', 'ID', 'Email', 'Phone', 'Points Earned', 'Attendance Date', 'Attendance Time'])
+    
+    row_num = 2
+    for event, attendance_data in grouped_events:
+        for record in attendance_data:
+            ws.append([
+                row_num - 1,
+                event.get('event_name'),
+                event.get('event_date'),
+                record['name'],
+                record['id'],
+                record['email'],
+                record['phone'],
+                record['points_earned'],
+                record['attendance_date'],
+                record['attendance_time']
+            ])
+            row_num += 1
+    
+    for column, width in zip('ABCDEFGHIJ', (8, 30, 14, 30, 15, 35, 20, 15, 18, 18)):
+        ws.column_dimensions[column].width = width
+    
+    # Per-user summary, highest points first
+    ws_summary = wb.create_sheet("Participant Summary")
+    _style_header_row(ws_summary, ['#', 'Name', 'ID', 'Email', 'Events Attended', 'Total Points'])
+    ranked = sorted(summary.values(), key=lambda x: (-x['total_points'], -x['events_attended'], x['name']))
+    for index, totals in enumerate(ranked, 1):
+        ws_summary.append([index, totals['name'], totals['id'], totals['email'], totals['events_attended'], totals['total_points']])
+    
+    for column, width in zip('ABCDEF', (8, 30, 15, 35, 16, 14)):
+        ws_summary.column_dimensions[column].width = width
+    
+    # Events overview
+    ws_events = wb.create_sheet("Events")
+    _style_header_row(ws_events, ['Event Name', 'Category', 'Year', 'Event Date', 'Points', 'Total Attendance'])
+    for event, attendance_data in grouped_events:
+        ws_events.append([
+            event.get('event_name'),
+            event.get('event_category') or 'N/A',
+            event.get('event_year'),
+            event.get('event_date'),
+            event.get('event_points') or 0,
+            len(attendance_data)
+        ])
+    
+    for column, width in zip('ABCDEF', (30, 15, 8, 14, 10, 18)):
+        ws_events.column_dimensions[column].width = width
+    
+    return wb
+
 @app.route('/leaderboard')
 @login_required
 def leaderboard():
     """View points leaderboard"""
     year = request.args.get('year', '')
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Build query with optional year filter
-    if year:
-        query = '''
-            SELECT 
-                u.user_id,
-                u.name,
-                u.email,
-                u.id,
-                COALESCE(SUM(a.points_earned), 0) as total_points,
-                COUNT(a.attendance_id) as events_attended
-            FROM users u
-            LEFT JOIN attendance a ON u.user_id = a.user_id AND a.event_year = ?
-            GROUP BY u.user_id, u.name, u.email, u.id
-            HAVING total_points > 0
-            ORDER BY total_points DESC, events_attended DESC
-        '''
-        cursor.execute(query, (year,))
-    else:
-        query = '''
-            SELECT 
-                u.user_id,
-                u.name,
-                u.email,
-                u.id,
-                COALESCE(SUM(a.points_earned), 0) as total_points,
-                COUNT(a.attendance_id) as events_attended
-            FROM users u
-            LEFT JOIN attendance a ON u.user_id = a.user_id
-            GROUP BY u.user_id, u.name, u.email, u.id
-            HAVING total_points > 0
-            ORDER BY total_points DESC, events_attended DESC
-        '''
-        cursor.execute(query)
-    
-    rows = cursor.fetchall()
-    leaderboard_data = [dict(row) for row in rows]
-    
+    leaderboard_data = reports.leaderboard(year)
     # Get available years for filter
-    cursor.execute('SELECT DISTINCT event_year FROM attendance WHERE event_year IS NOT NULL AND event_year != "" ORDER BY event_year DESC')
-    year_rows = cursor.fetchall()
-    available_years = [row[0] for row in year_rows]
-    
-    conn.close()
+    available_years = reports.list_attendance_years()
     
     return render_template('leaderboard.html', 
                          leaderboard=leaderboard_data, 
@@ -1534,86 +3548,73 @@ def leaderboard():
 @login_required
 def generate_qr():
     """Generate QR code page"""
-    qr_image = None
     qr_data = None
     
     if request.method == 'POST':
         data = request.form.get('qr_data', '').strip()
         
         if data:
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(data)
-            qr.make(fit=True)
-            
-            # Create image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to base64 for display
-            img_buffer = BytesIO()
-            img.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-            qr_image = f"data:image/png;base64,{img_base64}"
+            # The preview is served by qr_image, so the page itself stays small and cacheable
             qr_data = data
-            
             flash('QR code generated successfully!', 'success')
         else:
             flash('Please enter data to generate QR code.', 'error')
     
-    return render_template('generate.html', qr_image=qr_image, qr_data=qr_data)
+    return render_template('generate.html', qr_data=qr_data)
+
+@app.route('/qr')
+@login_required
+def qr_image():
+    """Render a QR code for display (SVG at screen size unless asked otherwise)"""
+    data = request.args.get('data', '')
+    preset = request.args.get('preset', 'screen')
+    fmt = request.args.get('format', 'svg')
+    if not data or preset not in QR_PRESETS or fmt not in QR_FORMATS:
+        return Response('Bad QR code request', status=400, mimetype='text/plain')
+    
+    try:
+        image = render_qr(data, preset, fmt)
+    except ValueError:
+        return Response('QR code data is too long', status=400, mimetype='text/plain')
+    response = Response(image, mimetype=QR_FORMATS[fmt])
+    # The image depends only on the URL
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
 
 @app.route('/scan', methods=['GET', 'POST'])
 @login_required
 def scan_qr():
     """QR code scanning page"""
-    return render_template('scan.html')
+    return render_template('scan.html', todays_events=todays_events())
 
 @app.route('/api/scan/process', methods=['POST'])
-@login_required
+@scan_access_required
 def process_scan():
     """Process scanned QR code data"""
-    data = request.get_json()
-    scanned_data = data.get('qr_data', '')
+    data = request.get_json(silent=True)
+    scanned_data = data.get('qr_data', '') if isinstance(data, dict) else ''
     
     if scanned_data:
-        return json.dumps({'success': True, 'data': scanned_data})
+        return jsonify(success=True, data=scanned_data)
     else:
-        return json.dumps({'success': False, 'error': 'No QR code data provided'}), 400
+        return jsonify(success=False, error='No QR code data provided'), 400
 
 @app.route('/download_qr')
 @login_required
 def download_qr():
     """Download QR code as image"""
     data = request.args.get('data', '')
+    preset = request.args.get('preset', 'screen')
+    fmt = request.args.get('format', 'png')
     
-    if data:
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        return send_file(img_buffer, mimetype='image/png', as_attachment=True, download_name='qrcode.png')
+    if data and preset in QR_PRESETS and fmt in QR_FORMATS:
+        try:
+            img_buffer = BytesIO(render_qr(data, preset, fmt))
+        except ValueError:
+            return Response('QR code data is too long', status=400, mimetype='text/plain')
+        return send_file(img_buffer, mimetype=QR_FORMATS[fmt], as_attachment=True, download_name=f'qrcode.{fmt}')
     
-    flash('No data provided for QR code.', 'error')
+    flash('No data provided for QR code.' if not data else 'Unknown QR code size or format.', 'error')
     return redirect(url_for('generate_qr'))
 
 @app.route('/analytics')
@@ -1657,47 +3658,19 @@ def advanced_search():
     }
     
     if query:
-        conn = get_db()
-        cursor = conn.cursor()
-        
         if search_type in ['all', 'users']:
-            # Search users
-            cursor.execute('''
-                SELECT * FROM users 
-                WHERE name LIKE ? OR email LIKE ? OR id LIKE ? OR phone LIKE ? OR zone LIKE ?
-                ORDER BY registration_date DESC
-                LIMIT 50
-            ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%'))
-            results['users'] = [dict(row) for row in cursor.fetchall()]
-        
+            results['users'] = reports.search_users(query)
         if search_type in ['all', 'events']:
-            # Search events
-            cursor.execute('''
-                SELECT * FROM events 
-                WHERE event_name LIKE ? OR event_description LIKE ? OR event_category LIKE ?
-                ORDER BY event_date DESC
-                LIMIT 50
-            ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
-            results['events'] = [dict(row) for row in cursor.fetchall()]
-        
+            results['events'] = reports.search_events(query)
         if search_type in ['all', 'attendance']:
-            # Search attendance with user and event details
-            cursor.execute('''
-                SELECT a.*, u.name as user_name, u.email as user_email, u.id as user_id_display,
-                       e.event_name, e.event_date
-                FROM attendance a
-                LEFT JOIN users u ON a.user_id = u.user_id
-                LEFT JOIN events e ON a.event_id = e.event_id
-                WHERE u.name LIKE ? OR u.email LIKE ? OR e.event_name LIKE ?
-                ORDER BY a.attendance_date DESC
-                LIMIT 50
-            ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
-            results['attendance'] = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+            # Attendance with user and event details
+            results['attendance'] = reports.search_attendance(query)
     
     return render_template('advanced_search.html', results=results, query=query, search_type=search_type)
 
+# Bulk message recipient filters -> the user field they match
+RECIPIENT_FILTERS = {'zone': 'zone', 'age_group': 'youth_age_group', 'classification': 'youth_classification'}
+
 @app.route('/bulk-messaging', methods=['GET', 'POST'])
 @login_required
 def bulk_messaging():
@@ -1714,22 +3687,8 @@ def bulk_messaging():
             return redirect(url_for('bulk_messaging'))
         
         # Get recipients based on filter
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        if recipient_filter == 'all':
-            cursor.execute('SELECT email, name FROM users WHERE email IS NOT NULL AND email != ""')
-        elif recipient_filter == 'zone':
-            cursor.execute('SELECT email, name FROM users WHERE zone = ? AND email IS NOT NULL AND email != ""', (filter_value,))
-        elif recipient_filter == 'age_group':
-            cursor.execute('SELECT email, name FROM users WHERE youth_age_group = ? AND email IS NOT NULL AND email != ""', (filter_value,))
-        elif recipient_filter == 'classification':
-            cursor.execute('SELECT email, name FROM users WHERE youth_classification = ? AND email IS NOT NULL AND email != ""', (filter_value,))
-        else:
-            cursor.execute('SELECT email, name FROM users WHERE email IS NOT NULL AND email != ""')
-        
-        recipients = cursor.fetchall()
-        conn.close()
+        column = RECIPIENT_FILTERS.get(recipient_filter)
+        recipients = repository.list_recipients(column, filter_value) if column else repository.list_recipients()
         
         # Send emails
         sent_count = 0
@@ -1763,19 +3722,9 @@ def bulk_messaging():
         return redirect(url_for('bulk_messaging'))
     
     # Get filter options
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT DISTINCT zone FROM users WHERE zone IS NOT NULL AND zone != "" ORDER BY zone')
-    zones = [row[0] for row in cursor.fetchall()]
-    
-    cursor.execute('SELECT DISTINCT youth_age_group FROM users WHERE youth_age_group IS NOT NULL AND youth_age_group != "" ORDER BY youth_age_group')
-    age_groups = [row[0] for row in cursor.fetchall()]
-    
-    cursor.execute('SELECT DISTINCT youth_classification FROM users WHERE youth_classification IS NOT NULL AND youth_classification != "" ORDER BY youth_classification')
-    classifications = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
+    zones = repository.list_user_groups('zone')
+    age_groups = repository.list_user_groups('youth_age_group')
+    classifications = repository.list_user_groups('youth_classification')
     
     return render_template('bulk_messaging.html', zones=zones, age_groups=age_groups, classifications=classifications)
 
@@ -1783,27 +3732,16 @@ def bulk_messaging():
 @login_required
 def send_event_reminders(event_id):
     """Send reminder emails for an event"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get event
-    cursor.execute('SELECT * FROM events WHERE event_id = ?', (event_id,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    event = repository.get_event(event_id)
+    if not event:
         flash('Event not found.', 'error')
         return redirect(url_for('events'))
-    event = dict(row)
-    
-    # Get all registered users
-    cursor.execute('SELECT email, name FROM users WHERE email IS NOT NULL AND email != ""')
-    users = cursor.fetchall()
-    conn.close()
     
     sent_count = 0
     failed_count = 0
+    notifications = []
     
-    for user_email, user_name in users:
+    for user_id, user_email, user_name in repository.list_user_contacts():
         try:
             send_event_reminder(
                 user_email,
@@ -1813,20 +3751,271 @@ def send_event_reminders(event_id):
                 event.get('event_time', '')
             )
             sent_count += 1
+            notifications.append({
+                'user_id': user_id,
+                'event_id': event_id,
+                'notification_type': 'event_reminder',
+                'notification_title': f"Reminder: {event.get('event_name', 'Event')}",
+                'notification_message': f"{event.get('event_date', '')} {event.get('event_time', '')}".strip()
+            })
         except Exception as e:
             print(f"Error sending reminder to {user_email}: {e}")
             failed_count += 1
     
-    # Mark reminders as sent
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE events SET reminder_sent = 1 WHERE event_id = ?', (event_id,))
-    conn.commit()
-    conn.close()
+    # Record who was reminded and mark reminders as sent
+    repository.add_notifications(notifications)
+    repository.mark_reminder_sent(event_id)
     
     flash(f'Event reminders sent! {sent_count} emails sent successfully, {failed_count} failed.', 'success' if failed_count == 0 else 'warning')
     return redirect(url_for('event_detail', event_id=event_id))
 
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    """Per-route timing, SQL counts and recent slow queries for this process"""
+    with _metrics_lock:
+        routes = []
+        for endpoint, stats in route_metrics.items():
+            requests_count = stats['requests']
+            routes.append({
+                'endpoint': endpoint,
+                'requests': requests_count,
+                'avg_ms': round(stats['total_ms'] / requests_count, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'total_ms': round(stats['total_ms'], 2),
+                'avg_sql_count': round(stats['sql_count'] / requests_count, 2),
+                'avg_sql_ms': round(stats['sql_ms'] / requests_count, 2),
+                'avg_template_ms': round(stats['template_ms'] / requests_count, 2)
+            })
+        slow_queries = list(recent_slow_queries)
+    
+    routes.sort(key=lambda r: r['total_ms'], reverse=True)
+    return jsonify({
+        'pid': os.getpid(),
+        'slow_query_threshold_ms': SLOW_QUERY_MS,
+        'routes': routes,
+        'slow_queries': slow_queries[::-1]
+    })
+
+@app.route('/admin/backups', methods=['GET', 'POST'])
+@login_required
+def backups():
+    """List database snapshots and start a backup"""
+    if request.method == 'POST':
+        submit_background_job(backup_database)
+        flash('Backup started. It will appear below when it is done.', 'success')
+        return redirect(url_for('backups'))
+    return render_template('backups.html', backups=list_backups(), backup_dir=backup_dir())
+
+@app.route('/admin/backups/<name>')
+@login_required
+def download_backup(name):
+    """Download a database snapshot"""
+    if not BACKUP_NAME_PATTERN.match(name) or not os.path.isfile(os.path.join(backup_dir(), name)):
+        flash('Backup not found.', 'error')
+        return redirect(url_for('backups'))
+    return send_file(os.path.join(backup_dir(), name), mimetype='application/gzip', as_attachment=True, download_name=name)
+
+@app.route('/admin/tenants')
+@login_required
+def tenants():
+    """Registrations and attendance of every barangay (main site only)"""
+    if current_tenant():
+        flash('The barangay overview is only available on the main site.', 'error')
+        return redirect(url_for('dashboard'))
+    rows = tenant_report()
+    totals = {key: sum(stats[key] for _, stats, _ in rows if stats)
+              for key in ('total_users', 'total_events', 'total_attendance', 'total_points')}
+    return render_template('tenants.html', rows=rows, totals=totals)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of check-in, email, QR and database metrics (all workers)"""
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif request.remote_addr not in ('127.0.0.1', '::1') or 'X-Forwarded-For' in request.headers:
+        # A request relayed by a local reverse proxy comes from loopback too, so those are refused
+        return Response('Forbidden: set METRICS_TOKEN to scrape from another host\n', status=403, mimetype='text/plain')
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Account management: flask --app app <command>
+@app.cli.command('create-account')
+@click.argument('username')
+@click.option('--role', type=click.Choice(ACCOUNT_ROLES), default='admin', show_default=True)
+def create_account_command(username, role):
+    """Create an admin account (prompts for a password) or a token-only scanner account"""
+    create_app()
+    password = click.prompt('Password', hide_input=True, confirmation_prompt=True) if role == 'admin' else None
+    try:
+        create_account(username, password, role)
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"Account '{username}' already exists")
+    click.echo(f"Created {role} account '{username}'")
+
+@app.cli.command('set-password')
+@click.argument('username')
+def set_password_command(username):
+    """Change an account's password"""
+    create_app()
+    password = click.prompt('New password', hide_input=True, confirmation_prompt=True)
+    if not update_account(username, password_hash=generate_password_hash(password)):
+        raise click.ClickException(f"No account named '{username}'")
+    click.echo(f"Password updated for '{username}'")
+
+@app.cli.command('disable-account')
+@click.argument('username')
+@click.option('--enable', is_flag=True, help='Re-enable the account instead')
+def disable_account_command(username, enable):
+    """Disable (or re-enable) an account; its API tokens stop working while disabled"""
+    create_app()
+    if not update_account(username, is_active=1 if enable else 0):
+        raise click.ClickException(f"No account named '{username}'")
+    click.echo(f"Account '{username}' {'enabled' if enable else 'disabled'}")
+
+@app.cli.command('create-token')
+@click.argument('username')
+@click.option('--label', default='', help='Where the token is used, e.g. "Gate A kiosk"')
+def create_token_command(username, label):
+    """Issue a long-lived scan API token for an account"""
+    create_app()
+    if not get_account(username):
+        raise click.ClickException(f"No account named '{username}'")
+    token_id, token = create_api_token(username, label)
+    click.echo(f"Token {token_id} for '{username}' (shown once, store it on the scanner):")
+    click.echo(token)
+
+@app.cli.command('revoke-token')
+@click.argument('token_id')
+def revoke_token_command(token_id):
+    """Revoke an API token by its ID"""
+    create_app()
+    if not revoke_api_token(token_id):
+        raise click.ClickException(f"No token with ID '{token_id}'")
+    click.echo(f"Token {token_id} revoked")
+
+@app.cli.command('list-accounts')
+def list_accounts_command():
+    """List accounts and their API tokens"""
+    create_app()
+    conn = get_db()
+    accounts = conn.execute('SELECT username, role, is_active, last_login FROM admin_accounts ORDER BY username').fetchall()
+    tokens = conn.execute('SELECT token_id, username, label, revoked, last_used FROM api_tokens ORDER BY created_date').fetchall()
+    conn.close()
+    for account in accounts:
+        status = 'active' if account['is_active'] else 'disabled'
+        click.echo(f"{account['username']} ({account['role']}, {status}, last login {account['last_login'] or 'never'})")
+        for token in tokens:
+            if token['username'].lower() == account['username'].lower():
+                last_used = datetime.fromtimestamp(token['last_used']).isoformat(timespec='seconds') if token['last_used'] else 'never'
+                click.echo(f"    token {token['token_id']} {token['label'] or ''} "
+                           f"{'revoked' if token['revoked'] else 'active'}, last used {last_used}")
+
+# QR storage maintenance
+@app.cli.command('migrate-qr-storage')
+def migrate_qr_storage_command():
+    """Move QR codes from the flat layout into hash-prefix shards (also runs at startup)"""
+    create_app()
+    click.echo(f"Moved {migrate_qr_storage()} QR codes into shards")
+
+@app.cli.command('gc-qr-codes')
+@click.option('--dry-run', is_flag=True, help='List orphaned files without deleting them')
+@click.option('--min-age', default=60, show_default=True, help='Keep files written in the last N minutes')
+def gc_qr_codes_command(dry_run, min_age):
+    """Delete QR files whose user no longer exists"""
+    create_app()
+    orphans = gc_qr_files(min_age_seconds=min_age * 60, dry_run=dry_run)
+    for path in orphans:
+        click.echo(path)
+    click.echo(f"{'Would delete' if dry_run else 'Deleted'} {len(orphans)} orphaned QR files")
+
+@app.cli.command('purge-deleted')
+def purge_deleted_command():
+    """Finish removing deleted users and events (normally done in the background)"""
+    create_app()
+    purge_deleted_records()
+    click.echo("Deleted users and events purged")
+
+# Attendance archive
+@app.cli.command('archive-year')
+@click.argument('year')
+def archive_year_command(year):
+    """Move a closed year's attendance into its archive table (re-run to finish an interrupted move)"""
+    create_app()
+    try:
+        moved = archive_attendance_year(year)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Archived {moved} attendance records from {year}")
+
+@app.cli.command('list-archives')
+def list_archives_command():
+    """List archived years"""
+    create_app()
+    conn = get_db()
+    archives = conn.execute('SELECT * FROM attendance_archives ORDER BY event_year DESC').fetchall()
+    conn.close()
+    for archive in archives:
+        status = f"{archive['row_count']} records, completed {archive['completed_date']}" if archive['completed_date'] \
+            else f"in progress since {archive['started_date']}"
+        click.echo(f"{archive['event_year']}: {status}")
+
+# Backups
+@app.cli.command('backup')
+def backup_command():
+    """Write a compressed snapshot of the database and copy new QR files (safe while the app runs)"""
+    create_app()
+    try:
+        name = backup_database()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {os.path.join(backup_dir(), name)}")
+
+@app.cli.command('list-backups')
+def list_backups_command():
+    """List database snapshots, newest first"""
+    for backup in list_backups():
+        click.echo(f"{backup['name']}  {backup['size'] / 1024:.0f} KB  {backup['created']}")
+
+@app.cli.command('restore')
+@click.argument('name')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation')
+def restore_command(name, yes):
+    """Replace the database with a snapshot (name in BACKUP_DIR or a path); the current data is backed up first"""
+    create_app()
+    if not yes:
+        click.confirm(f"Replace the database with {name}?", abort=True)
+    try:
+        previous = restore_backup(name)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored {name} (the replaced database was saved as {previous})")
+
+# Tenants (other commands work on one with TENANT=<slug>)
+@app.cli.command('create-tenant')
+@click.argument('slug')
+def create_tenant_command(slug):
+    """Set up a barangay in TENANTS_DIR/<slug>/ with its own database and QR codes"""
+    create_app()
+    try:
+        create_tenant(slug)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Created tenant {slug} in {tenant_dir(slug)}")
+
+@app.cli.command('list-tenants')
+def list_tenants_command():
+    """List tenants with their registration and attendance totals"""
+    for slug, stats, error in tenant_report():
+        if stats:
+            click.echo(f"{slug}: {stats['total_users']} users, {stats['total_events']} events, "
+                       f"{stats['total_attendance']} check-ins")
+        else:
+            click.echo(f"{slug}: error: {error}")
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; use wsgi.py (gunicorn or waitress) in production
+    debug = os.environ.get('FLASK_DEBUG', 'true').lower() in ['true', 'on', '1']
+    reset_metrics_dir()
+    create_app().run(debug=debug, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)))
 
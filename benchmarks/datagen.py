@@ -0,0 +1,183 @@
+"""Seeded synthetic dataset generator for benchmarks.
+
+Builds a realistic SAN AGUSTIN YEP ID database with N users, M events and
+their attendance. The same seed always produces the same data.
+
+    python benchmarks/datagen.py --database bench.db --users 5000 --events 150 --seed 42
+"""
+import argparse
+import os
+import random
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+
+# Value distributions (value, weight) modelled on the registration form
+ZONES = [(f'Zone {i}', w) for i, w in zip(range(1, 8), (18, 16, 15, 14, 13, 12, 12))]
+SEXES = [('M', 49), ('F', 51)]
+AGE_GROUPS = [('Child (15-17 y/o)', 30), ('Core Youth (18-24 y/o)', 50), ('Young Adult (25-30 y/o)', 20)]
+CLASSIFICATIONS = [
+    ('In School Youth', 45),
+    ('Out of School Youth', 20),
+    ('Working Youth', 30),
+    ('Youth with Specific Needs', 5),
+]
+CIVIL_STATUSES = [('Single', 88), ('Married', 10), ('Separated', 1), ('Widowed', 1)]
+EDUCATION = [
+    ('High School Level', 25), ('High School Graduate', 25), ('College Level', 25),
+    ('College Graduate', 15), ('Vocational Graduate', 7), ('Elementary Graduate', 3),
+]
+WORK_STATUSES = [
+    ('Not Applicable (e.g., Student)', 45), ('Employed', 25), ('Unemployed', 10),
+    ('Self-Employed', 8), ('Currently Looking for a Job', 12),
+]
+YES_NO = [('Yes', 60), ('No', 40)]
+CATEGORIES = [
+    ('Workshop', 20), ('Meeting', 20), ('Activity', 20), ('Training', 15),
+    ('Seminar', 10), ('Social', 10), ('Conference', 5),
+]
+FIRST_NAMES = [
+    'Juan', 'Maria', 'Jose', 'Ana', 'Mark', 'Angel', 'John', 'Kristine', 'Paolo', 'Andrea',
+    'Carlo', 'Nicole', 'Miguel', 'Camille', 'Rafael', 'Patricia', 'Gabriel', 'Bea', 'Luis', 'Joy',
+]
+LAST_NAMES = [
+    'Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Gonzales',
+    'Bautista', 'Villanueva', 'Ramos', 'Aquino', 'Castillo', 'Rivera', 'Navarro', 'Domingo',
+]
+EVENT_WORDS = ['Youth', 'Sports', 'Leadership', 'Clean-up', 'Health', 'Career', 'Arts', 'Coding', 'Assembly', 'Summit']
+
+
+def _pick(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def make_users(rng, count, start=datetime(2023, 1, 1)):
+    """Generate user dicts in registration order"""
+    users = []
+    for i in range(1, count + 1):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        age_group = _pick(rng, AGE_GROUPS)
+        age = {'Child (15-17 y/o)': (15, 17), 'Core Youth (18-24 y/o)': (18, 24)}.get(age_group, (25, 30))
+        birthdate = date(2025 - rng.randint(*age), rng.randint(1, 12), rng.randint(1, 28))
+        registered = start + timedelta(minutes=i * rng.randint(5, 90))
+        users.append({
+            'user_id': _uuid(rng),
+            'id': f'Youth{i:03d}',
+            'name': f'{first} {last}',
+            'street': f'{rng.randint(1, 300)} {rng.choice(LAST_NAMES)} St.',
+            'zone': _pick(rng, ZONES),
+            'sex': _pick(rng, SEXES),
+            'birthdate': birthdate.isoformat(),
+            'email': f'{first.lower()}.{last.lower().replace(" ", "")}{i}@example.com',
+            'phone': f'09{rng.randint(100000000, 999999999)}',
+            'civil_status': _pick(rng, CIVIL_STATUSES),
+            'youth_age_group': age_group,
+            'youth_classification': _pick(rng, CLASSIFICATIONS),
+            'specific_needs_type': 'Not Applicable',
+            'educational_background': _pick(rng, EDUCATION),
+            'work_status': _pick(rng, WORK_STATUSES),
+            'sk_voter_registered': _pick(rng, YES_NO),
+            'sk_voted_last_election': _pick(rng, YES_NO),
+            'national_voter_registered': _pick(rng, YES_NO),
+            'attended_kk_assembly': _pick(rng, YES_NO),
+            'kk_assembly_times': rng.choice(['1-2', '3-4', '5 and above']),
+            'registration_date': registered.isoformat(),
+        })
+    return users
+
+
+def make_events(rng, count, years):
+    """Generate event dicts spread evenly over the given years"""
+    events = []
+    for i in range(count):
+        year = years[i % len(years)]
+        event_date = date(year, 1, 1) + timedelta(days=rng.randint(0, 364))
+        events.append({
+            'event_id': _uuid(rng),
+            'event_name': f'{rng.choice(EVENT_WORDS)} {rng.choice(EVENT_WORDS)} {i + 1}',
+            'event_year': str(year),
+            'event_description': 'Synthetic benchmark event. ' * rng.randint(1, 20),
+            'event_date': event_date.isoformat(),
+            'event_time': f'{rng.randint(8, 18):02d}:00',
+            'event_points': rng.choice([5, 10, 10, 15, 20, 25]),
+            'event_category': _pick(rng, CATEGORIES),
+            'event_capacity': rng.choice([None, 50, 100, 200, 500]),
+            'reminder_sent': 0,
+            'created_date': datetime(year, 1, 1).isoformat(),
+        })
+    return events
+
+
+def make_attendance(rng, users, events, attendance_rate):
+    """Each event draws a random share of users; popularity varies by event"""
+    records = []
+    user_ids = [u['user_id'] for u in users]
+    for event in events:
+        share = min(1.0, attendance_rate * rng.uniform(0.3, 1.7))
+        attendees = rng.sample(user_ids, int(len(user_ids) * share))
+        base = datetime.fromisoformat(event['event_date']).replace(hour=8)
+        for user_id in attendees:
+            scanned = (base + timedelta(seconds=rng.randint(0, 4 * 3600))).isoformat()
+            records.append((
+                _uuid(rng), event['event_id'], user_id, event['event_year'],
+                event['event_points'], scanned, scanned
+            ))
+    return records
+
+
+def generate_dataset(app_module, users=1000, events=50, attendance_rate=0.3,
+                     years=(2023, 2024, 2025), seed=42):
+    """Populate app_module.DATABASE with a seeded dataset; returns (users, events)"""
+    rng = random.Random(seed)
+    app_module.init_db()
+    user_rows = make_users(rng, users)
+    event_rows = make_events(rng, events, list(years))
+    attendance_rows = make_attendance(rng, user_rows, event_rows, attendance_rate)
+
+    conn = app_module.get_db()
+    with conn:
+        conn.executemany(app_module.INSERT_USER_SQL, [app_module.user_row(u) for u in user_rows])
+        conn.executemany('''
+            INSERT INTO events
+            (event_id, event_name, event_year, event_description, event_date, event_time,
+             event_points, event_category, event_capacity, reminder_sent, created_date)
+            VALUES (:event_id, :event_name, :event_year, :event_description, :event_date, :event_time,
+                    :event_points, :event_category, :event_capacity, :reminder_sent, :created_date)
+        ''', event_rows)
+        conn.executemany('''
+            INSERT INTO attendance
+            (attendance_id, event_id, user_id, event_year, points_earned, attendance_date, scan_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', attendance_rows)
+    conn.execute('ANALYZE')
+    conn.close()
+    return user_rows, event_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLite file to create (must not exist)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--attendance-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    os.environ['DATABASE_PATH'] = os.path.abspath(args.database)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+
+    users, events = generate_dataset(app, args.users, args.events, args.attendance_rate, seed=args.seed)
+    print(f'Created {args.database}: {len(users)} users, {len(events)} events')
+
+
+if __name__ == '__main__':
+    main()
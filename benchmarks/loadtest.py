@@ -0,0 +1,292 @@
+"""Concurrent check-in load test: K gate scanners hitting one event.
+
+Starts the app on a real multi-threaded (or multi-process) Werkzeug server
+against a seeded scratch database, with SMTP pointed at a local sink. K
+client threads log in and replay randomized QR payloads for one event:
+first-time check-ins, deliberate duplicates and invalid codes. Reports
+sustained check-ins/sec, error rates and the latency distribution.
+
+    python benchmarks/loadtest.py --clients 8 --duration 30
+    python benchmarks/loadtest.py --clients 16 --processes 4 --users 5000
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+SERVER_CODE = '''
+import sys
+sys.path.insert(0, {repo!r})
+from werkzeug.serving import run_simple
+import app
+run_simple('127.0.0.1', {port}, app.create_app(), threaded={threaded}, processes={processes})
+'''
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server that accepts and discards every message"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 loadtest smtp sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 sink')
+            elif command == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages += 1
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def prepare_dataset(workdir, args):
+    """Seed the scratch database and add the event being scanned"""
+    database = os.path.join(workdir, 'loadtest.db')
+    subprocess.check_call([
+        sys.executable, os.path.join(BENCH_DIR, 'datagen.py'), '--database', database,
+        '--users', str(args.users), '--events', str(args.events), '--seed', str(args.seed)
+    ], cwd=workdir)
+    conn = sqlite3.connect(database)
+    users = [row[0] for row in conn.execute('SELECT user_id FROM users')]
+    conn.execute(
+        "INSERT INTO events (event_id, event_name, event_year, event_date, event_points, created_date) "
+        "VALUES ('loadtest-event', 'Load Test Event', ?, ?, 10, ?)",
+        (str(datetime.now().year), datetime.now().date().isoformat(), datetime.now().isoformat())
+    )
+    conn.commit()
+    conn.close()
+    return database, users
+
+
+def start_server(workdir, database, port, smtp_port, args):
+    env = dict(
+        os.environ,
+        DATABASE_PATH=database,
+        QR_STORAGE_DIR=os.path.join(workdir, 'qr_codes'),
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=str(smtp_port),
+        MAIL_USE_TLS='false',
+        MAIL_USERNAME='',
+        MAIL_PASSWORD='',
+        MAIL_DEFAULT_SENDER='loadtest@example.com',
+        RATE_LIMIT_ENABLED='true' if args.rate_limit else 'false',
+    )
+    code = SERVER_CODE.format(repo=REPO_DIR, port=port,
+                              threaded=args.processes == 1, processes=args.processes)
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1)
+            return server
+        except (urllib.error.URLError, ConnectionError):
+            if server.poll() is not None:
+                raise RuntimeError('Server exited during startup')
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('Server did not start within 30 seconds')
+
+
+class PayloadSource:
+    """Thread-safe stream of QR payloads: new check-ins, duplicates and invalid codes"""
+
+    def __init__(self, users, duplicate_rate, invalid_rate, seed):
+        self.rng = random.Random(seed)
+        self.unscanned = list(users)
+        self.rng.shuffle(self.unscanned)
+        self.scanned = []
+        self.duplicate_rate = duplicate_rate
+        self.invalid_rate = invalid_rate
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            roll = self.rng.random()
+            if roll < self.invalid_rate:
+                kind = self.rng.choice(['garbage', 'unknown_user', 'missing_user_id'])
+                payload = {
+                    'garbage': 'not-a-qr-payload-%d' % self.rng.randint(0, 10 ** 6),
+                    'unknown_user': json.dumps({'user_id': 'no-such-user-%d' % self.rng.randint(0, 10 ** 6)}),
+                    'missing_user_id': json.dumps({'name': 'Nobody'}),
+                }[kind]
+                return 'invalid', payload
+            if (roll < self.invalid_rate + self.duplicate_rate and self.scanned) or not self.unscanned:
+                return 'duplicate', json.dumps({'user_id': self.rng.choice(self.scanned)})
+            user_id = self.unscanned.pop()
+            self.scanned.append(user_id)
+            return 'new', json.dumps({'user_id': user_id})
+
+
+def scanner_client(base_url, payloads, stop_at, results, lock):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(f'{base_url}/login', urllib.parse.urlencode(
+        {'username': 'admin', 'password': 'admin123'}).encode(), timeout=30)
+
+    local = []
+    while time.time() < stop_at:
+        kind, qr_data = payloads.next()
+        request = urllib.request.Request(
+            f'{base_url}/api/scan/attendance/loadtest-event',
+            data=json.dumps({'qr_data': qr_data}).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        t0 = time.perf_counter()
+        try:
+            with opener.open(request, timeout=30) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+            status, body = 0, str(e).encode()
+        latency = (time.perf_counter() - t0) * 1000
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = {}
+        if status == 200 and data.get('success'):
+            outcome = 'checked_in'
+        elif data.get('already_attended'):
+            outcome = 'duplicate'
+        elif status == 400:
+            outcome = 'rejected'
+        elif 'locked' in str(data.get('error', '')):
+            outcome = 'db_locked'
+        else:
+            outcome = f'error_{status}'
+        local.append((kind, outcome, latency))
+
+    with lock:
+        results.extend(local)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent scanner stations')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Server worker processes (1 = one multi-threaded process)')
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--invalid-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Keep the per-scanner rate limits on (off by default to measure raw capacity)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    sink = SMTPSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory(prefix='yepid-load-') as workdir:
+        database, users = prepare_dataset(workdir, args)
+        port = free_port()
+        server = start_server(workdir, database, port, sink.server_address[1], args)
+        try:
+            payloads = PayloadSource(users, args.duplicate_rate, args.invalid_rate, args.seed)
+            results = []
+            lock = threading.Lock()
+            stop_at = time.time() + args.duration
+            started = time.perf_counter()
+            clients = [
+                threading.Thread(target=scanner_client,
+                                 args=(f'http://127.0.0.1:{port}', payloads, stop_at, results, lock))
+                for _ in range(args.clients)
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - started
+            time.sleep(1)  # Let in-flight confirmation emails reach the sink
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+    sink.shutdown()
+
+    outcomes = Counter(outcome for _, outcome, _ in results)
+    latencies = sorted(latency for _, _, latency in results)
+    total = len(results) or 1
+    report = {
+        'clients': args.clients,
+        'processes': args.processes,
+        'duration_s': round(elapsed, 2),
+        'requests': len(results),
+        'requests_per_sec': round(len(results) / elapsed, 2),
+        'checkins_per_sec': round(outcomes['checked_in'] / elapsed, 2),
+        'outcomes': dict(outcomes),
+        'unexpected_error_rate': round(sum(
+            n for o, n in outcomes.items() if o.startswith('error_') or o == 'db_locked') / total, 4),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p90': round(percentile(latencies, 90), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(latencies[-1], 2) if latencies else 0.0,
+        },
+        'emails_received': sink.messages,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Query-plan regression check for the hot SQL statements.
+
+Seeds a database, requests each hot route through Flask's test client and
+captures every SQL statement the route executes. Each statement is then run
+through EXPLAIN QUERY PLAN. Any full-table SCAN or USE TEMP B-TREE that the
+route's allowlist does not expect is reported, and the script exits with
+status 1. A schema or query change that silently adds a table scan therefore
+fails this check.
+
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --verbose
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from run import load_app, admin_client  # noqa: E402
+from datagen import generate_dataset  # noqa: E402
+
+# Plan details that are flagged unless allowed
+SUSPICIOUS = re.compile(r'^SCAN |USE TEMP B-TREE')
+# Always fine: scans over CTEs, subquery results and constant rows, and the list of
+# archived years (one row per year)
+ALWAYS_ALLOWED = [r'^SCAN (CONSTANT ROW|\w+ \(VIRTUAL|years|\(subquery|t$|t )',
+                  r'^SCAN attendance_archives( |$)']
+
+
+def hot_routes(ctx):
+    """(name, method, url, body, allowed plan patterns) for every hot route"""
+    event_id = ctx['event_id']
+    user_id = ctx['user_id']
+    return [
+        # Ranking by computed totals always needs a sort; all-time totals add up the
+        # current years and the archived years' rollups per user
+        ('leaderboard', 'get', '/leaderboard', None, [
+            r'^SCAN attendance USING COVERING INDEX idx_attendance_user_points_event$',
+            r'^SCAN attendance_rollup_users USING COVERING INDEX idx_rollup_users_user$',
+            r'^USE TEMP B-TREE FOR (GROUP BY|ORDER BY)$',
+        ]),
+        ('leaderboard_year', 'get', f'/leaderboard?year={ctx["year"]}', None, [
+            r'^USE TEMP B-TREE FOR ORDER BY$',
+        ]),
+        ('event_detail', 'get', f'/events/{event_id}', None, []),
+        ('export_attendance', 'get', f'/events/{event_id}/export', None, []),
+        # Events come out of the index in date order; only each event's attendees are sorted
+        ('bulk_export', 'get', f'/events/export?year={ctx["year"]}&format=workbook', None, [
+            r'^USE TEMP B-TREE FOR RIGHT PART OF ORDER BY$',
+        ]),
+        # Event list pages walk an ordering index and stop after one page (LIMIT); the
+        # filter dropdown's years are read from the same index
+        ('events_list', 'get', '/events', None, [
+            r'^SCAN events USING INDEX idx_events_year_created$',
+        ]),
+        ('events_list_year', 'get', f'/events?year={ctx["year"]}&category=Workshop', None, [
+            r'^SCAN events USING INDEX idx_events_year_created$',
+        ]),
+        ('events_list_upcoming', 'get', '/events?when=upcoming', None, [
+            r'^SCAN events USING INDEX idx_events_year_created$',
+        ]),
+        ('events_list_past', 'get', '/events?when=past&page=2', None, [
+            r'^SCAN events USING INDEX idx_events_year_created$',
+        ]),
+        # A day's events are found by date and sorted by start time (a handful of rows)
+        ('todays_events', 'get', '/api/events/today', None, [
+            r'^USE TEMP B-TREE FOR ORDER BY$',
+        ]),
+        ('scan_attendance', 'post', f'/api/scan/attendance/{event_id}',
+         {'qr_data': json.dumps({'user_id': user_id})}, []),
+        # Substring search (LIKE '%q%') can't use an index; results are read in index order
+        ('search_users', 'get', '/search?q=Santos&type=users', None, [
+            r'^SCAN users USING INDEX idx_users_registration_date$',
+        ]),
+        ('search_events', 'get', '/search?q=Youth&type=events', None, [
+            r'^SCAN events USING INDEX idx_events_date$',
+        ]),
+        ('search_attendance', 'get', '/search?q=Santos&type=attendance', None, [
+            r'^SCAN (a|attendance) USING INDEX idx_attendance_date$',
+        ]),
+        # Whole-table statistics are counts/sums over every row by definition
+        ('dashboard', 'get', '/dashboard', None, [
+            r'^SCAN (users|attendance|events) USING COVERING INDEX \w+$',
+            r'^SCAN attendance$',
+            r'^SCAN events$',
+        ]),
+        ('analytics', 'get', '/analytics', None, [
+            r'^SCAN (users|attendance|events) USING COVERING INDEX \w+$',
+            r'^SCAN attendance$',
+            r'^SCAN events$',
+            r'^SCAN users$',
+            r'^USE TEMP B-TREE FOR (GROUP BY|ORDER BY)$',
+            r'^SCAN (e|events) USING INDEX idx_events_date$',
+        ]),
+        ('events_analytics', 'get', '/analytics/events', None, [
+            r'^SCAN attendance$',
+            r'^SCAN attendance USING COVERING INDEX idx_attendance_date$',
+            r'^USE TEMP B-TREE FOR (GROUP BY|ORDER BY)$',
+            r'^SCAN (e|events) USING INDEX idx_events_date$',
+        ]),
+        ('demographics', 'get', '/analytics/demographics', None, [
+            r'^SCAN users$',
+            r'^USE TEMP B-TREE FOR GROUP BY$',
+        ]),
+        # Lists every user in Youth ID order (read straight from the ordering index).
+        # Users still missing an ID are found by index and sorted (few rows); the
+        # highest Youth number is read from the end of its partial index (LIMIT 1).
+        # Which QR codes exist (and their versions) is one read of qr_files, not a stat per user.
+        ('registered_persons', 'get', '/registered_persons', None, [
+            r'^SCAN users USING INDEX idx_users_youth_order$',
+            r'^SCAN users USING INDEX idx_users_youth_number$',
+            r'^SCAN qr_files$',
+            r'^USE TEMP B-TREE FOR ORDER BY$',
+        ]),
+    ]
+
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not just failures')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix='yepid-plans-') as workdir:
+        app_module = load_app(workdir)
+        users, events = generate_dataset(app_module, args.users, args.events, seed=args.seed)
+        client = admin_client(app_module)
+
+        # Record every statement run through get_db(), with its parameters inlined
+        captured = []
+        original_get_db = app_module.get_db
+
+        def tracing_get_db(*a, **kw):
+            conn = original_get_db(*a, **kw)
+            conn.set_trace_callback(captured.append)
+            return conn
+
+        app_module.get_db = tracing_get_db
+
+        ctx = {
+            'event_id': events[0]['event_id'],
+            'user_id': users[-1]['user_id'],
+            'year': events[0]['event_year'],
+        }
+        plan_conn = sqlite3.connect(app_module.DATABASE)
+
+        for name, method, url, body, allowed in hot_routes(ctx):
+            captured.clear()
+            response = getattr(client, method)(url, json=body) if body else getattr(client, method)(url)
+            if response.status_code >= 500:
+                print(f'FAIL {name}: {url} returned {response.status_code}')
+                failures += 1
+                continue
+
+            patterns = [re.compile(p) for p in allowed + ALWAYS_ALLOWED]
+            for sql in dict.fromkeys(captured):  # Unique, in execution order
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    continue
+                plan = explain(plan_conn, sql)
+                bad = [d for d in plan if SUSPICIOUS.search(d) and not any(p.search(d) for p in patterns)]
+                if bad:
+                    failures += 1
+                    print(f'FAIL {name}: {" ".join(sql.split())[:200]}')
+                    for detail in plan:
+                        print(f'       {"!!" if detail in bad else "  "} {detail}')
+                elif args.verbose:
+                    print(f'ok   {name}: {" ".join(sql.split())[:200]}')
+                    for detail in plan:
+                        print(f'          {detail}')
+
+        plan_conn.close()
+        app_module.get_db = original_get_db
+
+    if failures:
+        print(f'\n{failures} unexpected query plan(s)')
+        sys.exit(1)
+    print('All hot query plans use the expected indexes')
+
+
+if __name__ == '__main__':
+    main()
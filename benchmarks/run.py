@@ -0,0 +1,259 @@
+"""Reproducible benchmark suite driven through Flask's test client.
+
+Builds a seeded dataset in a temporary directory, runs each scenario and
+reports p50/p95/p99 latency and throughput. Results are written as JSON so
+runs from different commits can be compared.
+
+    python benchmarks/run.py --users 2000 --events 100 --iterations 50
+    python benchmarks/run.py --scenario leaderboard --scenario analytics
+    python benchmarks/run.py --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+def load_app(workdir):
+    """Import the app against a scratch database, QR directory and metrics directory"""
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['QR_STORAGE_DIR'] = os.path.join(workdir, 'qr_codes')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ.setdefault('SLOW_QUERY_MS', '1000000')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    sys.path.insert(0, REPO_DIR)
+    import app as app_module
+    app_module.create_app({'TESTING': True, 'MAIL_SUPPRESS_SEND': True})
+    return app_module
+
+
+def admin_client(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['username'] = 'admin'
+    return client
+
+
+# Scenarios: each takes (ctx, iteration) and returns a response
+def scenario_registration(ctx, i):
+    client = ctx['public_client']
+    with client.session_transaction() as sess:
+        sess['consent_given'] = True
+    return client.post('/register', data={
+        'name': f'Bench User {i}',
+        'email': f'bench.{ctx["run_id"]}.{i}@example.com',
+        'zone': 'Zone 1',
+        'sex': 'F',
+    })
+
+
+def scenario_scan_checkin(ctx, i):
+    # Mostly first-time check-ins on a fresh event, with some duplicates
+    user = ctx['rng'].choice(ctx['users'])
+    return ctx['client'].post(
+        f'/api/scan/attendance/{ctx["scan_event_id"]}',
+        json={'qr_data': json.dumps({'user_id': user['user_id'], 'name': user['name']})}
+    )
+
+
+def scenario_leaderboard(ctx, i):
+    if i % 2:
+        return ctx['client'].get('/leaderboard')
+    return ctx['client'].get(f'/leaderboard?year={ctx["rng"].choice(ctx["years"])}')
+
+
+def scenario_analytics(ctx, i):
+    return ctx['client'].get('/analytics')
+
+
+def scenario_search(ctx, i):
+    term = ctx['rng'].choice(ctx['users'])['name'].split()[0][:4]
+    return ctx['client'].get(f'/search?q={term}&type=all')
+
+
+def scenario_registered_persons(ctx, i):
+    return ctx['client'].get('/registered_persons')
+
+
+def scenario_export(ctx, i):
+    return ctx['client'].get(f'/events/{ctx["largest_event_id"]}/export')
+
+
+SCENARIOS = {
+    'registration': scenario_registration,
+    'scan_checkin': scenario_scan_checkin,
+    'leaderboard': scenario_leaderboard,
+    'analytics': scenario_analytics,
+    'search': scenario_search,
+    'registered_persons': scenario_registered_persons,
+    'export': scenario_export,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(func, ctx, iterations, warmup):
+    for i in range(warmup):
+        func(ctx, -1 - i)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        response = func(ctx, i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        # Duplicate check-ins are an expected 400
+        if response.status_code >= 500 or (response.status_code >= 400 and func is not scenario_scan_checkin):
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'throughput_rps': round(iterations / elapsed, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, baseline_path, threshold):
+    """Print p50/p95 changes against a baseline; returns True if anything regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\nCompared with {baseline_path} ({baseline["meta"].get("commit")}):')
+    regressed = False
+    for name, result in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            change = (result[key] - old[key]) / old[key] if old[key] else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  <-- REGRESSION'
+                regressed = True
+            print(f'  {name:20s} {key}: {old[key]:9.2f} -> {result[key]:9.2f} ({change:+.0%}){flag}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--attendance-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Run only this scenario (repeatable)')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>_<commit>.json)')
+    parser.add_argument('--compare', help='Baseline result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative p50/p95 slowdown counted as a regression (default 0.2)')
+    args = parser.parse_args()
+
+    from datagen import generate_dataset
+
+    with tempfile.TemporaryDirectory(prefix='yepid-bench-') as workdir:
+        app_module = load_app(workdir)
+        t0 = time.perf_counter()
+        users, events = generate_dataset(
+            app_module, args.users, args.events, args.attendance_rate, seed=args.seed
+        )
+        print(f'Dataset: {len(users)} users, {len(events)} events ({time.perf_counter() - t0:.1f}s)')
+
+        conn = app_module.get_db()
+        largest_event_id = conn.execute(
+            'SELECT event_id FROM attendance GROUP BY event_id ORDER BY COUNT(*) DESC LIMIT 1'
+        ).fetchone()[0]
+        scan_event_id = 'bench-scan-event'
+        conn.execute(
+            "INSERT INTO events (event_id, event_name, event_year, event_date, event_points, created_date) "
+            "VALUES (?, 'Benchmark Scan Event', '2025', '2025-12-01', 10, ?)",
+            (scan_event_id, datetime.now().isoformat())
+        )
+        conn.commit()
+        conn.close()
+
+        ctx = {
+            'client': admin_client(app_module),
+            'public_client': app_module.app.test_client(),
+            'rng': random.Random(args.seed),
+            'users': users,
+            'years': sorted({e['event_year'] for e in events}),
+            'largest_event_id': largest_event_id,
+            'scan_event_id': scan_event_id,
+            'run_id': int(time.time()),
+        }
+
+        results = {}
+        for name in args.scenario or SCENARIOS:
+            results[name] = run_scenario(SCENARIOS[name], ctx, args.iterations, args.warmup)
+            r = results[name]
+            print(f'{name:20s} p50 {r["p50_ms"]:9.2f}ms  p95 {r["p95_ms"]:9.2f}ms  '
+                  f'p99 {r["p99_ms"]:9.2f}ms  {r["throughput_rps"]:8.1f} req/s  errors {r["errors"]}')
+
+    commit = git_commit()
+    output = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'users': args.users,
+            'events': args.events,
+            'attendance_rate': args.attendance_rate,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+        },
+        'scenarios': results,
+    }
+
+    path = args.output or os.path.join(
+        RESULTS_DIR, f'{datetime.now().strftime("%Y%m%d-%H%M%S")}_{commit}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'\nResults written to {path}')
+
+    if args.compare and compare(output, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Startup-time budget check for worker boot and cold starts.
+
+Starts fresh interpreters against a scratch database and times `import app`
+and `create_app()` separately. It also checks that the heavy modules
+(openpyxl, qrcode, PIL) are still unloaded after startup, because those load
+on first use. The script exits with status 1 if the median total exceeds the
+budget or a heavy module was loaded.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --budget-ms 300
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+HEAVY_MODULES = ('openpyxl', 'qrcode', 'PIL')
+
+CHILD_CODE = '''
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+ready = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (ready - imported) * 1000,
+    'heavy_loaded': [m for m in {heavy!r} if m in sys.modules],
+}}))
+'''
+
+
+def boot_once(workdir):
+    env = dict(os.environ,
+               DATABASE_PATH=os.path.join(workdir, 'startup.db'),
+               QR_STORAGE_DIR=os.path.join(workdir, 'qr_codes'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'))
+    out = subprocess.run([sys.executable, '-c', CHILD_CODE.format(repo=REPO_DIR, heavy=HEAVY_MODULES)],
+                         cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 400)),
+                        help='Maximum median import + create_app() time (default 400, or STARTUP_BUDGET_MS)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='yepid-startup-') as workdir:
+        first = boot_once(workdir)  # Creates the schema; later boots are workers joining an existing database
+        runs = [boot_once(workdir) for _ in range(args.runs)]
+
+    def median(key):
+        return statistics.median(r[key] for r in runs)
+
+    total = median('import_ms') + median('create_app_ms')
+    print(f'first boot (new database): {first["import_ms"] + first["create_app_ms"]:.1f} ms')
+    print(f'import app:    {median("import_ms"):7.1f} ms (median of {args.runs})')
+    print(f'create_app():  {median("create_app_ms"):7.1f} ms')
+    print(f'total:         {total:7.1f} ms (budget {args.budget_ms:.0f} ms)')
+
+    failed = False
+    heavy = sorted({m for r in runs for m in r['heavy_loaded']})
+    if heavy:
+        print(f'FAIL: loaded at startup: {", ".join(heavy)}')
+        failed = True
+    if total > args.budget_ms:
+        print('FAIL: startup is over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
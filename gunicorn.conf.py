@@ -0,0 +1,59 @@
+"""Gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+SQLite has a single writer, so a few worker processes with several threads each
+work best: reads (dashboards, leaderboards, scans' lookups) run concurrently while
+check-in writes wait on DB_BUSY_TIMEOUT instead of failing. Each setting can be
+overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# Worker processes x threads. Keep processes low (writers contend for one lock)
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Bulk exports can take a while; the drain gets time to finish emails before the kill
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 30))) + 5
+keepalive = 5
+
+# Restart workers periodically to cap memory growth (0 disables)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Load the app (schema setup, JSON migration) once in the master, then fork
+preload_app = os.environ.get('WEB_PRELOAD', 'true').lower() in ['true', 'on', '1']
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    """Start /metrics from zero: remove the metrics files of a previous run"""
+    from app import reset_metrics_dir
+    reset_metrics_dir()
+
+
+def post_fork(server, worker):
+    """Drop metric values inherited from the preloaded master (startup work it counted)"""
+    from app import clear_metrics
+    clear_metrics()
+
+
+def worker_exit(server, worker):
+    """Finish queued welcome emails and QR codes before the worker goes away"""
+    from app import drain_background_jobs, flush_metrics, shutdown_process_pool
+    remaining = drain_background_jobs()
+    if remaining:
+        server.log.warning("Worker %s exited with %s background job(s) unfinished", worker.pid, remaining)
+    shutdown_process_pool()
+    flush_metrics()  # Final counts, kept by child_exit
+
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters, drop its gauges (runs in the master)"""
+    from app import retire_metrics_file
+    retire_metrics_file(worker.pid)
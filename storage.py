@@ -0,0 +1,722 @@
+"""Data access: pooled SQLite connections and a repository for users, events, attendance
+and notifications.
+
+Every connection the app opens comes from a ConnectionPool. A storage backend only decides
+how connections are opened: 'sqlite' opens the database file (the default), 'memory' opens
+a named in-memory database shared by every connection in the process (for tests and
+throwaway demos). Routes that go through Repository don't care which one is in use, so
+queries for another database server only have to be written here.
+
+Repository holds every query the routes make on users, events, attendance and notifications
+(registration, check-ins, imports, exports, reports, search, deletion). Schema setup, admin
+accounts, sessions, rate limits, the QR file index and the maintenance jobs (purge, archive,
+backup and restore) still run their SQL in app.py.
+"""
+import os
+import sqlite3
+import threading
+import urllib.parse
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+STORAGE_BACKENDS = ('sqlite', 'memory')
+
+# Users are listed by Youth ID number (Youth001, Youth002, ...), then registration date
+YOUTH_ID_ORDER = "CASE WHEN id LIKE 'Youth%' THEN CAST(SUBSTR(id, 6) AS INTEGER) ELSE 999999 END"
+USERS_IN_ID_ORDER = f'SELECT * FROM live_users ORDER BY {YOUTH_ID_ORDER} ASC, registration_date ASC'
+
+# Columns written when inserting a user, in table order
+USER_COLUMNS = (
+    'user_id', 'id', 'name', 'street', 'zone', 'sex', 'birthdate', 'email', 'phone',
+    'civil_status', 'youth_age_group', 'youth_classification', 'specific_needs_type',
+    'educational_background', 'educational_background_other', 'work_status', 'work_status_other',
+    'sk_voter_registered', 'sk_voted_last_election', 'national_voter_registered', 'attended_kk_assembly',
+    'kk_assembly_times', 'kk_assembly_no_reason', 'registration_date'
+)
+INSERT_USER_SQL = f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})"
+
+# User fields that users can be grouped by (demographics, bulk message recipients)
+USER_GROUP_COLUMNS = ('zone', 'sex', 'youth_age_group', 'youth_classification')
+
+EVENT_COLUMNS = (
+    'event_id', 'event_name', 'event_year', 'event_description', 'event_date', 'event_time',
+    'event_points', 'event_category', 'event_capacity', 'reminder_sent', 'created_date'
+)
+# What event listings show (no descriptions)
+EVENT_LIST_COLUMNS = (
+    'event_id', 'event_name', 'event_year', 'event_date', 'event_time', 'event_points',
+    'event_category', 'event_capacity'
+)
+ATTENDANCE_COLUMNS = (
+    'attendance_id', 'event_id', 'user_id', 'event_year', 'points_earned', 'attendance_date', 'scan_time'
+)
+NOTIFICATION_COLUMNS = (
+    'notification_id', 'user_id', 'event_id', 'notification_type', 'notification_title',
+    'notification_message', 'sent_date', 'read_status'
+)
+
+def _insert_sql(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+def user_row(user_data):
+    """Build the INSERT parameters for a user dict"""
+    return (
+        (user_data.get('user_id'),)
+        + tuple(user_data.get(column, '') for column in USER_COLUMNS[1:-1])
+        + (user_data.get('registration_date', datetime.now().isoformat()),)
+    )
+
+def next_youth_number(conn):
+    """Next free number for sequential Youth IDs (Youth001, Youth002, ...)"""
+    row = conn.execute("SELECT id FROM users WHERE id LIKE 'Youth%' ORDER BY CAST(SUBSTR(id, 6) AS INTEGER) DESC LIMIT 1").fetchone()
+    if row and row[0]:
+        last_id = row[0]
+        if last_id.startswith('Youth') and last_id.replace('Youth', '').isdigit():
+            return int(last_id.replace('Youth', '')) + 1
+    return 1
+
+# Archived attendance: closed years live in attendance_archive_<year> tables (see the archive
+# job in app.py); archived_attendance_<year> views hold everything recorded for such a year
+def archived_years(conn, completed_only=True):
+    """Archived years, newest first (completed_only=False includes an archive still being moved)"""
+    sql = 'SELECT event_year FROM attendance_archives'
+    if completed_only:
+        sql += ' WHERE completed_date IS NOT NULL'
+    return [row[0] for row in conn.execute(sql + ' ORDER BY event_year DESC')]
+
+def is_year_archived(conn, year):
+    return bool(year) and conn.execute('SELECT 1 FROM attendance_archives WHERE event_year = ?', (year,)).fetchone() is not None
+
+def attendance_source(conn, year):
+    """Table or view with the live attendance of events held in year"""
+    return f'archived_attendance_{year}' if is_year_archived(conn, year) else 'live_attendance'
+
+def attendance_sources(conn, year=None):
+    """(source, filters, params) for each attendance table or view that together hold every
+    year exactly once; filters refer to the joined event as e"""
+    if year:
+        return [(attendance_source(conn, year), [], [])]
+    archived = archived_years(conn, completed_only=False)
+    if not archived:
+        return [('live_attendance', [], [])]
+    placeholders = ', '.join('?' * len(archived))
+    sources = [('live_attendance', [f'(e.event_year IS NULL OR e.event_year NOT IN ({placeholders}))'], archived)]
+    sources += [(f'archived_attendance_{y}', ['e.event_year = ?'], [y]) for y in archived]
+    return sources
+
+def database_uri(path, backend='sqlite', read_only=False):
+    """SQLite URI for a database file, or for the in-memory database named after it"""
+    if backend == 'memory':
+        # memdb databases live as long as one connection to them is open; a name starting
+        # with '/' is shared by every connection in the process
+        uri = f'file:{urllib.parse.quote(os.path.abspath(path))}?vfs=memdb'
+    else:
+        uri = f'file:{urllib.parse.quote(os.path.abspath(path))}?cache=private'
+    return uri + ('&mode=ro' if read_only else '')
+
+class PooledConnection(sqlite3.Connection):
+    """Connection whose close() hands it back to the pool it came from"""
+    _pool = None
+    _pooled = False
+
+    def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.release(self)
+        elif not self._pooled:
+            super().close()
+        # A pooled connection closed twice: the second close must not touch it again
+
+class ConnectionPool:
+    """Idle connections to one database, reused across requests.
+
+    At most `size` idle connections are kept; acquire() never waits, it opens a new
+    connection when none is idle. Connections inherited through fork() are never reused.
+    """
+
+    def __init__(self, connect, size=8, keep_alive=False):
+        self._connect = connect
+        self.size = size
+        self._idle = []
+        self._inherited = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # An in-memory database disappears with its last connection, so one stays open
+        self._anchor = connect() if keep_alive else None
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked (gunicorn --preload): the parent's connections must not be used here,
+                # and closing them could drop the parent's file locks, so they are only kept
+                self._inherited.extend(self._idle)
+                self._idle, self._pid = [], os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+            conn._pooled = True
+        conn._pool = self
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # What closing the connection would have done
+        except sqlite3.Error:
+            sqlite3.Connection.close(conn)
+            return
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+    def close(self):
+        """Close the idle connections (connections in use are closed when released)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.size = 0
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+        if self._anchor is not None:
+            sqlite3.Connection.close(self._anchor)
+            self._anchor = None
+
+class Repository:
+    """Users, events, attendance and notifications.
+
+    connect(read_only=False) returns a connection (normally pooled) with sqlite3.Row rows.
+    Batch methods write in one transaction per batch_size rows.
+    """
+
+    def __init__(self, connect, batch_size=500):
+        self._connect = connect
+        self.batch_size = batch_size
+
+    @contextmanager
+    def connection(self, read_only=False):
+        conn = self._connect(read_only=read_only)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Connection whose statements commit together (or roll back on an exception)"""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def _fetch_all(self, sql, params=()):
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def _fetch_one(self, sql, params=()):
+        with self.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def _flag_deleted(self, table, key_column, key):
+        with self.transaction() as conn:
+            return conn.execute(
+                f'UPDATE {table} SET deleted_at = ? WHERE {key_column} = ? AND deleted_at IS NULL',
+                (datetime.now().isoformat(), key)
+            ).rowcount > 0
+
+    def _insert_many(self, sql, rows):
+        for start in range(0, len(rows), self.batch_size):
+            with self.transaction() as conn:
+                conn.executemany(sql, rows[start:start + self.batch_size])
+        return len(rows)
+
+    # Users
+    def get_user(self, user_id):
+        return self._fetch_one('SELECT * FROM live_users WHERE user_id = ?', (user_id,))
+
+    def get_users(self, user_ids):
+        """{user_id: user} for the given IDs (looked up batch_size at a time)"""
+        user_ids = list(dict.fromkeys(user_ids))
+        users = {}
+        with self.connection() as conn:
+            for start in range(0, len(user_ids), self.batch_size):
+                batch = user_ids[start:start + self.batch_size]
+                rows = conn.execute(f"SELECT * FROM live_users WHERE user_id IN ({', '.join('?' * len(batch))})", batch)
+                users.update((row['user_id'], dict(row)) for row in rows)
+        return users
+
+    def list_users(self):
+        """Every user, in Youth ID order"""
+        return self._fetch_all(USERS_IN_ID_ORDER)
+
+    def list_user_contacts(self):
+        """(user_id, email, name) of every user with an email address"""
+        with self.connection() as conn:
+            return [tuple(row) for row in conn.execute(
+                "SELECT user_id, email, name FROM live_users WHERE email IS NOT NULL AND email != ''")]
+
+    def add_users(self, users):
+        """Insert user dicts; returns how many were inserted"""
+        return self._insert_many(INSERT_USER_SQL, [user_row(user) for user in users])
+
+    def register_user(self, user_data):
+        """Insert a new user with the next sequential Youth ID in a single write transaction.
+        
+        Raises sqlite3.IntegrityError if the email is already registered (case-insensitive).
+        """
+        with self.connection() as conn:
+            try:
+                # Take the write lock up front so concurrent sign-ups can't get the same Youth ID
+                conn.execute('BEGIN IMMEDIATE')
+                user_data['id'] = f"Youth{next_youth_number(conn):03d}"
+                conn.execute(INSERT_USER_SQL, user_row(user_data))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def next_youth_number(self):
+        with self.connection() as conn:
+            return next_youth_number(conn)
+
+    def add_numbered_users(self, users, next_number):
+        """Insert user dicts in one transaction, numbering them Youth<next_number> on.
+        
+        If a row conflicts (an email registered meanwhile), rows are inserted one at a time
+        instead and only the rows that are saved take a number, so none is skipped.
+        Returns (inserted users, [(user, error)] for the rest, next free number).
+        """
+        for offset, user in enumerate(users):
+            user['id'] = f"Youth{next_number + offset:03d}"
+        with self.connection() as conn:
+            try:
+                with conn:
+                    conn.executemany(INSERT_USER_SQL, [user_row(user) for user in users])
+                return users, [], next_number + len(users)
+            except sqlite3.IntegrityError:
+                pass
+            inserted, failed = [], []
+            for user in users:
+                user['id'] = f"Youth{next_number:03d}"
+                try:
+                    with conn:
+                        conn.execute(INSERT_USER_SQL, user_row(user))
+                except sqlite3.IntegrityError as e:
+                    failed.append((user, e))
+                    continue
+                inserted.append(user)
+                next_number += 1
+        return inserted, failed, next_number
+
+    def registered_emails(self, emails):
+        """Which of the given lowercase emails are taken (deleted users' included).
+        
+        Looked up batch_size at a time: older SQLite builds allow at most 999 parameters.
+        """
+        emails = list(emails)
+        taken = set()
+        with self.connection() as conn:
+            for start in range(0, len(emails), self.batch_size):
+                batch = emails[start:start + self.batch_size]
+                taken.update(row[0] for row in conn.execute(
+                    f"SELECT LOWER(email) FROM users WHERE LOWER(email) IN ({', '.join('?' * len(batch))})", batch))
+        return taken
+
+    def assign_youth_ids(self):
+        """Convert old STU IDs (STU001 -> Youth001), then give Youth IDs to users registered
+        without one (or with an STU ID that has no number), in registration order"""
+        with self.transaction() as conn:
+            # A range on id (not LIKE, which is case-insensitive) so idx_users_id finds them
+            missing = []
+            for user_id, old_id, registered in conn.execute(
+                    "SELECT user_id, id, registration_date FROM live_users WHERE id >= 'STU' AND id < 'STV'").fetchall():
+                if old_id[3:].isdigit():
+                    conn.execute('UPDATE users SET id = ? WHERE user_id = ?', (f"Youth{old_id[3:]}", user_id))
+                else:
+                    missing.append((registered or '', user_id))
+            missing += [(row[1] or '', row[0]) for row in conn.execute(
+                "SELECT user_id, registration_date FROM live_users WHERE id IS NULL OR id = ''")]
+            # Numbered after the conversion, so a new number never repeats a converted one
+            number = next_youth_number(conn)
+            for offset, (_, user_id) in enumerate(sorted(missing)):
+                conn.execute('UPDATE users SET id = ? WHERE user_id = ?', (f"Youth{number + offset:03d}", user_id))
+
+    def delete_user(self, user_id):
+        """Flag a user as deleted (hidden at once, purged later); returns False if there was none"""
+        return self._flag_deleted('users', 'user_id', user_id)
+
+    def search_users(self, query, limit=50):
+        """Users whose name, email, Youth ID, phone or zone contains query, newest first"""
+        pattern = f'%{query}%'
+        return self._fetch_all('''
+            SELECT * FROM live_users 
+            WHERE name LIKE ? OR email LIKE ? OR id LIKE ? OR phone LIKE ? OR zone LIKE ?
+            ORDER BY registration_date DESC
+            LIMIT ?
+        ''', (pattern, pattern, pattern, pattern, pattern, limit))
+
+    def list_recipients(self, column=None, value=None):
+        """(email, name) of users with an email address, optionally only those whose
+        column (one of USER_GROUP_COLUMNS) equals value"""
+        sql = "SELECT email, name FROM live_users WHERE email IS NOT NULL AND email != ''"
+        params = ()
+        if column:
+            if column not in USER_GROUP_COLUMNS:
+                raise ValueError(f'Users cannot be grouped by {column!r}')
+            sql += f' AND {column} = ?'
+            params = (value,)
+        with self.connection() as conn:
+            return [tuple(row) for row in conn.execute(sql, params)]
+
+    def list_user_groups(self, column):
+        """Distinct non-empty values of a USER_GROUP_COLUMNS field, sorted"""
+        return list(self.count_users_by(column))
+
+    def count_users_by(self, column):
+        """{value: number of users} for a USER_GROUP_COLUMNS field (empty values left out), in value order"""
+        if column not in USER_GROUP_COLUMNS:
+            raise ValueError(f'Users cannot be grouped by {column!r}')
+        with self.connection() as conn:
+            return {row[0]: row[1] for row in conn.execute(
+                f"SELECT {column}, COUNT(*) FROM live_users WHERE {column} IS NOT NULL AND {column} != '' "
+                f'GROUP BY {column} ORDER BY {column}')}
+
+    # Events
+    def get_event(self, event_id):
+        return self._fetch_one('SELECT * FROM live_events WHERE event_id = ?', (event_id,))
+
+    def list_events(self):
+        """Every event, newest year first"""
+        return self._fetch_all('SELECT * FROM live_events ORDER BY event_year DESC, created_date DESC')
+
+    def list_events_page(self, year=None, category=None, name=None, when=None, today=None, limit=50, offset=0):
+        """One page of events (EVENT_LIST_COLUMNS), filtered by year, category and name.
+        
+        when='upcoming' lists events from `today` on, soonest first; when='past' lists earlier
+        ones, latest first. Otherwise events are listed newest year first, then newest created.
+        """
+        filters, params = [], []
+        if year:
+            filters.append('event_year = ?')
+            params.append(year)
+        if category:
+            filters.append('event_category = ?')
+            params.append(category)
+        if name:
+            filters.append('event_name LIKE ?')
+            params.append(f'%{name}%')
+        if when == 'upcoming':
+            filters.append('event_date >= ?')
+            params.append(today)
+            order = 'event_date ASC'
+        elif when == 'past':
+            filters.append('event_date < ?')
+            params.append(today)
+            order = 'event_date DESC'
+        else:
+            order = 'event_year DESC, created_date DESC'
+        where = f"WHERE {' AND '.join(filters)}" if filters else ''
+        return self._fetch_all(f"SELECT {', '.join(EVENT_LIST_COLUMNS)} FROM live_events {where} "
+                               f"ORDER BY {order} LIMIT ? OFFSET ?", (*params, limit, offset))
+
+    def list_event_years(self):
+        """Years that have events, newest first"""
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT event_year FROM live_events WHERE event_year != '' ORDER BY event_year DESC")]
+
+    def list_events_on(self, date):
+        """Events on one date (EVENT_LIST_COLUMNS), in start time order"""
+        return self._fetch_all(f"SELECT {', '.join(EVENT_LIST_COLUMNS)} FROM live_events WHERE event_date = ? "
+                               "ORDER BY event_time ASC", (date,))
+
+    def add_event(self, event_data):
+        defaults = {'event_name': '', 'event_year': '', 'event_description': '', 'event_date': '',
+                    'event_time': '', 'event_points': 0, 'event_category': '', 'event_capacity': None,
+                    'reminder_sent': 0}
+        row = tuple(event_data.get(column, defaults.get(column)) for column in EVENT_COLUMNS[:-1])
+        row += (event_data.get('created_date', datetime.now().isoformat()),)
+        with self.transaction() as conn:
+            conn.execute(_insert_sql('events', EVENT_COLUMNS), row)
+
+    def mark_reminder_sent(self, event_id):
+        with self.transaction() as conn:
+            conn.execute('UPDATE events SET reminder_sent = 1 WHERE event_id = ?', (event_id,))
+
+    def delete_event(self, event_id):
+        """Flag an event as deleted (hidden at once, purged later); returns False if there was none"""
+        return self._flag_deleted('events', 'event_id', event_id)
+
+    def search_events(self, query, limit=50):
+        """Events whose name, description or category contains query, latest date first"""
+        pattern = f'%{query}%'
+        return self._fetch_all('''
+            SELECT * FROM live_events 
+            WHERE event_name LIKE ? OR event_description LIKE ? OR event_category LIKE ?
+            ORDER BY event_date DESC
+            LIMIT ?
+        ''', (pattern, pattern, pattern, limit))
+
+    # Attendance
+    def list_attendance(self, include_archived=False):
+        """Attendance records, most recent first (current years, or every year with include_archived)"""
+        source = 'attendance_history' if include_archived else 'live_attendance'
+        return self._fetch_all(f'SELECT * FROM {source} ORDER BY attendance_date DESC')
+
+    def list_event_attendance(self, event, oldest_first=False):
+        """An event's attendance with each attendee's name, email, Youth ID (id) and phone,
+        most recent first"""
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT a.*, u.name, u.email, u.id, u.phone
+                FROM {attendance_source(conn, event.get('event_year'))} a
+                LEFT JOIN live_users u ON a.user_id = u.user_id
+                WHERE a.event_id = ?
+                ORDER BY a.attendance_date {'ASC' if oldest_first else 'DESC'}
+            ''', (event['event_id'],))
+            return [dict(row) for row in rows]
+
+    def list_attendance_export(self, year=None, category=None, date_from=None, date_to=None):
+        """Matching events joined with their attendance and attendees, by event date then
+        attendance date. An event without attendance is one row whose attendance_id is None.
+        """
+        filters, params = [], []
+        if year:
+            filters.append('e.event_year = ?')
+            params.append(year)
+        if category:
+            filters.append('e.event_category = ?')
+            params.append(category)
+        if date_from:
+            filters.append('e.event_date >= ?')
+            params.append(date_from)
+        if date_to:
+            filters.append('e.event_date <= ?')
+            params.append(date_to)
+        
+        # One pass over each attendance source (current years, then each archived year),
+        # joined once with users and events
+        rows = []
+        with self.connection() as conn:
+            sources = attendance_sources(conn, year)
+            for source, source_filter, source_params in sources:
+                where = ' AND '.join(filters + source_filter) or '1'
+                rows.extend(dict(row) for row in conn.execute(f'''
+                    SELECT e.event_id, e.event_name, e.event_year, e.event_date, e.event_time,
+                           e.event_description, e.event_category, e.event_points,
+                           a.attendance_id, a.user_id, a.points_earned, a.attendance_date,
+                           u.name, u.email, u.id, u.phone
+                    FROM live_events e
+                    LEFT JOIN {source} a ON a.event_id = e.event_id
+                    LEFT JOIN live_users u ON a.user_id = u.user_id
+                    WHERE {where}
+                    ORDER BY e.event_date ASC, e.event_id, a.attendance_date ASC
+                ''', params + source_params))
+        if len(sources) > 1:
+            rows.sort(key=lambda r: (r['event_date'] or '', r['event_id'], r['attendance_date'] or ''))
+        return rows
+
+    def search_attendance(self, query, limit=50):
+        """Attendance (every year) whose attendee's name or email or event name contains query,
+        most recent first, with user_name, user_email, user_id_display, event_name and event_date"""
+        pattern = f'%{query}%'
+        return self._fetch_all('''
+            SELECT a.*, u.name as user_name, u.email as user_email, u.id as user_id_display,
+                   e.event_name, e.event_date
+            FROM attendance_history a
+            LEFT JOIN live_users u ON a.user_id = u.user_id
+            LEFT JOIN live_events e ON a.event_id = e.event_id
+            WHERE u.name LIKE ? OR u.email LIKE ? OR e.event_name LIKE ?
+            ORDER BY a.attendance_date DESC
+            LIMIT ?
+        ''', (pattern, pattern, pattern, limit))
+
+    def check_in(self, event, user_id):
+        """Record a user's attendance at an event; returns (outcome, user).
+        
+        outcome is 'checked_in', 'year_archived' (the event's year is closed), 'unknown_user'
+        or 'duplicate' (already recorded, here or by another station just now).
+        """
+        with self.transaction() as conn:
+            if is_year_archived(conn, event.get('event_year')):
+                return 'year_archived', None
+            row = conn.execute('SELECT * FROM live_users WHERE user_id = ?', (user_id,)).fetchone()
+            if not row:
+                return 'unknown_user', None
+            user = dict(row)
+            if conn.execute('SELECT 1 FROM attendance WHERE event_id = ? AND user_id = ?',
+                            (event['event_id'], user_id)).fetchone():
+                return 'duplicate', user
+            now = datetime.now().isoformat()
+            try:
+                conn.execute(_insert_sql('attendance', ATTENDANCE_COLUMNS), (
+                    str(uuid.uuid4()), event['event_id'], user_id, event.get('event_year', ''),
+                    event.get('event_points', 0), now, now))
+            except sqlite3.IntegrityError:
+                # Another station recorded this user between our check and insert
+                return 'duplicate', user
+        return 'checked_in', user
+
+    def has_attended(self, event_id, user_id):
+        with self.connection() as conn:
+            return conn.execute('SELECT 1 FROM attendance WHERE event_id = ? AND user_id = ?',
+                                (event_id, user_id)).fetchone() is not None
+
+    def add_attendance(self, records):
+        """Insert attendance dicts; returns how many were inserted"""
+        now = datetime.now().isoformat()
+        rows = [(
+            record.get('attendance_id'),
+            record.get('event_id'),
+            record.get('user_id'),
+            record.get('event_year', ''),
+            record.get('points_earned', 0),
+            record.get('attendance_date', now),
+            record.get('scan_time', now)
+        ) for record in records]
+        return self._insert_many(_insert_sql('attendance', ATTENDANCE_COLUMNS), rows)
+
+    # Notifications
+    def add_notifications(self, notifications):
+        """Insert notification dicts (notification_id is generated if missing); returns how many"""
+        now = datetime.now().isoformat()
+        rows = [(
+            notification.get('notification_id') or str(uuid.uuid4()),
+            notification.get('user_id'),
+            notification.get('event_id'),
+            notification.get('notification_type', ''),
+            notification.get('notification_title', ''),
+            notification.get('notification_message', ''),
+            notification.get('sent_date', now),
+            notification.get('read_status', 0)
+        ) for notification in notifications]
+        return self._insert_many(_insert_sql('notifications', NOTIFICATION_COLUMNS), rows)
+
+    def list_notifications(self, user_id, limit=50):
+        """A user's most recent notifications"""
+        return self._fetch_all('SELECT * FROM notifications WHERE user_id = ? ORDER BY sent_date DESC LIMIT ?',
+                               (user_id, limit))
+
+    # Reports
+    def summary_stats(self, today, registered_since):
+        """Dashboard totals: users, events, upcoming events (from today), attendance and points
+        (current years plus archived rollups), average attendance per event, and users
+        registered since registered_since"""
+        with self.connection() as conn:
+            # All rows minus flagged ones: both counts are index-only
+            total_users = conn.execute(
+                'SELECT (SELECT COUNT(*) FROM users) - (SELECT COUNT(*) FROM users WHERE deleted_at IS NOT NULL)').fetchone()[0]
+            total_events = conn.execute('SELECT COUNT(*) FROM live_events').fetchone()[0]
+            active_events = conn.execute('SELECT COUNT(*) FROM live_events WHERE event_date >= ?', (today,)).fetchone()[0]
+            total_attendance, total_points = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(points_earned), 0) FROM live_attendance').fetchone()
+            archived_attendance, archived_points = conn.execute('''
+                SELECT COALESCE(SUM(r.attendance_count), 0), COALESCE(SUM(r.total_points), 0)
+                FROM attendance_rollup_events r
+                JOIN live_events e ON e.event_id = r.event_id
+            ''').fetchone()
+            avg_attendance = conn.execute('''
+                SELECT AVG(attendance_count) FROM (
+                    SELECT COUNT(*) as attendance_count 
+                    FROM live_attendance 
+                    GROUP BY event_id
+                    UNION ALL
+                    SELECT r.attendance_count
+                    FROM attendance_rollup_events r
+                    JOIN live_events e ON e.event_id = r.event_id
+                )
+            ''').fetchone()[0]
+            recent_registrations = conn.execute(
+                'SELECT COUNT(*) FROM live_users WHERE registration_date >= ?', (registered_since,)).fetchone()[0]
+        return {
+            'total_users': total_users,
+            'total_events': total_events,
+            'active_events': active_events,
+            'total_attendance': total_attendance + archived_attendance,
+            'total_points': total_points + archived_points,
+            'avg_attendance': round(avg_attendance, 1) if avg_attendance else 0,
+            'recent_registrations': recent_registrations
+        }
+
+    def list_event_attendance_counts(self):
+        """Every event (latest first) with its attendance_count and event_capacity"""
+        return self._fetch_all('''
+            SELECT e.event_id, e.event_name, e.event_date, e.event_points,
+                   COALESCE(r.attendance_count,
+                            (SELECT COUNT(*) FROM live_attendance a WHERE a.event_id = e.event_id)) as attendance_count,
+                   e.event_capacity
+            FROM live_events e
+            LEFT JOIN attendance_rollup_events r ON r.event_id = e.event_id
+            ORDER BY e.event_date DESC
+        ''')
+
+    def monthly_attendance(self, first_month, months=12):
+        """{'YYYY-MM': check-ins} from first_month on, latest month first (bounded, so archives
+        are only read through their date index when the window reaches back into a closed year)"""
+        with self.connection() as conn:
+            return {row[0]: row[1] for row in conn.execute('''
+                SELECT strftime('%Y-%m', attendance_date) as month, COUNT(*) as count
+                FROM attendance_history
+                WHERE attendance_date >= ?
+                GROUP BY month
+                ORDER BY month DESC
+                LIMIT ?
+            ''', (first_month, months))}
+
+    def leaderboard(self, year=None):
+        """Users with points (user_id, name, email, id, total_points, events_attended),
+        highest total first, for one year or all time"""
+        with self.connection() as conn:
+            # Total per user first (index-only, or the rollups for archived years), then look up the user details
+            if year in archived_years(conn):
+                totals = 'SELECT user_id, total_points, events_attended FROM attendance_rollup_users WHERE event_year = ?'
+            elif year:
+                totals = f'''
+                    SELECT user_id, COALESCE(SUM(points_earned), 0) as total_points, COUNT(*) as events_attended
+                    FROM {attendance_source(conn, year)}
+                    WHERE event_year = ?
+                    GROUP BY user_id
+                '''
+            else:
+                totals = '''
+                    SELECT user_id, SUM(total_points) as total_points, SUM(events_attended) as events_attended
+                    FROM (
+                        SELECT user_id, COALESCE(SUM(points_earned), 0) as total_points, COUNT(*) as events_attended
+                        FROM live_attendance
+                        GROUP BY user_id
+                        UNION ALL
+                        SELECT user_id, total_points, events_attended FROM attendance_rollup_users
+                    )
+                    GROUP BY user_id
+                '''
+            return [dict(row) for row in conn.execute(f'''
+                SELECT 
+                    u.user_id,
+                    u.name,
+                    u.email,
+                    u.id,
+                    t.total_points,
+                    t.events_attended
+                FROM ({totals}) t
+                JOIN live_users u ON u.user_id = t.user_id
+                WHERE t.total_points > 0
+                ORDER BY t.total_points DESC, t.events_attended DESC
+            ''', (year,) if year else ())]
+
+    def list_attendance_years(self):
+        """Years with attendance, current or archived, newest first"""
+        with self.connection() as conn:
+            # Walk the year index from the newest year down instead of scanning all attendance.
+            # Reads the table, not live_attendance, so the index walk stays possible; a year whose
+            # only rows are waiting to be purged can show up for a few seconds.
+            years = {row[0] for row in conn.execute('''
+                WITH RECURSIVE years(event_year) AS (
+                    SELECT MAX(event_year) FROM attendance
+                    UNION ALL
+                    SELECT (SELECT MAX(event_year) FROM attendance WHERE event_year < years.event_year)
+                    FROM years WHERE years.event_year IS NOT NULL
+                )
+                SELECT event_year FROM years WHERE event_year IS NOT NULL AND event_year != ''
+            ''')}
+            return sorted(years | set(archived_years(conn)), reverse=True)
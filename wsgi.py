@@ -0,0 +1,29 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app    # Linux/macOS: worker processes x threads
+    python wsgi.py                           # waitress, one multi-threaded process (any OS, including Windows)
+
+Pool sizes come from the environment: WEB_CONCURRENCY (processes), WEB_THREADS,
+BACKGROUND_WORKERS (email/QR threads per process), PROCESS_POOL_WORKERS
+(processes for photo decoding and large exports).
+"""
+import os
+import sys
+
+from app import create_app, reset_metrics_dir
+
+app = create_app()
+
+if __name__ == '__main__':
+    try:
+        from waitress import serve
+    except ImportError:
+        sys.exit("waitress is not installed (pip install waitress); on Linux you can use: gunicorn -c gunicorn.conf.py wsgi:app")
+    
+    # One process: metrics files left by an earlier run would be added to this one's
+    reset_metrics_dir()
+    # Background jobs are drained by the atexit hook registered in create_app()
+    serve(app,
+          host=os.environ.get('HOST', '0.0.0.0'),
+          port=int(os.environ.get('PORT', 8000)),
+          threads=int(os.environ.get('WEB_THREADS', 8)))